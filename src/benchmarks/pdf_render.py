@@ -0,0 +1,64 @@
+"""
+Benchmark of report PDF rendering (step 6), in pages per second.
+
+Report texts are the extracted texts of the PDFs in ../samples/, so each job has the size of a
+real personal statement. Every text is rendered --repeat times, first one after the other in
+this process (create_formatted_pdf), then as one batch across worker processes (render_pdfs),
+with and without the word width cache of the workers. The batch runs need --workers 2 or more
+(or as many CPUs) to use worker processes at all.
+
+Usage (from src/):
+    python benchmarks/pdf_render.py [--samples ../samples] [--repeat 10] [--workers N]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline_steps.step1_pdf_processor import extract_pages_from_pdf, create_formatted_pdf, render_pdfs
+
+
+def _report(label, pages, seconds):
+    print(f"{label:<34} {pages:>6} pages in {seconds:7.2f}s  {pages / seconds:8.1f} pages/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report PDF rendering.")
+    parser.add_argument("--samples", default="../samples", help="Directory of sample PDFs whose text is rendered")
+    parser.add_argument("--repeat", type=int, default=10, help="Times each sample text is rendered")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for the batch run (defaults to the CPU count)")
+    args = parser.parse_args()
+
+    texts = {}
+    for path in sorted(glob.glob(os.path.join(args.samples, "*.pdf"))):
+        texts[os.path.basename(path)] = "\n\n".join(extract_pages_from_pdf(path))
+    if not texts:
+        sys.exit(f"No sample PDFs found in {args.samples}")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        # First render of each sample, untimed: page counts, and per-process setup out of the way
+        for name, text in texts.items():
+            pages = create_formatted_pdf(text, os.path.join(output_dir, "warmup.pdf"))
+            print(f"{name}: {len(text)} chars, {pages} pages")
+
+        jobs = [(text, os.path.join(output_dir, f"{i}_{name}")) for i in range(args.repeat) for name, text in texts.items()]
+
+        start = time.perf_counter()
+        pages = sum(create_formatted_pdf(text, output_path) for text, output_path in jobs)
+        _report("Sequential, in-process", pages, time.perf_counter() - start)
+
+        workers = args.workers or os.cpu_count()
+        for cache_word_widths in (False, True):
+            start = time.perf_counter()
+            pages = sum(render_pdfs(jobs, max_workers=args.workers, cache_word_widths=cache_word_widths))
+            label = f"Batch, {workers} workers, {'width cache' if cache_word_widths else 'no cache'}"
+            _report(label, pages, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Offline end-to-end benchmark of the pipeline (steps 1-6), for a regression baseline of
+throughput changes.
+
+The LLM and the web search providers are replaced by the deterministic fakes of
+utils/fake_backends.py, with configurable latency and failure rates, so results do not depend
+on the network and need no API keys. Workloads are the PDFs in ../samples/ and synthetic
+statements with a growing number of claims (--claims). Each document runs once, from a cold
+cache, in a temporary working directory. Reported per workload: documents per minute, p50/p95
+wall time of each step (from the run metrics, see utils/metrics.py) and the peak RSS of the
+benchmark so far. A final row measures web searches over the extracted claims.
+
+Default latencies are scaled down so that a run takes a minute or two; pass e.g.
+--llm-latency 1 --tokens-per-second 60 for production-like timings. The rate limiter of
+utils/rate_limiter.py is off unless --rate-limit is given (its limits are then read from the
+environment as usual), since the default limits would dominate the scaled-down timings.
+
+Usage (from src/):
+    python benchmarks/pipeline.py [--claims 10,40,160] [--docs 2] [--concurrency 2] [--stream]
+        [--llm-latency 0.2] [--tokens-per-second 1000] [--failure-rate 0.02] [--rate-limit] [--json results.json]
+"""
+
+import os
+import sys
+import glob
+import json
+import math
+import time
+import random
+import argparse
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.fake_backends import FakeAnthropicClient, FakeBackendConfig, FakeSearchServer
+from utils.llm_client import set_client
+
+STEPS = ["step1_extract_raw_text", "step2_extract_claims", "step3_evidence", "step4_validate", "step5_report", "step6_pdf"]
+SENTENCES_PER_CLAIM = 3 # The fake claim extractor picks about one sentence in three
+SENTENCES_PER_PARAGRAPH = 5
+
+FIELDS = ["machine learning", "battery chemistry", "medical imaging", "grid storage", "semiconductor design", "crop genetics"]
+SECTORS = ["energy", "health care", "manufacturing", "agriculture", "transportation", "defense"]
+
+
+def synthetic_statement(num_claims: int, seed: int) -> str:
+    """Return a personal statement of about num_claims claims; the seed varies its wording."""
+    rng = random.Random(seed * 100003 + num_claims)
+    sentences = []
+    for i in range(num_claims * SENTENCES_PER_CLAIM):
+        field, sector = rng.choice(FIELDS), rng.choice(SECTORS)
+        sentences.append(rng.choice([
+            f"I completed research number {i} in {field} at University {rng.randint(1, 500)}, publishing {rng.randint(2, 40)} peer-reviewed papers.",
+            f"My work on {field} has a national impact on the U.S. {sector} industry, reducing costs by {rng.randint(5, 60)} percent.",
+            f"In {rng.randint(2005, 2024)}, our team of {rng.randint(3, 30)} engineers deployed system {i} for {field} in {sector}.",
+            f"The economic value of project {i} in {field} was estimated at {rng.randint(1, 900)} million dollars for public {sector} programs.",
+        ]))
+    return "\n\n".join(
+        " ".join(sentences[i:i + SENTENCES_PER_PARAGRAPH]) for i in range(0, len(sentences), SENTENCES_PER_PARAGRAPH)
+    )
+
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile of values (0 < p <= 100); 0 if there are none."""
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)] if values else 0.0
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS); worker processes of step 1 count separately
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def _latest_metrics(output_dir: str):
+    paths = sorted(glob.glob(os.path.join(output_dir, "metrics_*.json")))
+    if not paths:
+        return None
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+
+def run_workload(name, pdf_paths, concurrency, stream):
+    """Run every PDF through the pipeline, concurrency documents at a time, and summarize the run."""
+    import main
+    from utils.state_store import get_state_store
+
+    def run_one(path):
+        try:
+            return main.process_personal_statement(path, stream=stream)[0]
+        except Exception as e:
+            print(f"{os.path.basename(path)} failed: {type(e).__name__}: {e}")
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        succeeded = list(executor.map(run_one, pdf_paths))
+    seconds = time.perf_counter() - start
+
+    step_seconds = {step: [] for step in STEPS}
+    claims, retries = [], 0
+    for path in pdf_paths:
+        output_dir = main.get_output_dir(path)
+        metrics = _latest_metrics(output_dir)
+        if metrics is not None:
+            retries += metrics["totals"]["retries"]
+            for step, totals in metrics["steps"].items():
+                if step in step_seconds and "wall_seconds" in totals:
+                    step_seconds[step].append(totals["wall_seconds"])
+        step2_state = get_state_store().load(output_dir, "step2_v2_extract_claims")
+        if step2_state is not None:
+            claims.append(len(step2_state["claims"]))
+
+    return {
+        "workload": name,
+        "docs": len(pdf_paths),
+        "failed": succeeded.count(False),
+        "claims_per_doc": round(sum(claims) / len(claims), 1) if claims else 0,
+        "seconds": round(seconds, 3),
+        "docs_per_minute": round(len(pdf_paths) / seconds * 60, 2),
+        "retries": retries,
+        "steps": {
+            step: {"p50": round(percentile(values, 50), 3), "p95": round(percentile(values, 95), 3)}
+            for step, values in step_seconds.items()
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_search_benchmark(pdf_paths, concurrency, max_queries):
+    """Search the web (fake providers) for the importance claims of the processed documents."""
+    import main
+    from utils.state_store import get_state_store
+    from utils.schema import decode_claims
+    from pipeline_steps.step3_evidence_gather import search_web
+
+    queries = []
+    for path in pdf_paths:
+        state = get_state_store().load(main.get_output_dir(path), "step2_v2_extract_claims")
+        if state is not None:
+            queries += [claim.text for claim in decode_claims(state["claims"]) if claim.claim_type == "importance"]
+    queries = queries[:max_queries]
+
+    def timed_search(query):
+        start = time.perf_counter()
+        search_web(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed_search, queries))
+    seconds = time.perf_counter() - start
+    return {
+        "queries": len(queries),
+        "seconds": round(seconds, 3),
+        "queries_per_second": round(len(queries) / seconds, 2) if seconds else 0,
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+    }
+
+
+def print_results(results, search):
+    header = f"{'workload':<14}{'docs':>5}{'fail':>5}{'claims':>7}{'docs/min':>10}{'retries':>8}"
+    header += "".join(f"{step.split('_')[0] + ' p50/p95':>18}" for step in STEPS) + f"{'peak RSS':>11}"
+    print(header)
+    for result in results:
+        row = f"{result['workload']:<14}{result['docs']:>5}{result['failed']:>5}{result['claims_per_doc']:>7}"
+        row += f"{result['docs_per_minute']:>10.2f}{result['retries']:>8}"
+        row += "".join(f"{result['steps'][step]['p50']:>10.2f}/{result['steps'][step]['p95']:<7.2f}" for step in STEPS)
+        print(row + f"{result['peak_rss_mb']:>8.0f} MB")
+    if search is not None:
+        print(f"Search: {search['queries']} queries in {search['seconds']:.2f}s, {search['queries_per_second']:.1f} queries/s, "
+              f"p50 {search['p50']:.3f}s, p95 {search['p95']:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline, with fake LLM and search backends.")
+    parser.add_argument("--samples", default="../samples", help="Directory of sample PDFs to include as a workload ('' to skip)")
+    parser.add_argument("--claims", default="10,40,160", help="Comma-separated claim counts of the synthetic statements ('' to skip)")
+    parser.add_argument("--docs", type=int, default=2, help="Synthetic statements per claim count")
+    parser.add_argument("--concurrency", type=int, default=2, help="Documents processed at the same time")
+    parser.add_argument("--stream", action="store_true", help="Run the pipeline in streaming mode, see main.py --stream")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mean seconds to the first token of an LLM call")
+    parser.add_argument("--tokens-per-second", type=float, default=1000, help="LLM generation speed")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Mean seconds of a search provider call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability that an LLM or search attempt fails")
+    parser.add_argument("--rate-limit", action="store_true", help="Send calls through the rate limiter, see utils/rate_limiter.py")
+    parser.add_argument("--search-queries", type=int, default=100, help="Maximum queries of the search benchmark (0 to skip)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fake backends and synthetic statements")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    samples = sorted(os.path.abspath(path) for path in glob.glob(os.path.join(args.samples, "*.pdf"))) if args.samples else []
+    claim_counts = [int(count) for count in args.claims.split(",") if count.strip()]
+    json_path = os.path.abspath(args.json) if args.json else None
+    policy_corpus = os.path.abspath(os.getenv("POLICY_CORPUS_DIR", "../policy_corpus"))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Outputs, states and caches go to ../output/ relative to the working directory, i.e. into work_dir
+        os.makedirs(os.path.join(work_dir, "src"))
+        os.chdir(os.path.join(work_dir, "src"))
+        os.environ["POLICY_CORPUS_DIR"] = policy_corpus
+        if not args.rate_limit:
+            os.environ["RATE_LIMIT_DISABLED"] = "1"
+
+        search_server = FakeSearchServer(FakeBackendConfig(
+            latency_seconds=args.search_latency, failure_rate=args.failure_rate, seed=args.seed)).start()
+        search_server.configure_environment()
+        set_client(FakeAnthropicClient(FakeBackendConfig(
+            latency_seconds=args.llm_latency, tokens_per_second=args.tokens_per_second,
+            failure_rate=args.failure_rate, seed=args.seed)))
+
+        from pipeline_steps.step1_pdf_processor import create_formatted_pdf
+
+        workloads = [("samples", samples)] if samples else []
+        os.makedirs("../input")
+        for count in claim_counts:
+            paths = []
+            for i in range(args.docs):
+                paths.append(os.path.abspath(f"../input/synthetic-{count}-{i}.pdf"))
+                create_formatted_pdf(synthetic_statement(count, args.seed * 1000 + i), paths[-1])
+            workloads.append((f"claims-{count}", paths))
+
+        results = []
+        for name, paths in workloads:
+            print(f"Running workload {name}: {len(paths)} documents")
+            results.append(run_workload(name, paths, args.concurrency, args.stream))
+        all_paths = [path for _, paths in workloads for path in paths]
+        search = run_search_benchmark(all_paths, args.concurrency * 4, args.search_queries) if args.search_queries else None
+        search_server.stop()
+
+    print_results(results, search)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"args": vars(args), "workloads": results, "search": search}, f, indent=2)
+        print(f"Results saved to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,182 +1,572 @@
 import os
 import sys
+import glob
+import time
+import argparse
+import queue
+import traceback
+import multiprocessing.util
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-from pipeline_steps.step1_pdf_processor import extract_text_from_pdf, create_formatted_pdf
-from pipeline_steps.step2_extract_claims import extract_claims_combined
-from pipeline_steps.step3_evidence_gather import gather_evidence_all_claims
+from pipeline_steps.step1_pdf_processor import extract_pages_from_pdf, create_formatted_pdf, render_pdfs, IncrementalPdfWriter
+from pipeline_steps.step2_extract_claims import extract_claims_combined, extract_claims_streaming, build_claims_requests
+from pipeline_steps.step3_evidence_gather import gather_evidence_all_claims, gather_evidence_streaming, build_priority_requests
+from pipeline_steps.step3b_evidence_dedup import dedup_evidence_collection
 from pipeline_steps.step4_evidence_validator import validate_and_rank_evidence
-from pipeline_steps.step5_report_generator import generate_evidence_report
+from pipeline_steps.step5_report_generator import generate_evidence_report, pending_report_requests, stream_evidence_report
+from pipeline_steps import step1_pdf_processor, step2_extract_claims, step3_evidence_gather, step3b_evidence_dedup, step4_evidence_validator, step5_report_generator
+from utils.checkpoints import CHECKPOINT_KEY, hash_file, hash_value, load_checkpoint, module_version, step_fingerprint
+from utils.llm_cache import is_cached, llm_cache_stats, request_cache_key, store_response
+from utils.llm_client import close_client
+from utils.message_batches import run_message_batches
+from utils.metrics import enter_step, mark_resumed, propagate, run_metrics
+from utils.policy_index import get_policy_index
+from utils.schema import decode_claims, decode_evidence
+from utils.state_store import document_name, get_state_store
 
 import json
 
 # Load API keys from .env file
 from dotenv import load_dotenv
 
-def process_personal_statement(input_pdf_path, continue_from=None, checkpoint_dir=None):
+def extract_claims_and_gather_evidence(raw_text, pages=None):
+    """
+    Run steps 2 and 3 overlapped: claims are parsed from the streamed step 2 response and
+    queued to step 3 workers as soon as each one is complete.
+    
+    Args:
+        raw_text (str): Statement text from step 1
+        pages (list): Text of each page from step 1
+        
+    Returns:
+        tuple: (claims, evidence) where evidence[i] is the evidence list for claims[i]
+    """
+    claim_queue = queue.Queue()
+
+    def produce_claims():
+        try:
+            return extract_claims_streaming(raw_text, pages, on_claim=claim_queue.put)
+        finally:
+            claim_queue.put(None) # Let step 3 finish even if step 2 fails
+
+    with ThreadPoolExecutor(max_workers=1) as producer:
+        claims_future = producer.submit(propagate(produce_claims))
+        evidence_by_claim = gather_evidence_streaming(claim_queue)
+        claims = claims_future.result()
+
+    # Claims that were merged into a different form after streaming are processed now
+    evidence = [evidence_by_claim.get((claim.claim_type, claim.text)) for claim in claims]
+    missing = [i for i, ev in enumerate(evidence) if ev is None]
+    if missing:
+        for i, ev in zip(missing, gather_evidence_all_claims([claims[i] for i in missing])):
+            evidence[i] = ev
+    return claims, evidence
+
+def _step1_fingerprint(input_pdf_path):
+    return step_fingerprint(
+        inputs={"pdf": hash_file(input_pdf_path)},
+        version=module_version(step1_pdf_processor),
+    )
+
+def _step2_fingerprint(step1_state):
+    return step_fingerprint(
+        inputs={"step1": hash_value(step1_state)},
+        version=module_version(step2_extract_claims),
+        config={"model": step2_extract_claims.CLAIM_EXTRACTION_MODEL},
+    )
+
+def _step3_fingerprint(step2_state):
+    return step_fingerprint(
+        inputs={"step2": hash_value(step2_state)},
+        version=module_version(step3_evidence_gather),
+        config={
+            "priority_analysis_model": step3_evidence_gather.PRIORITY_ANALYSIS_MODEL,
+            "expert_validation_model": step3_evidence_gather.EXPERT_VALIDATION_MODEL,
+            "dedup": module_version(step3b_evidence_dedup),
+            "policy_corpus": get_policy_index().fingerprint,
+        },
+    )
+
+def _step4_fingerprint(step3_state):
+    return step_fingerprint(
+        inputs={"step3": hash_value(step3_state)},
+        version=module_version(step4_evidence_validator),
+        config={
+            "top_k_per_category": step4_evidence_validator.TOP_K_PER_CATEGORY,
+            "minimum_evidence_score": step4_evidence_validator.MINIMUM_EVIDENCE_SCORE,
+        },
+    )
+
+def _step5_fingerprint(step2_state, step4_state):
+    return step_fingerprint(
+        inputs={"step2": hash_value(step2_state), "step4": hash_value(step4_state)},
+        version=module_version(step5_report_generator),
+        config={
+            "model": step5_report_generator.REPORT_MODEL,
+            "summary_model": step5_report_generator.SUMMARY_MODEL,
+        },
+    )
+
+def _step6_fingerprint(step5_state):
+    return step_fingerprint(
+        inputs={"step5": hash_value(step5_state)},
+        version=module_version(step1_pdf_processor),
+    )
+
+def get_output_dir(input_pdf_path):
+    """Return the ../output/<name>/ directory holding a statement's state files."""
+    filename_no_ext = input_pdf_path.split("/")[-1].split(".")[0]
+    return os.path.join("../output/", filename_no_ext)
+
+def process_personal_statement(input_pdf_path, continue_from=None, checkpoint_dir=None, stream=False, stop_after=None):
     """
     Process a single personal statement PDF through the evidence gathering pipeline.
     Each step is handled by a separate module and saves its state to the output directory.
     State is saved after each step to allow for debugging and rerunning from checkpoints.
+    A checkpoint is reused only if the step's inputs, code/prompt version and config are
+    unchanged (see utils/checkpoints.py); otherwise the step and everything after it reruns.
     
     Args:
         input_pdf_path (str): Path to the input personal statement PDF
+        stream (bool): Overlap steps 2 and 3 by streaming claims into evidence gathering, and
+            stream the report of step 5 into the PDF of step 6 paragraph by paragraph
+        stop_after (int): If set, return once this step number is done
         
     Returns:
         tuple: (success: bool, output_dir: str, error_message: str or None)
     """
     # Create output directory 
-    filename_no_ext = input_pdf_path.split("/")[-1].split(".")[0]
-    output_dir = os.path.join("../output/", filename_no_ext)
+    output_dir = get_output_dir(input_pdf_path)
     os.makedirs(output_dir, exist_ok=True)
 
+    # Time, tokens, cost and cache hits of the run are written to metrics_<timestamp>[_until_step<N>].json, see utils/metrics.py
+    with run_metrics(document_name(output_dir), output_dir, suffix=f"until_step{stop_after}" if stop_after else ""):
+        return _run_steps(input_pdf_path, output_dir, stream, stop_after)
+
+def _run_steps(input_pdf_path, output_dir, stream, stop_after):
+    """Run the steps of process_personal_statement for a statement, resuming from its checkpoints."""
     # Step 1: Extract text from PDF
-    if not os.path.exists(os.path.join(output_dir, "step1_raw_text_state.json")):
-        raw_text = extract_text_from_pdf(input_pdf_path)
-        step1_state = {"raw_text": raw_text}
-        save_state(step1_state, output_dir, "step1_extract_raw_text")
+    enter_step("step1_extract_raw_text")
+    step1_fingerprint = _step1_fingerprint(input_pdf_path)
+    step1_state = load_checkpoint(output_dir, "step1_extract_raw_text", step1_fingerprint)
+    if step1_state is None:
+        try:
+            pages = extract_pages_from_pdf(input_pdf_path)
+        except Exception as e:
+            print(f"Error extracting text from PDF: {str(e)}")
+            pages = []
+        raw_text = "".join(pages)
+        step1_state = {"raw_text": raw_text, "pages": pages}
+        save_state(step1_state, output_dir, "step1_extract_raw_text", step1_fingerprint)
         print(f"Saving state for step 1: {output_dir}")
-        if not raw_text:
-            raise Exception("Failed to extract text from PDF")
     else:
         print(f"Resuming from step 1: {output_dir}")
-        with open(os.path.join(output_dir, "step1_raw_text_state.json"), "r") as f:
-            step1_state = json.load(f)
-            raw_text = step1_state["raw_text"]
+        mark_resumed()
+        raw_text = step1_state["raw_text"]
+        pages = step1_state.get("pages")
+    if not raw_text:
+        raise Exception("Failed to extract text from PDF")
+    if stop_after == 1:
+        return True, output_dir, None
 
     # Step 2: Analyze text and extract claims
-    if not os.path.exists(os.path.join(output_dir, "step2_v2_extract_claims_state.json")):
-        claims = extract_claims_combined(raw_text)
+    enter_step("step2_extract_claims")
+    step2_fingerprint = _step2_fingerprint(step1_state)
+    step2_state = load_checkpoint(output_dir, "step2_v2_extract_claims", step2_fingerprint)
+    streamed_evidence = None
+    if step2_state is None:
+        if stream:
+            claims, streamed_evidence = extract_claims_and_gather_evidence(raw_text, pages)
+        else:
+            claims = extract_claims_combined(raw_text, pages)
         step2_state = {"claims": claims}
-        save_state(step2_state, output_dir, "step2_v2_extract_claims")
+        save_state(step2_state, output_dir, "step2_v2_extract_claims", step2_fingerprint)
         print(f"Saving state for step 2: {output_dir}")
-        if not claims:
-            raise Exception("No claims identified in text")
     else:
         print(f"Resuming from step 2: {output_dir}")
-        with open(os.path.join(output_dir, "step2_v2_extract_claims_state.json"), "r") as f:
-            step2_state = json.load(f)
-            claims = step2_state["claims"]
+        mark_resumed()
+        claims = decode_claims(step2_state["claims"])
+    if not claims:
+        raise Exception("No claims identified in text")
+    if stop_after == 2:
+        return True, output_dir, None
 
     # Step 3: Gather evidence for claims
-    if not os.path.exists(os.path.join(output_dir, "step3_evidence_state.json")):
-        evidence = gather_evidence_all_claims(claims)
+    enter_step("step3_evidence")
+    step3_fingerprint = _step3_fingerprint(step2_state)
+    step3_state = load_checkpoint(output_dir, "step3_evidence", step3_fingerprint)
+    if step3_state is None:
+        evidence = streamed_evidence if streamed_evidence is not None else gather_evidence_all_claims(claims)
+        # Step 3b: Drop near-duplicate evidence so steps 4 and 5 only pay for unique evidence
+        evidence = dedup_evidence_collection(evidence)
         step3_state = {"evidence": evidence}
-
-        # Save raw state to txt for debugging
-        with open(os.path.join(output_dir, "step3_evidence_debug.txt"), "w") as f:
-            f.write(str(evidence))
-
-        # Try to identify non-serializable objects
-        def check_serializable(obj):
-            try:
-                json.dumps(obj)
-                return True
-            except TypeError as e:
-                return False
-
-        # Convert evidence to serializable format
-        serializable_evidence = []
-        for ev in evidence:
-            if isinstance(ev, dict):
-                clean_ev = {}
-                for k,v in ev.items():
-                    if check_serializable(v):
-                        clean_ev[k] = v
-                    else:
-                        clean_ev[k] = str(v)  # Convert non-serializable objects to strings # TODO: Implement better serialization (quote problem?)
-                serializable_evidence.append(clean_ev)
-            else:
-                serializable_evidence.append(str(ev))
-
-        step3_state = {"evidence": serializable_evidence}
-
-        
-        save_state(step3_state, output_dir, "step3_evidence")
+        save_state(step3_state, output_dir, "step3_evidence", step3_fingerprint)
         print(f"Saving state for step 3: {output_dir}")
-        if not evidence:
-            raise Exception("No evidence found for claims")
     else:
         print(f"Resuming from step 3: {output_dir}")
-        with open(os.path.join(output_dir, "step3_evidence_state.json"), "r") as f:
-            step3_state = json.load(f)
-            evidence = step3_state["evidence"]
-
-    # TODO: Implement once there is significant (10s, 100s) of evidence to rerank. For now, keep all evidence and use in context to generate report (emphasize synthesis in prompt).
-    # # Step 4: Validate and rank evidence
-    # if not os.path.exists(os.path.join(output_dir, "step4_validate_state.json")):
-    #     validated_evidence = validate_and_rank_evidence(evidence)
-    #     step4_state = {"validated_evidence": validated_evidence}
-    #     save_state(step4_state, output_dir, "step4_validate")
-    #     if not validated_evidence:
-    #         raise Exception("No validated evidence found")
-    # else:
-    #     print(f"Resuming from step 4: {output_dir}")
-    #     with open(os.path.join(output_dir, "step4_validate_state.json"), "r") as f:
-    #         step4_state = json.load(f)
-    #         validated_evidence = step4_state["validated_evidence"]
-    validated_evidence = evidence
+        mark_resumed()
+        evidence = decode_evidence(step3_state["evidence"])
+    if not evidence:
+        raise Exception("No evidence found for claims")
+    if stop_after == 3:
+        return True, output_dir, None
+
+    # Step 4: Validate and rank evidence (bounded top-k per claim and category)
+    enter_step("step4_validate")
+    step4_fingerprint = _step4_fingerprint(step3_state)
+    step4_state = load_checkpoint(output_dir, "step4_validate", step4_fingerprint)
+    if step4_state is None:
+        validated_evidence = validate_and_rank_evidence(evidence)
+        step4_state = {"validated_evidence": validated_evidence}
+        save_state(step4_state, output_dir, "step4_validate", step4_fingerprint)
+        print(f"Saving state for step 4: {output_dir}")
+    else:
+        print(f"Resuming from step 4: {output_dir}")
+        mark_resumed()
+        validated_evidence = decode_evidence(step4_state["validated_evidence"])
+    if stop_after == 4:
+        return True, output_dir, None
 
     # Step 5: Generate report text
-    if not os.path.exists(os.path.join(output_dir, "step5_report_state.json")):
-        report_text = generate_evidence_report(claims, validated_evidence)
+    enter_step("step5_report")
+    output_pdf = os.path.join(output_dir, "final_report.pdf")
+    pdf_written = False
+    step5_fingerprint = _step5_fingerprint(step2_state, step4_state)
+    step5_state = load_checkpoint(output_dir, "step5_report", step5_fingerprint)
+    # A streamed report that was interrupted leaves a partial state, which is continued rather than redone
+    partial_report = step5_state["report_text"] if step5_state is not None and not step5_state.get("complete", True) else None
+    if partial_report is not None and not (stream and stop_after is None):
+        step5_state = None
+    if step5_state is None or partial_report is not None:
+        if stream and stop_after is None:
+            if partial_report:
+                print(f"Continuing partial report of step 5: {output_dir}")
+            # Paragraphs are rendered into the PDF (step 6) as they arrive; the .partial file is deleted if streaming fails
+            with IncrementalPdfWriter(output_pdf + ".partial") as writer:
+                def on_paragraph(paragraph, report_so_far):
+                    writer.add_paragraph(paragraph)
+                    save_state({"report_text": report_so_far, "complete": False}, output_dir, "step5_report", step5_fingerprint)
+
+                report_text = stream_evidence_report(claims, validated_evidence, on_paragraph, resume_text=partial_report or "")
+            os.replace(output_pdf + ".partial", output_pdf)
+            pdf_written = True
+        else:
+            report_text = generate_evidence_report(claims, validated_evidence)
         step5_state = {"report_text": report_text}
-        save_state(step5_state, output_dir, "step5_report")
+        save_state(step5_state, output_dir, "step5_report", step5_fingerprint)
         print(f"Saving state for step 5: {output_dir}")
-        if not report_text:
-            raise Exception("Failed to generate report text")
     else:
         print(f"Resuming from step 5: {output_dir}")
-        with open(os.path.join(output_dir, "step5_report_state.json"), "r") as f:
-            step5_state = json.load(f)
-            report_text = step5_state["report_text"]
+        mark_resumed()
+        report_text = step5_state["report_text"]
+    if not report_text:
+        raise Exception("Failed to generate report text")
+    if stop_after == 5:
+        return True, output_dir, None
     
     # Step 6: Create final PDF  
-    if not os.path.exists(os.path.join(output_dir, "step6_pdf_state.json")):
-        create_formatted_pdf(report_text, os.path.join(output_dir, "final_report.pdf"))
-        output_pdf = os.path.join(output_dir, "final_report.pdf")
-        print(f"Saving state for step 6: {output_dir}")
-        if not output_pdf:
+    enter_step("step6_pdf")
+    step6_fingerprint = _step6_fingerprint(step5_state)
+    step6_state = load_checkpoint(output_dir, "step6_pdf", step6_fingerprint)
+    if pdf_written or step6_state is None or not os.path.exists(output_pdf):
+        if not pdf_written:
+            create_formatted_pdf(report_text, output_pdf)
+        if not os.path.exists(output_pdf):
             raise Exception("Failed to create final PDF")
+        save_state({"output_pdf": output_pdf}, output_dir, "step6_pdf", step6_fingerprint)
+        print(f"Saving state for step 6: {output_dir}")
     else:
         print(f"Resuming from step 6: {output_dir}")
-        # Just check that the PDF exists since we don't need to process it further
-        output_pdf = os.path.join(output_dir, "final_report.pdf")
-        if not os.path.exists(output_pdf):
-            raise Exception("Final PDF not found")
+        mark_resumed()
 
     print(f"Processing complete. All outputs saved to {output_dir}")
     print(f"Final report saved as {output_pdf}")
+    cache_stats = llm_cache_stats()
+    print(f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
     return True, output_dir, None
 
-def save_state(state_dict, output_dir, step_name):
+def save_state(state_dict, output_dir, step_name, fingerprint=None):
     """
-    Save the state of a pipeline step to JSON for debugging and rerunning.
+    Save the state of a pipeline step for debugging and rerunning, in the state store
+    (see utils/state_store.py). Claims, evidence and SDK objects are encoded by utils/schema.py.
     
     Args:
         state_dict (dict): State data to save
-        output_dir (str): Directory to save state file
+        output_dir (str): Output directory of the statement
         step_name (str): Name of the pipeline step
+        fingerprint (dict): Checkpoint fingerprint of the step, see utils/checkpoints.py
     """
-    state_file = os.path.join(output_dir, f"{step_name}_state.json")
-    with open(state_file, 'w') as f:
-        json.dump(state_dict, f, indent=2)
+    if fingerprint is not None:
+        state_dict = {**state_dict, CHECKPOINT_KEY: fingerprint}
+    get_state_store().save(output_dir, step_name, state_dict)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <path_to_personal_statement.pdf>") # TODO: support CLI, ex: [--continue-from <step_name>] [--checkpoint-dir <dir>]
-        sys.exit(1)
+def _init_batch_worker():
+    """
+    Batch worker setup: the shared client (and its connection pool) lives as long as the worker
+    process. Pool workers exit without running atexit hooks, so the client is closed by a
+    multiprocessing exit finalizer instead.
+    """
+    multiprocessing.util.Finalize(None, close_client, exitpriority=10)
+
+def _process_one(input_pdf_path, stream=False):
+    """
+    Batch worker: run the pipeline for one PDF and report the outcome instead of raising,
+    so that a single bad document does not stop the rest of the batch.
+
+    Args:
+        input_pdf_path (str): Path to the input personal statement PDF
+
+    Returns:
+        dict: Per-document result (input, output_dir, success, duration_s, error)
+    """
+    start = time.perf_counter()
+    try:
+        success, output_dir, error = process_personal_statement(input_pdf_path, stream=stream)
+    except Exception as e:
+        success, output_dir, error = False, None, f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    return {
+        "input": input_pdf_path,
+        "output_dir": output_dir,
+        "success": success,
+        "duration_s": round(time.perf_counter() - start, 3),
+        "error": error,
+    }
+
+def collect_batch_inputs(pattern):
+    """
+    Resolve a directory or glob pattern into a sorted list of PDF paths.
+
+    Args:
+        pattern (str): Directory containing PDFs, or a glob such as "../samples/*.pdf"
+
+    Returns:
+        list: Paths of the PDFs to process
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.pdf")
+    return sorted(p for p in glob.glob(pattern) if p.lower().endswith(".pdf"))
+
+def process_batch(input_pdf_paths, max_workers=4, summary_dir="../output/", stream=False):
+    """
+    Process many personal statements on a pool of worker processes.
+    Each document keeps its own ../output/<name>/ directory; a summary of per-document
+    success, failure and duration is written to summary_dir.
+
+    Args:
+        input_pdf_paths (list): Paths of the input PDFs
+        max_workers (int): Number of worker processes
+        summary_dir (str): Directory where the batch summary JSON is written
+        stream (bool): Overlap steps 2 and 3 within each document, see process_personal_statement
+
+    Returns:
+        tuple: (results: list of per-document dicts, summary_path: str)
+    """
+    started_at = datetime.now()
+    batch_start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker) as executor:
+        futures = {executor.submit(_process_one, path, stream): path for path in input_pdf_paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e: # Worker process died (e.g. crashed while parsing the PDF)
+                result = {"input": futures[future], "output_dir": None, "success": False,
+                          "duration_s": None, "error": f"{type(e).__name__}: {e}"}
+            status = "ok" if result["success"] else f"FAILED ({result['error']})"
+            print(f"[batch] {result['input']}: {status}")
+            results.append(result)
+
+    results.sort(key=lambda r: r["input"])
+    summary = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "workers": max_workers,
+        "total": len(results),
+        "succeeded": sum(r["success"] for r in results),
+        "failed": sum(not r["success"] for r in results),
+        "duration_s": round(time.perf_counter() - batch_start, 3),
+        "documents": results,
+    }
+    os.makedirs(summary_dir, exist_ok=True)
+    summary_path = os.path.join(summary_dir, f"batch_summary_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Batch complete: {summary['succeeded']}/{summary['total']} succeeded. Summary saved to {summary_path}")
+    return results, summary_path
+
+def _pending_step_requests(input_pdf_path, step):
+    """
+    Return the LLM requests a document still needs for a step: none if the step's checkpoint
+    is current, otherwise the step's requests that are not already in the LLM cache.
+    Assumes every earlier step has been run (see process_personal_statement's stop_after).
+    """
+    output_dir = get_output_dir(input_pdf_path)
+    step1_state = load_checkpoint(output_dir, "step1_extract_raw_text", _step1_fingerprint(input_pdf_path))
+    if step == 2:
+        if load_checkpoint(output_dir, "step2_v2_extract_claims", _step2_fingerprint(step1_state)) is not None:
+            return []
+        requests = build_claims_requests(step1_state["raw_text"], step1_state.get("pages"))
+    else:
+        step2_state = load_checkpoint(output_dir, "step2_v2_extract_claims", _step2_fingerprint(step1_state))
+        if step == 3:
+            if load_checkpoint(output_dir, "step3_evidence", _step3_fingerprint(step2_state)) is not None:
+                return []
+            requests = build_priority_requests(decode_claims(step2_state["claims"]))
+        else:
+            step3_state = load_checkpoint(output_dir, "step3_evidence", _step3_fingerprint(step2_state))
+            step4_state = load_checkpoint(output_dir, "step4_validate", _step4_fingerprint(step3_state))
+            step5_state = load_checkpoint(output_dir, "step5_report", _step5_fingerprint(step2_state, step4_state))
+            if step5_state is not None and step5_state.get("complete", True):
+                return []
+            requests = pending_report_requests(decode_claims(step2_state["claims"]), decode_evidence(step4_state["validated_evidence"]))
+    return [request for request in requests if not is_cached(request)]
+
+def _render_pending_reports(input_pdf_paths):
+    """
+    Run step 6 for many documents at once: the final PDFs whose checkpoint is not current are
+    rendered together across worker processes (see render_pdfs), and their states saved.
+    Assumes steps 1-5 have been run.
+    """
+    jobs, pending = [], []
+    for path in input_pdf_paths:
+        output_dir = get_output_dir(path)
+        step1_state = load_checkpoint(output_dir, "step1_extract_raw_text", _step1_fingerprint(path))
+        step2_state = load_checkpoint(output_dir, "step2_v2_extract_claims", _step2_fingerprint(step1_state))
+        step3_state = load_checkpoint(output_dir, "step3_evidence", _step3_fingerprint(step2_state))
+        step4_state = load_checkpoint(output_dir, "step4_validate", _step4_fingerprint(step3_state))
+        step5_state = load_checkpoint(output_dir, "step5_report", _step5_fingerprint(step2_state, step4_state))
+        step6_fingerprint = _step6_fingerprint(step5_state)
+        output_pdf = os.path.join(output_dir, "final_report.pdf")
+        if load_checkpoint(output_dir, "step6_pdf", step6_fingerprint) is None or not os.path.exists(output_pdf):
+            jobs.append((step5_state["report_text"], output_pdf))
+            pending.append((output_dir, output_pdf, step6_fingerprint))
+
+    print(f"[bulk] Step 6: {len(jobs)} reports to render")
+    for pages, (output_dir, output_pdf, step6_fingerprint) in zip(render_pdfs(jobs), pending):
+        if pages:
+            save_state({"output_pdf": output_pdf}, output_dir, "step6_pdf", step6_fingerprint)
+
+def process_bulk(input_pdf_paths, poll_interval=60, summary_dir="../output/"):
+    """
+    Process many personal statements with the Message Batches API instead of live LLM calls.
+    For each of steps 2, 3 and 5 in turn, the requests of every document are collected and
+    submitted as message batches (step 5 in rounds, one per level of report synthesis); once
+    they end, the responses are stored in the LLM cache and each document's step runs as usual,
+    served from the cache, writing its state files.
+    Submitted batches are recorded under ../output/.bulk/, so an interrupted run resumes
+    polling them. Steps 1, 4 and 6 run locally, step 6 for all documents at once on a pool
+    of worker processes.
+    
+    Args:
+        input_pdf_paths (list): Paths of the input PDFs
+        poll_interval (float): Seconds between batch status checks
+        summary_dir (str): Directory where the bulk summary JSON is written
         
-    input_pdf = sys.argv[1]
+    Returns:
+        tuple: (results: list of per-document dicts, summary_path: str)
+    """
+    started_at = datetime.now()
+    bulk_start = time.perf_counter()
+    active = list(input_pdf_paths)
+    errors = {}
+
+    def run_documents(stop_after):
+        for path in list(active):
+            try:
+                process_personal_statement(path, stop_after=stop_after)
+            except Exception as e:
+                errors[path] = f"{type(e).__name__}: {e}"
+                active.remove(path)
+                print(f"[bulk] {path}: FAILED ({errors[path]})")
+
+    run_documents(stop_after=1)
+    for step in (2, 3, 5):
+        round_number = 1
+        while True:
+            requests = {}
+            for path in active:
+                for request in _pending_step_requests(path, step):
+                    requests[request_cache_key(request)] = request
+            round_name = f"step{step}" if round_number == 1 else f"step{step}_round{round_number}"
+            print(f"[bulk] Step {step}{f' (round {round_number})' if round_number > 1 else ''}: {len(requests)} requests to submit")
+            manifest_path = os.path.join(summary_dir, ".bulk", f"{round_name}_batches.json")
+            results = run_message_batches(
+                requests, manifest_path, poll_interval,
+                on_result=lambda custom_id, message: store_response(requests[custom_id], message)
+            )
+            # Large reports are synthesized in levels (group summaries, then the report), each level's
+            # requests depending on the previous level's responses
+            if step != 5 or not results:
+                break
+            round_number += 1
+        run_documents(stop_after=4 if step == 3 else step) # Step 4 runs locally right after step 3
+    _render_pending_reports(active)
+    run_documents(stop_after=None)
+
+    results = [{
+        "input": path,
+        "output_dir": get_output_dir(path) if path not in errors else None,
+        "success": path not in errors,
+        "error": errors.get(path),
+    } for path in sorted(input_pdf_paths)]
+    summary = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "mode": "bulk",
+        "total": len(results),
+        "succeeded": sum(r["success"] for r in results),
+        "failed": sum(not r["success"] for r in results),
+        "duration_s": round(time.perf_counter() - bulk_start, 3),
+        "documents": results,
+    }
+    os.makedirs(summary_dir, exist_ok=True)
+    summary_path = os.path.join(summary_dir, f"bulk_summary_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Bulk run complete: {summary['succeeded']}/{summary['total']} succeeded. Summary saved to {summary_path}")
+    return results, summary_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Gather evidence for EB-2 NIW personal statements.") # TODO: support [--continue-from <step_name>] [--checkpoint-dir <dir>]
+    parser.add_argument("input", help="Path to a personal statement PDF, or with --batch a directory or glob of PDFs")
+    parser.add_argument("--batch", action="store_true", help="Process every PDF matched by the input directory or glob")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes in batch mode")
+    parser.add_argument("--bulk", action="store_true", help="Process every PDF matched by the input directory or glob using the Message Batches API")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Seconds between Message Batches status checks in bulk mode")
+    parser.add_argument("--stream", action="store_true", help="Stream claims from step 2 into step 3, and the report of step 5 into the PDF, as they are generated")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response and search caches (fresh results still refresh them)")
+    parser.add_argument("--export-states", action="store_true", help="Also write each step's state as a JSON file in the statement's output directory, for debugging")
+    args = parser.parse_args()
+
+    # Load environment variables from .env file in root directory
+    load_dotenv()
+    if args.no_cache:
+        os.environ["LLM_CACHE_BYPASS"] = "1" # Inherited by batch worker processes
+        os.environ["SEARCH_CACHE_BYPASS"] = "1"
+    if args.export_states:
+        os.environ["STATE_EXPORT_JSON"] = "1"
+
+    if args.batch or args.bulk:
+        input_pdfs = collect_batch_inputs(args.input)
+        if not input_pdfs:
+            print(f"Error: No PDF files found for {args.input}")
+            sys.exit(1)
+        if args.bulk:
+            results, _ = process_bulk(input_pdfs, poll_interval=args.poll_interval)
+        else:
+            results, _ = process_batch(input_pdfs, max_workers=args.workers, stream=args.stream)
+        close_client()
+        sys.exit(0 if all(r["success"] for r in results) else 1)
+
+    input_pdf = args.input
     if not os.path.exists(input_pdf):
         print(f"Error: File {input_pdf} not found")
         sys.exit(1)
 
-    # Load environment variables from .env file in root directory
-    load_dotenv()
-    process_personal_statement(input_pdf)
+    try:
+        process_personal_statement(input_pdf, stream=args.stream)
+    finally:
+        close_client()
 
 if __name__ == "__main__":
     main()
-
-
@@ -5,12 +5,80 @@ Step Final: Create a well-formatted PDF document from input text.
 This file contains the functions to extract text from a PDF file and create a well-formatted PDF document from input text.
 """
 
+import os
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
 import PyPDF2
-from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.platypus import paragraph as reportlab_paragraph
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph
-from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph
+from reportlab.platypus.doctemplate import BaseDocTemplate, PageTemplate
+from reportlab.platypus.frames import Frame
+
+from utils.checkpoints import hash_file
+from utils.disk_cache import DEFAULT_CACHE_DIR, DiskCache
+
+PARALLEL_PAGE_THRESHOLD = 8 # Below this many uncached pages, extraction stays in-process
+PARALLEL_RENDER_THRESHOLD = 4 # Below this many reports, rendering stays in-process
+WORD_WIDTH_CACHE_SIZE = 65536
+PAGE_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "pdf_pages.sqlite")
+
+_page_cache = None
+_report_style = None
+
+def _get_page_cache():
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = DiskCache(PAGE_CACHE_PATH, max_entries=100000)
+    return _page_cache
+
+def _extract_page_texts(pdf_path, page_numbers):
+    """Worker: extract the text of the given pages of one PDF."""
+    pdf_reader = PyPDF2.PdfReader(pdf_path)
+    return [(n, pdf_reader.pages[n].extract_text()) for n in page_numbers]
+
+def extract_pages_from_pdf(pdf_path, max_workers=None) -> List[str]:
+    """
+    Extract the text of each page of a PDF file.
+    Pages are looked up in a persistent cache keyed by file hash and page number, so a
+    re-submitted PDF is not extracted again. Uncached pages are spread over worker
+    processes when there are enough of them to be worth it.
+    
+    Args:
+        pdf_path (str): Path to the input PDF file
+        max_workers (int): Number of worker processes (defaults to the CPU count)
+        
+    Returns:
+        List[str]: Extracted text of each page, in page order
+    """
+    cache = _get_page_cache()
+    pdf_reader = PyPDF2.PdfReader(pdf_path)
+    # The PyPDF2 version is part of the key, since it determines the extracted text
+    file_hash = hash_file(pdf_path)
+    keys = [f"PyPDF2-{PyPDF2.__version__}:{file_hash}:{n}" for n in range(len(pdf_reader.pages))]
+
+    pages = [cache.get(key) for key in keys]
+    missing = [n for n, text in enumerate(pages) if text is None]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(missing) < PARALLEL_PAGE_THRESHOLD or max_workers == 1:
+        extracted = [(n, pdf_reader.pages[n].extract_text()) for n in missing]
+    else:
+        # Contiguous ranges, so each worker parses the page tree once for many pages
+        chunk_size = -(-len(missing) // max_workers)
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            extracted = [item for chunk in executor.map(_extract_page_texts, [pdf_path] * len(chunks), chunks)
+                         for item in chunk]
+
+    for n, text in extracted:
+        pages[n] = text
+        cache.set(keys[n], text)
+    return pages
 
 def extract_text_from_pdf(pdf_path):
     """
@@ -22,32 +90,55 @@ def extract_text_from_pdf(pdf_path):
     Returns:
         str: Extracted text content
     """
-    text = ""
     try:
-        with open(pdf_path, 'rb') as file:
-            # Create PDF reader object
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            # Extract text from each page
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-                
-        return text
+        return "".join(extract_pages_from_pdf(pdf_path))
     except Exception as e:
         print(f"Error extracting text from PDF: {str(e)}")
         return None
 
-def create_formatted_pdf(text, output_path):
+def _init_renderer():
+    """Per-process setup shared by every report rendered: the paragraph style."""
+    global _report_style
+    if _report_style is None:
+        styles = getSampleStyleSheet()
+        _report_style = ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=11,
+            leading=14,
+            spaceBefore=6,
+            spaceAfter=6
+        )
+    return _report_style
+
+def _init_render_worker(cache_word_widths):
     """
-    Create a well-formatted PDF document from input text.
-    
-    Args:
-        text (str): Text content to write to PDF
-        output_path (str): Path where the output PDF should be saved
+    Setup of a render_pdfs worker process. Line breaking measures every word of a paragraph
+    with the font metrics, and reports repeat most of their words, so the worker can memoize
+    the widths. This replaces reportlab's stringWidth for the whole process, which is why it is
+    only done in worker processes that do nothing but render (see benchmarks/pdf_render.py).
     """
-    try:
-        # Create the PDF document
-        doc = SimpleDocTemplate(
+    _init_renderer()
+    if cache_word_widths:
+        reportlab_paragraph.stringWidth = functools.lru_cache(maxsize=WORD_WIDTH_CACHE_SIZE)(pdfmetrics.stringWidth)
+
+class IncrementalPdfWriter:
+    """
+    Writes a report PDF one paragraph at a time, with the same layout as create_formatted_pdf.
+    Each paragraph is laid out (and full pages are emitted) as soon as it is added, instead of
+    building the whole document once all the text is available. Call close() to finish the file,
+    or use the writer as a context manager: the file is finished on normal exit, and discarded
+    (abort()) if the block raises.
+
+    The writer drives the private layout loop of BaseDocTemplate.build (_startBuild,
+    clean_hanging, handle_flowable, _endBuild, canv._doctemplate), as of reportlab 4.3.1
+    (the version pinned in requirements.txt). Check it again when upgrading reportlab.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.closed = False
+        self.doc = BaseDocTemplate(
             output_path,
             pagesize=letter,
             rightMargin=72,
@@ -55,28 +146,101 @@ def create_formatted_pdf(text, output_path):
             topMargin=72,
             bottomMargin=72
         )
+        frame = Frame(self.doc.leftMargin, self.doc.bottomMargin, self.doc.width, self.doc.height, id='normal')
+        self.doc.addPageTemplates([PageTemplate(id='Report', frames=frame, pagesize=letter)])
+        self.style = _init_renderer()
+        # The layout loop of BaseDocTemplate.build, split so flowables can be fed as they arrive
+        self.doc._startBuild()
+        self.doc.canv._doctemplate = self.doc
 
-        # Create styles
-        styles = getSampleStyleSheet()
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=11,
-            leading=14,
-            spaceBefore=6,
-            spaceAfter=6
-        )
+    def add_paragraph(self, text):
+        """Lay out one paragraph of text (newlines become spaces); blank text is skipped."""
+        if not text.strip():
+            return
+        flowables = [Paragraph(text.replace('\n', ' '), self.style)]
+        while flowables:
+            self.doc.clean_hanging()
+            self.doc.handle_flowable(flowables)
+
+    def close(self):
+        """
+        Finish the last page and write the file.
+
+        Returns:
+            int: Number of pages written
+        """
+        self.closed = True
+        del self.doc.canv._doctemplate
+        self.doc._endBuild()
+        return self.doc.page
+
+    def abort(self):
+        """Give up on the document: nothing more is written, and the file is deleted if it exists."""
+        self.closed = True
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+    def __enter__(self):
+        return self
 
-        # Split text into paragraphs and create Paragraph objects
-        content = []
-        paragraphs = text.split('\n\n')
-        for para in paragraphs:
-            if para.strip():
-                p = Paragraph(para.replace('\n', ' '), normal_style)
-                content.append(p)
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        elif not self.closed:
+            self.close()
+        return False
 
-        # Build the PDF
-        doc.build(content)
+def create_formatted_pdf(text, output_path):
+    """
+    Create a well-formatted PDF document from input text.
+    
+    Args:
+        text (str): Text content to write to PDF
+        output_path (str): Path where the output PDF should be saved
+
+    Returns:
+        int: Number of pages written (0 if the PDF could not be created)
+    """
+    try:
+        writer = IncrementalPdfWriter(output_path)
+
+        # Split text into paragraphs and lay each one out
+        for para in text.split('\n\n'):
+            writer.add_paragraph(para)
+
+        return writer.close()
         
     except Exception as e:
         print(f"Error creating PDF: {str(e)}")
+        return 0
+
+def _render_chunk(jobs):
+    """Worker: render a list of (text, output_path) jobs."""
+    return [create_formatted_pdf(text, output_path) for text, output_path in jobs]
+
+def render_pdfs(jobs: List[Tuple[str, str]], max_workers=None, cache_word_widths=True) -> List[int]:
+    """
+    Create the formatted PDFs of many reports, like create_formatted_pdf for each of them.
+    Reports are spread over worker processes when there are enough of them to be worth it;
+    each worker sets up styles and font metrics once and renders many reports with them.
+    
+    Args:
+        jobs (list): (text, output_path) pairs
+        max_workers (int): Number of worker processes (defaults to the CPU count)
+        cache_word_widths (bool): Memoize word widths in the worker processes, see _init_render_worker
+        
+    Returns:
+        List[int]: Number of pages of each PDF, in job order (0 for a PDF that could not be created)
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if len(jobs) < PARALLEL_RENDER_THRESHOLD or max_workers <= 1:
+        return _render_chunk(jobs)
+    # Jobs are dealt round-robin, so long and short reports are spread evenly over the workers
+    chunks = [jobs[i::max_workers] for i in range(max_workers)]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_render_worker,
+                             initargs=(cache_word_widths,)) as executor:
+        rendered = list(executor.map(_render_chunk, chunks))
+    pages = [0] * len(jobs)
+    for i, chunk_pages in enumerate(rendered):
+        pages[i::max_workers] = chunk_pages
+    return pages
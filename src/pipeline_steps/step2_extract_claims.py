@@ -2,11 +2,24 @@
 Step 2: Extract claims from the text.
 """
 # import spacy
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Callable, Tuple
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.llm_cache import cached_create, cached_stream
+from utils.llm_client import get_client
+from utils.metrics import propagate
+from utils.schema import Claim, content_text
+
+CLAIM_EXTRACTION_MODEL = "claude-3-opus-20240229"
+CLAIM_EXTRACTION_MAX_TOKENS = 2000
+CHUNK_MAX_CHARS = 6000 # ~1500 tokens of statement per extraction call
+CHUNK_OVERLAP_CHARS = 600 # Context repeated from the previous chunk, so claims spanning a boundary are seen whole
 
 # TODO: Improve spacy extraction to be more accurate before using it again.
-def extract_claims_spacy(text: str) -> List[Tuple[str, str, str]]:
+def extract_claims_spacy(text: str) -> List[Claim]:
     """
     Extract claims about national importance and substantial merit from the text.
     
@@ -14,10 +27,10 @@ def extract_claims_spacy(text: str) -> List[Tuple[str, str, str]]:
         text (str): Input text from which to extract claims
         
     Returns:
-        List[Tuple[str, str, str]]: List of extracted claims, where each tuple contains:
-            - claim: The actual claim text in original case
-            - type: Either 'merit' or 'importance'
-            - evidence: Supporting text/evidence for the claim in original case
+        List[Claim]: List of extracted claims, with:
+            - claim_type: Either 'merit' or 'importance'
+            - text: The actual claim text in original case
+            - initial_evidence: Supporting text/evidence for the claim in original case
     """
     # Load English language model
     nlp = spacy.load("en_core_web_sm")
@@ -47,37 +60,24 @@ def extract_claims_spacy(text: str) -> List[Tuple[str, str, str]]:
             evidence = next_sent.text if next_sent else ""
             
             # Store original text with original capitalization
-            claims.append((
-                sent.text.strip(),
+            claims.append(Claim(
                 claim_type,
+                sent.text.strip(),
                 evidence.strip()
             ))
     
     return claims
 
-def extract_claims_anthropic(text: str) -> List[Tuple[str, str, str]]:
+def build_claims_request(text: str) -> Dict:
     """
-    Extract claims about national importance and substantial merit using Anthropic's Claude API.
+    Build the messages.create arguments for extracting claims from text.
     
     Args:
         text (str): Input text from which to extract claims
         
     Returns:
-        List[Tuple[str, str, str]]: List of extracted claims, where each tuple contains:
-            - claim: The actual claim text
-            - type: Either 'merit' or 'importance' 
-            - evidence: Supporting text/evidence for the claim
+        Dict: Keyword arguments for client.messages.create
     """
-    try:
-        import anthropic
-    except ImportError:
-        print("anthropic package not installed. Please install with: pip install anthropic")
-        return []
-
-    # Initialize Anthropic client
-    anthropic.api_key = os.getenv("ANTHROPIC_API_KEY")
-    client = anthropic.Anthropic()
-
     prompt_2 = f"""You are an expert at extracting claims from an immigration petition for an EB-2 NIW (National Interest Waiver) visa.
 
     You will be given a text and you will need to extract every claim that is either a:
@@ -102,57 +102,301 @@ def extract_claims_anthropic(text: str) -> List[Tuple[str, str, str]]:
     Only extract claims that are explicitly about the subject's background or their work's national importance.
     Text to analyze: {text}"""
 
-    # Get response from Claude
-    response = client.messages.create(
-        model="claude-3-opus-20240229",
-        max_tokens=1000,
-        temperature=0,
-        system="You are a specialized claim extractor focused on identifying claims about national importance and substantial merit in immigration contexts.",
-        messages=[{"role": "user", "content": prompt_2}]
-    )
+    return {
+        "model": CLAIM_EXTRACTION_MODEL,
+        "max_tokens": CLAIM_EXTRACTION_MAX_TOKENS,
+        "temperature": 0,
+        "system": "You are a specialized claim extractor focused on identifying claims about national importance and substantial merit in immigration contexts.",
+        "messages": [{"role": "user", "content": prompt_2}],
+    }
 
-    # Parse response into claims
-    claims = []
-    current_claim = {}
-    
-    for line in response.content[0].text.split('\n'):
+class ClaimParser:
+    """
+    Incremental parser for the CLAIM TYPE / CLAIM TEXT / EVIDENCE response format.
+    Accepts the response in arbitrary pieces (e.g. streamed text deltas) and returns each
+    claim once its EVIDENCE line is complete.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._current = {}
+
+    def feed(self, text: str) -> List[Claim]:
+        """Consume more response text; return the claims completed by it."""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        return [claim for claim in map(self._parse_line, lines) if claim]
+
+    def close(self) -> List[Claim]:
+        """Flush the end of the response; return the final claim if it is complete."""
+        claim = self._parse_line(self._buffer)
+        self._buffer = ""
+        return [claim] if claim else []
+
+    def _parse_line(self, line: str) -> Optional[Claim]:
         line = line.strip()
         if line.startswith('CLAIM TYPE:'):
-            if current_claim:
-                claims.append((
-                    current_claim['type'],
-                    current_claim['text'],
-                    current_claim['evidence']
-                ))
-            current_claim = {'type': line.split(':')[1].strip().lower()}
+            self._current = {'type': line.partition(':')[2].strip().lower()}
         elif line.startswith('CLAIM TEXT:'):
-            current_claim['text'] = line.split(':')[1].strip()
+            self._current['text'] = line.partition(':')[2].strip()
         elif line.startswith('EVIDENCE:'):
-            current_claim['evidence'] = line.split(':')[1].strip()
+            self._current['evidence'] = line.partition(':')[2].strip()
+            if 'type' in self._current and 'text' in self._current:
+                claim = Claim(self._current['type'], self._current['text'], self._current['evidence'])
+                self._current = {}
+                return claim
+        return None
 
-    # Add final claim if exists
-    if current_claim:
-        claims.append((
-            current_claim['type'],
-            current_claim['text'],
-            current_claim['evidence']
-        ))
+def extract_claims_anthropic(text: str) -> List[Claim]:
+    """
+    Extract claims about national importance and substantial merit using Anthropic's Claude API.
+    
+    Args:
+        text (str): Input text from which to extract claims
+        
+    Returns:
+        List[Claim]: List of extracted claims, with:
+            - claim_type: Either 'background' or 'importance'
+            - text: The actual claim text
+            - initial_evidence: Supporting text/evidence for the claim
+    """
+    # Get response from Claude
+    response = cached_create(get_client(), **build_claims_request(text))
+
+    # Parse response into claims
+    parser = ClaimParser()
+    claims = parser.feed(content_text(response.content))
+    claims.extend(parser.close())
+    return claims
+
+def extract_claims_anthropic_streaming(text: str, on_claim: Callable[[Claim], None]) -> List[Claim]:
+    """
+    Extract claims like extract_claims_anthropic, but stream the response and hand each
+    claim to on_claim as soon as its CLAIM/EVIDENCE block is complete.
+    
+    Args:
+        text (str): Input text from which to extract claims
+        on_claim (Callable): Called with each Claim as it is parsed
+        
+    Returns:
+        List[Claim]: All extracted claims, in response order
+    """
+    parser = ClaimParser()
+    claims = []
+
+    def on_text(delta):
+        for claim in parser.feed(delta):
+            claims.append(claim)
+            on_claim(claim)
 
+    cached_stream(get_client(), on_text, **build_claims_request(text))
+    for claim in parser.close():
+        claims.append(claim)
+        on_claim(claim)
     return claims
 
-def extract_claims_combined(text: str) -> List[Tuple[str, str, str]]:
+def _split_long_text(text: str, max_chars: int) -> List[str]:
+    """Split text longer than max_chars at paragraph, then sentence, then word boundaries."""
+    if len(text) <= max_chars:
+        return [text]
+    for separator in ("\n\n", "\n", ". ", " "):
+        cut = text.rfind(separator, 0, max_chars)
+        if cut > 0:
+            cut += len(separator)
+            return [text[:cut]] + _split_long_text(text[cut:], max_chars)
+    return [text[:max_chars]] + _split_long_text(text[max_chars:], max_chars)
+
+def split_into_chunks(pages: List[str], max_chars: int = CHUNK_MAX_CHARS,
+                      overlap_chars: int = CHUNK_OVERLAP_CHARS) -> List[str]:
+    """
+    Pack pages (or sections) of a statement into overlapping chunks for claim extraction.
+    Whole pages are kept together where possible; each chunk after the first starts with
+    the tail of the previous one.
+    
+    Args:
+        pages (List[str]): Text of each page, in order
+        max_chars (int): Maximum size of a chunk, excluding the overlap
+        overlap_chars (int): How much of the previous chunk is repeated at the start of the next
+        
+    Returns:
+        List[str]: Chunks of text, in document order
+    """
+    pieces = [piece for page in pages if page and page.strip() for piece in _split_long_text(page, max_chars)]
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+
+    for i in range(len(chunks) - 1, 0, -1):
+        overlap = chunks[i - 1][-overlap_chars:]
+        space = overlap.find(" ")
+        chunks[i] = (overlap[space + 1:] if space >= 0 else overlap) + chunks[i]
+    return chunks
+
+def _normalize_claim_text(claim_text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[\"'“”‘’]", "", claim_text or "")).strip().lower()
+
+def _contains_words(longer: str, shorter: str) -> bool:
+    """Whether the words of shorter appear, in order and contiguously, in longer."""
+    longer_words = " ".join(re.findall(r"\w+", longer))
+    shorter_words = " ".join(re.findall(r"\w+", shorter))
+    return bool(shorter_words) and f" {shorter_words} " in f" {longer_words} "
+
+def _find_duplicate(kept: List[Tuple[str, str, int]], normalized: str, claim_type: str, chunk_index: int) -> Optional[int]:
+    """
+    Return the index in kept of the claim that a new claim duplicates, or None.
+    Claims with the same normalized text are duplicates. A claim whose words are contained in
+    another's is only a duplicate if both have the same type and come from adjacent chunks,
+    i.e. one of them was likely cut at the overlap of the two chunks.
+    
+    Args:
+        kept (List[Tuple[str, str, int]]): (normalized text, claim type, chunk index) of the claims kept so far
+        normalized (str): Normalized text of the new claim
+        claim_type (str): Type of the new claim
+        chunk_index (int): Index of the chunk the new claim was extracted from
+    """
+    for i, (seen, seen_type, seen_chunk) in enumerate(kept):
+        if seen == normalized:
+            return i
+        if (seen_type == claim_type and abs(seen_chunk - chunk_index) == 1
+                and (_contains_words(seen, normalized) or _contains_words(normalized, seen))):
+            return i
+    return None
+
+def merge_claims(claim_lists: List[List[Claim]]) -> List[Claim]:
+    """
+    Merge claims extracted from overlapping chunks, keeping document order.
+    Duplicates are found with _find_duplicate; a longer claim that contains a kept one from
+    the adjacent chunk (e.g. the kept one was cut at the chunk boundary) replaces it in place.
+    
+    Args:
+        claim_lists (List[List[Claim]]): Claims of each chunk, in chunk order
+        
+    Returns:
+        List[Claim]: Deduplicated claims
+    """
+    unique_claims = []
+    kept = []
+    for chunk_index, claims in enumerate(claim_lists):
+        for claim in claims:
+            normalized = _normalize_claim_text(claim.text)
+            if not normalized:
+                continue
+            match = _find_duplicate(kept, normalized, claim.claim_type, chunk_index)
+            if match is None:
+                unique_claims.append(claim)
+                kept.append((normalized, claim.claim_type, chunk_index))
+            elif len(normalized) > len(kept[match][0]):
+                unique_claims[match] = claim
+                kept[match] = (normalized, claim.claim_type, chunk_index)
+    return unique_claims
+
+def claim_extraction_chunks(text: str, pages: Optional[List[str]] = None) -> List[str]:
+    """
+    Return the texts claims are extracted from: overlapping chunks of a long statement,
+    or the whole statement if it fits in one chunk.
+    
+    Args:
+        text (str): Full statement text
+        pages (List[str]): Text of each page from step 1, used as chunk boundaries if available
+        
+    Returns:
+        List[str]: Texts to send to extract_claims_anthropic
+    """
+    chunks = split_into_chunks(pages if pages else [text])
+    return chunks if len(chunks) > 1 else [text]
+
+def build_claims_requests(text: str, pages: Optional[List[str]] = None) -> List[Dict]:
+    """Return the messages.create arguments of every request extract_claims_chunked makes."""
+    return [build_claims_request(chunk) for chunk in claim_extraction_chunks(text, pages)]
+
+def extract_claims_chunked(text: str, pages: Optional[List[str]] = None, max_workers: int = 4) -> List[Claim]:
+    """
+    Extract claims from overlapping chunks of the statement concurrently, then merge them.
+    Keeps step 2 latency roughly flat as statements grow, and avoids truncated claim lists
+    from a single long generation.
+    
+    Args:
+        text (str): Full statement text
+        pages (List[str]): Text of each page from step 1, used as chunk boundaries if available
+        max_workers (int): Maximum number of chunks extracted at the same time
+        
+    Returns:
+        List[Claim]: Deduplicated list of claims in document order
+    """
+    chunks = claim_extraction_chunks(text, pages)
+    if len(chunks) <= 1:
+        return extract_claims_anthropic(text)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        claim_lists = list(executor.map(propagate(extract_claims_anthropic), chunks))
+    return merge_claims(claim_lists)
+
+def extract_claims_streaming(text: str, pages: Optional[List[str]] = None,
+                             on_claim: Optional[Callable[[Claim], None]] = None,
+                             max_workers: int = 4) -> List[Claim]:
+    """
+    Streaming variant of extract_claims_chunked: chunks are extracted concurrently with
+    streamed responses, and each new claim is handed to on_claim as soon as it is parsed,
+    so step 3 can start before step 2 has finished. Duplicates of claims already handed
+    over are not passed on again, unless they are longer forms that the final merge keeps.
+    
+    Args:
+        text (str): Full statement text
+        pages (List[str]): Text of each page from step 1, used as chunk boundaries if available
+        on_claim (Callable): Called with each new Claim, from worker threads
+        max_workers (int): Maximum number of chunks extracted at the same time
+        
+    Returns:
+        List[Claim]: Deduplicated list of claims in document order, as from extract_claims_chunked
+    """
+    chunks = claim_extraction_chunks(text, pages)
+
+    lock = threading.Lock()
+    emitted = []
+
+    def emit_if_new(claim, chunk_index):
+        normalized = _normalize_claim_text(claim.text)
+        with lock:
+            if not normalized:
+                return
+            match = _find_duplicate(emitted, normalized, claim.claim_type, chunk_index)
+            if match is None:
+                emitted.append((normalized, claim.claim_type, chunk_index))
+            elif len(normalized) > len(emitted[match][0]):
+                emitted[match] = (normalized, claim.claim_type, chunk_index)
+            else:
+                return
+        if on_claim:
+            on_claim(claim)
+
+    def extract_chunk(chunk_index, chunk):
+        return extract_claims_anthropic_streaming(chunk, lambda claim: emit_if_new(claim, chunk_index))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        claim_lists = list(executor.map(propagate(extract_chunk), range(len(chunks)), chunks))
+    return claim_lists[0] if len(claim_lists) == 1 else merge_claims(claim_lists)
+
+def extract_claims_combined(text: str, pages: Optional[List[str]] = None) -> List[Claim]:
     """
     Combine claims extracted from multiple methods for more comprehensive results.
     
     Args:
         text (str): Input text from which to extract claims
+        pages (List[str]): Text of each page from step 1, used to chunk long statements
         
     Returns:
-        List[Tuple[str, str, str]]: Combined and deduplicated list of claims
+        List[Claim]: Combined and deduplicated list of claims
     """
     # Get claims from both methods
     # spacy_claims = extract_claims_spacy(text)
-    anthropic_claims = extract_claims_anthropic(text) # If another method is added, optimize token cost by not passing text already marked as a claim
+    anthropic_claims = extract_claims_chunked(text, pages) # If another method is added, optimize token cost by not passing text already marked as a claim
     
     # # Combine claims, removing duplicates
     # all_claims = spacy_claims + anthropic_claims
@@ -2,15 +2,50 @@
 Step 3: Gather evidence for each claim.
 """
 
-import requests
 from typing import List, Tuple, Dict
 import os
-from serpapi import GoogleSearch
+import re
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 from semanticscholar import SemanticScholar
 from scholarly import scholarly # Google Scholar API
 
-import anthropic
+from utils.llm_cache import cached_create
+from utils.llm_client import get_client
+from utils.metrics import labelled, propagate
+from utils.search_dispatcher import SearchDispatcher, SearchProvider, get_session
+from utils.search_cache import cached_search
+from utils.rate_limiter import rate_limited, record_throttle
+from utils.paper_index import get_paper_index, PaperRef
+from utils.policy_index import get_policy_index
+from utils.schema import Claim, Evidence, content_text
+from utils.tokens import pack_by_token_budget
+from pipeline_steps.step3b_evidence_dedup import normalize_url
+from pipeline_steps.step4_evidence_validator import WebEvidenceScorer, MINIMUM_EVIDENCE_SCORE
+
+PRIORITY_ANALYSIS_MODEL = "claude-3-haiku-20240307"
+PRIORITY_BATCH_TOKEN_BUDGET = 2000 # Estimated claim-text tokens per batched priority analysis request
+PRIORITY_BATCH_MAX_CLAIMS = 10
+PRIORITY_BATCH_MAX_TOKENS_PER_CLAIM = 200
+EXPERT_VALIDATION_MODEL = "claude-3-opus-20240229"
+POLICY_TOP_PASSAGES = 4 # Policy passages retrieved per claim for priority analysis
+
+# Web search providers. URLs can be pointed at local stub servers for testing
+PERPLEXITY_SEARCH_URL = os.getenv('PERPLEXITY_SEARCH_URL', 'https://api.perplexity.ai/search')
+YOU_SEARCH_URL = os.getenv('YOU_SEARCH_URL', 'https://api.you.com/search')
+SERP_SEARCH_URL = os.getenv('SERP_SEARCH_URL', 'https://serpapi.com/search.json')
+SEARCH_TIMEOUT_SECONDS = {'perplexity': 15.0, 'you.com': 8.0, 'serp': 8.0} # Per-provider deadline
+SEARCH_TARGET_RESULTS = 5 # Stop searching once this many distinct results score at least MINIMUM_EVIDENCE_SCORE
+
+# Paper references in claims, resolved in bulk through Semantic Scholar's batch endpoint
+DOI_PATTERN = re.compile(r'\b(10\.\d{4,9}/[^\s"\'<>]+)')
+ARXIV_PATTERN = re.compile(r'(?:arxiv:\s*|arxiv\.org/(?:abs|pdf)/)(\d{4}\.\d{4,5})(?:v\d+)?', re.IGNORECASE)
+QUOTED_TITLE_PATTERN = re.compile(r'[“"]([^”"]{20,300})[”"]')
+PAPER_FIELDS = ['paperId', 'externalIds', 'title', 'authors', 'year', 'citationCount', 'influentialCitationCount', 'url']
+PAPER_BATCH_SIZE = 500 # Maximum IDs per Semantic Scholar batch request
+SEMANTIC_SCHOLAR_ATTEMPTS = 3 # Tries of a Semantic Scholar request answered with HTTP 429
+
 # from perplexity import Perplexity # TODO add perplexity API key
 
 # Plan for gathering evidence:
@@ -40,50 +75,32 @@ When a claim mentions advancements in a field or claims to be on the cutting edg
 """
 
 
-# From https://www.state.gov/priorities-and-mission-of-the-second-trump-administrations-department-of-state/
-usa_administration_priorities = """
-Every dollar we spend, every program we fund, and every policy we pursue must be justified with the answer to three simple questions:
-(1) Does it make America safer?  
-(2) Does it make America stronger?  
-(3) Does it make America more prosperous?  
-
-First, we must curb mass migration and secure our borders. The State Department will no longer undertake any activities that facilitate or encourage mass migration.  Our diplomatic relations with other countries, particularly in the Western Hemisphere, will prioritize securing America’s borders, stopping illegal and destabilizing migration, and negotiating the repatriation of illegal immigrants.
-
-Next, we must reward performance and merit, including within the State Department ranks. President Trump issued an executive order eliminating “DEIA” requirements, programs, and offices throughout the government. This order will be faithfully executed and observed in both letter and spirit.
-
-Relatedly, we must return to the basics of diplomacy by eliminating our focus on political and cultural causes that are divisive at home and deeply unpopular abroad. This will allow us to conduct a pragmatic foreign policy in cooperation with other nations to advance our core national interests.
-
-We must stop censorship and suppression of information. The State Department’s efforts to combat malign propaganda have expanded and fundamentally changed since the Cold War era and we must reprioritize truth. The State Department I lead will support and defend Americans’ rights to free speech, terminating any programs that in any way lead to censoring the American people.  While we will combat genuine enemy propaganda, we will do so only with the fundamental truth that America is a great and just country whose people are generous and whose leaders now prioritize Americans’ core interests while respecting the rights and interests of other nations.
-
-Finally, we must leverage our strengths and do away with climate policies that weaken America. While we will not ignore threats to our natural environment and will support sensible environmental protections, the State Department will use diplomacy to help President Trump fulfill his promise for a return to American energy dominance.
-
-In short, President Trump’s forward-looking agenda for our country and foreign relations will guide the State Department’s refocus on American national interests. Amid today’s reemerging great power rivalry, I will empower our talented diplomatic corps to advance our mission to make America safer, stronger, and more prosperous.
-"""
-# TODO also include current executive orders, their influence.
+# Administration priorities, executive orders, agency strategies etc. live in the policy corpus directory
+# (see utils/policy_index.py); each claim is analyzed against the passages most relevant to it
+# TODO also add current executive orders, their influence, to the policy corpus.
 # TODO generate explanation of how this applicant for immigration is aligned with these priorities and extraordinarily talented, emphasizing the benefit to the US of admitting them.
 
-def process_claim_by_type(claim: Tuple[str, str, str]) -> List[Dict]:
+def process_claim_by_type(claim: Claim) -> List[Evidence]:
     """
     Process a claim based on its type (background or importance).
     For background claims, return a placeholder for applicant evidence.
     For importance claims, gather supporting evidence from various sources.
     
     Args:
-        claim_text: The text of the claim
-        claim_type: Type of claim ('background' or 'importance')
+        claim: The claim, with its type ('background' or 'importance')
         
     Returns:
-        List of evidence dictionaries
+        List of evidence items
     """
-    claim_type, claim_text, initial_evidence = claim
+    claim_type, claim_text = claim.claim_type, claim.text
     if claim_type == 'background':
-        return [{
-            'source': 'PLACEHOLDER',
-            'snippet': '[Applicant to provide supporting documentation such as: '
-                      'degrees, certifications, employment records, awards, '
-                      'or other relevant evidence of expertise and experience.]',
-            'relevance': 'Direct background evidence required'
-        }]
+        return [Evidence(
+            source='PLACEHOLDER',
+            snippet='[Applicant to provide supporting documentation such as: '
+                    'degrees, certifications, employment records, awards, '
+                    'or other relevant evidence of expertise and experience.]',
+            relevance='Direct background evidence required'
+        )]
         
     elif claim_type == 'importance':
         evidence = []
@@ -123,65 +140,220 @@ def process_claim_by_type(claim: Tuple[str, str, str]) -> List[Dict]:
         #     evidence.extend(results)
 
         # Get concise analysis of how claim aligns with priorities
-        prompt = f"""Analyze how this claim aligns with U.S. administration priorities. Be extremely concise, 1-2 sentences per relevant priority:
-        Claim: {claim_text}
-        Priorities to check alignment with:
-        {usa_administration_priorities}"""
-
-        # Initialize Anthropic client
-        anthropic.api_key = os.getenv("ANTHROPIC_API_KEY")
-        client = anthropic.Anthropic()
-        response = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=300,
-            temperature=0,
-            system="You are an expert policy analyst. Be extremely concise.",
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        evidence.append({
-            'source': 'U.S. Administration Priorities Analysis',
-            'snippet': response.content,
-            'relevance': 'Direct alignment with administration priorities'
-        })
+        with labelled(claim=claim_text[:80]):
+            response = cached_create(get_client(), **build_priority_request(claim_text))
+        evidence.extend(_priority_analysis_evidence(content_text(response.content)))
 
         return evidence
             
     return []
 
-def gather_evidence_all_claims(claims: List[Tuple[str, str, str]]) -> List[Dict]:
+def _priority_analysis_evidence(analysis: str) -> List[Evidence]:
+    return [Evidence(
+        source='U.S. Administration Priorities Analysis',
+        snippet=analysis,
+        relevance='Direct alignment with administration priorities'
+    )]
+
+def retrieve_priorities(claim_texts: List[str], k: int = POLICY_TOP_PASSAGES) -> str:
+    """
+    Return the policy passages most relevant to the claims, to check their alignment against.
+    
+    Args:
+        claim_texts: Texts of the claims to analyze
+        k: Passages retrieved per claim
+        
+    Returns:
+        The union of each claim's top k passages, in corpus order, labeled with their documents.
+        If no passage shares a term with the claims, the first k passages of the corpus
+    """
+    index = get_policy_index()
+    passages = {passage['id']: passage for text in claim_texts for passage in index.search(text, k)}
+    if not passages:
+        passages = dict(enumerate(index.passages[:k]))
+    return "\n\n".join(f"[{passages[i]['document']}]\n{passages[i]['text']}" for i in sorted(passages))
+
+def build_priority_request(claim_text: str) -> Dict:
+    """
+    Build the messages.create arguments for analyzing how one claim aligns with the priorities.
+    
+    Args:
+        claim_text: The text of the claim
+        
+    Returns:
+        Keyword arguments for client.messages.create
+    """
+    prompt = f"""Analyze how this claim aligns with U.S. administration priorities. Be extremely concise, 1-2 sentences per relevant priority:
+        Claim: {claim_text}
+        Priorities to check alignment with:
+        {retrieve_priorities([claim_text])}"""
+
+    return {
+        "model": PRIORITY_ANALYSIS_MODEL,
+        "max_tokens": 300,
+        "temperature": 0,
+        "system": "You are an expert policy analyst. Be extremely concise.",
+        "messages": [{"role": "user", "content": prompt}],
+    }
+
+def build_priority_batch_request(claim_texts: List[str]) -> Dict:
+    """
+    Build the messages.create arguments for analyzing several claims in one request.
+    The policy passages retrieved for the batch's claims (see retrieve_priorities) go in the
+    system prompt. They differ from batch to batch and are far below the model's minimum
+    cacheable prompt length, so they are not marked for prompt caching.
+    
+    Args:
+        claim_texts: Texts of the claims to analyze
+        
+    Returns:
+        Keyword arguments for client.messages.create
+    """
+    numbered_claims = "\n".join(f"CLAIM {i + 1}: {text}" for i, text in enumerate(claim_texts))
+    prompt = f"""Analyze how each of the following claims aligns with the U.S. administration priorities. Be extremely concise, 1-2 sentences per relevant priority.
+    Answer every claim, in order, starting each answer on a new line with its label, e.g. "CLAIM 1: <analysis>".
+    {numbered_claims}"""
+
+    return {
+        "model": PRIORITY_ANALYSIS_MODEL,
+        "max_tokens": PRIORITY_BATCH_MAX_TOKENS_PER_CLAIM * len(claim_texts),
+        "temperature": 0,
+        "system": [
+            {"type": "text", "text": "You are an expert policy analyst. Be extremely concise."},
+            {
+                "type": "text",
+                "text": f"Priorities to check alignment with:\n{retrieve_priorities(claim_texts)}",
+            },
+        ],
+        "messages": [{"role": "user", "content": prompt}],
+    }
+
+def parse_priority_batch_response(text: str, num_claims: int) -> List[str]:
+    """
+    Split a batched priority analysis into one analysis per claim.
+    
+    Args:
+        text: Response text with "CLAIM <n>: ..." sections
+        num_claims: Number of claims in the request
+        
+    Returns:
+        List of analyses in claim order; None where a claim's answer is missing
+    """
+    analyses = [None] * num_claims
+    sections = re.split(r"^\s*\**CLAIM (\d+)\**:\s*", text, flags=re.MULTILINE)
+    for number, analysis in zip(sections[1::2], sections[2::2]):
+        index = int(number) - 1
+        if 0 <= index < num_claims and analysis.strip():
+            analyses[index] = analysis.strip()
+    return analyses
+
+def analyze_priorities_batch(claim_texts: List[str]) -> List[str]:
+    """
+    Analyze priority alignment for several claims with one request.
+    Claims missing from the batched answer (all of them, if it is empty) are retried one at a time.
+    
+    Args:
+        claim_texts: Texts of the claims to analyze
+        
+    Returns:
+        List of analysis texts, in claim order
+    """
+    response = cached_create(get_client(), **build_priority_batch_request(claim_texts))
+    analyses = parse_priority_batch_response(content_text(response.content), len(claim_texts))
+    for i, analysis in enumerate(analyses):
+        if analysis is None:
+            with labelled(claim=claim_texts[i][:80]):
+                response = cached_create(get_client(), **build_priority_request(claim_texts[i]))
+            analyses[i] = content_text(response.content)
+    return analyses
+
+def _importance_claim_batches(claims: List[Claim]) -> List[List[int]]:
+    importance = [i for i, claim in enumerate(claims) if claim.claim_type == 'importance']
+    batches = pack_by_token_budget([claims[i].text for i in importance], PRIORITY_BATCH_TOKEN_BUDGET, PRIORITY_BATCH_MAX_CLAIMS)
+    return [[importance[j] for j in batch] for batch in batches]
+
+def build_priority_requests(claims: List[Claim]) -> List[Dict]:
+    """Return the messages.create arguments of the batched requests gather_evidence_all_claims makes."""
+    return [build_priority_batch_request([claims[i].text for i in batch]) for batch in _importance_claim_batches(claims)]
+
+def gather_evidence_all_claims(claims: List[Claim], max_workers: int = 8,
+                               batch_priorities: bool = True) -> List[List[Evidence]]:
     """
     Gather evidence for a list of claims.
+    Claims are processed concurrently on a bounded thread pool, since each importance claim
+    blocks on an LLM call. Results are returned in the same order as the claims, so that
+    step 5 can pair each claim with its evidence by index.
     
     Args:
-        claims: List of claim tuples (claim_text, claim_type, initial_evidence)
+        claims: Claims from step 2
+        max_workers: Maximum number of claims (or claim batches) processed at the same time
+        batch_priorities: Analyze importance claims several per request, see analyze_priorities_batch
         
     Returns:
-        List of evidence dictionaries for each claim
+        List of evidence items for each claim
     """
-    evidence_collection = []
-    for claim in claims:
-        evidence = process_claim_by_type(claim)
-        evidence_collection.append(evidence)
+    if not claims:
+        return []
+
+    if not batch_priorities:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(claims)))) as executor:
+            return list(executor.map(propagate(process_claim_by_type), claims))
+
+    evidence_collection = [None] * len(claims)
+    for i, claim in enumerate(claims):
+        if claim.claim_type != 'importance':
+            evidence_collection[i] = process_claim_by_type(claim)
+
+    batches = _importance_claim_batches(claims)
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+            analyses = executor.map(propagate(lambda batch: analyze_priorities_batch([claims[i].text for i in batch])), batches)
+            for batch, batch_analyses in zip(batches, analyses):
+                for i, analysis in zip(batch, batch_analyses):
+                    evidence_collection[i] = _priority_analysis_evidence(analysis)
         
     return evidence_collection
 
+def gather_evidence_streaming(claim_queue: queue.Queue, max_workers: int = 8) -> Dict[Tuple[str, str], List[Evidence]]:
+    """
+    Gather evidence for claims as they arrive on a queue, e.g. while step 2 is still streaming.
+    Claims are processed on a bounded thread pool until a None sentinel is received.
+    
+    Args:
+        claim_queue: Queue of claims, ended by None
+        max_workers: Maximum number of claims processed at the same time
+        
+    Returns:
+        Dict mapping (claim_type, claim_text) to the list of evidence items for that claim
+    """
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            claim = claim_queue.get()
+            if claim is None:
+                break
+            key = (claim.claim_type, claim.text)
+            if key not in futures:
+                futures[key] = executor.submit(propagate(process_claim_by_type, step='step3_evidence'), claim)
+
+    return {key: future.result() for key, future in futures.items()}
+
 
 # //////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 # TODO Below are methods for gathering evidence from various sources. These are not used in the current implementation.
 # //////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
-def gather_evidence_for_claim(claim: Tuple[str, str, str]) -> Dict:
+def gather_evidence_for_claim(claim: Claim) -> Dict:
     """
     Gather supporting evidence for a given claim from multiple sources.
     
     Args:
-        claim: Tuple containing (claim_text, claim_type, initial_evidence)
+        claim: The claim to gather evidence for
         
     Returns:
         Dict containing gathered evidence and metadata
     """
-    claim_type, claim_text, initial_evidence = claim
+    claim_type, claim_text, initial_evidence = claim.claim_type, claim.text, claim.initial_evidence
     evidence = {
         'claim_text': claim_text,
         'claim_type': claim_type,
@@ -191,10 +363,8 @@ def gather_evidence_for_claim(claim: Tuple[str, str, str]) -> Dict:
         'expert_validation': None
     }
     
-    # Search web sources
-    evidence['web_evidence'].extend(search_perplexity(claim_text))
-    evidence['web_evidence'].extend(search_you_dot_com(claim_text))
-    evidence['web_evidence'].extend(search_serp(claim_text))
+    # Search web sources, all providers in parallel
+    evidence['web_evidence'].extend(search_web(claim_text))
     
     # For academic claims, validate using Semantic Scholar
     if contains_academic_reference(claim_text):
@@ -205,64 +375,118 @@ def gather_evidence_for_claim(claim: Tuple[str, str, str]) -> Dict:
     
     return evidence
 
-def search_perplexity(query: str) -> List[Dict]:
+def gather_evidence_for_claims(claims: List[Claim], max_workers: int = 8) -> List[Dict]:
+    """
+    Gather evidence for all claims of a document, see gather_evidence_for_claim.
+    Papers referenced by any of the claims are resolved in bulk first, so the per-claim
+    academic validation reads them from the local paper index.
+    """
+    resolve_paper_references([claim.text for claim in claims if contains_academic_reference(claim.text)])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(propagate(gather_evidence_for_claim), claims))
+
+_search_scorer = WebEvidenceScorer()
+_web_search_dispatcher = None
+
+def get_web_search_dispatcher() -> SearchDispatcher:
+    """
+    Return the dispatcher over the web search providers that have an API key configured.
+    Results count towards early termination when their step 4 web score reaches MINIMUM_EVIDENCE_SCORE.
+    """
+    global _web_search_dispatcher
+    if _web_search_dispatcher is None:
+        providers = [
+            SearchProvider(name, _cached_fetch(name, fetch), SEARCH_TIMEOUT_SECONDS[name])
+            for name, fetch, key in [
+                ('perplexity', fetch_perplexity, 'PERPLEXITY_API_KEY'),
+                ('you.com', fetch_you_dot_com, 'YOU_API_KEY'),
+                ('serp', fetch_serp, 'SERP_API_KEY'),
+            ]
+            if os.getenv(key)
+        ]
+        _web_search_dispatcher = SearchDispatcher(
+            providers,
+            score=lambda results: _search_scorer.score(results)[1].tolist(),
+            key=lambda result: normalize_url(result.url),
+            target_results=SEARCH_TARGET_RESULTS,
+            min_score=MINIMUM_EVIDENCE_SCORE,
+        )
+    return _web_search_dispatcher
+
+def _cached_fetch(provider: str, fetch):
+    # Results come from the search cache when fresh; see utils/search_cache.py. The cache holds the raw result dicts
+    return lambda query, timeout: [
+        Evidence.from_json(result) for result in cached_search(provider, query, lambda: fetch(query, timeout))
+    ]
+
+def search_web(query: str) -> List[Evidence]:
+    """Search all configured web search providers concurrently, see get_web_search_dispatcher."""
+    return get_web_search_dispatcher().search(query)
+
+def fetch_perplexity(query: str, timeout: float) -> List[Dict]:
+    """Query the Perplexity Search API. Raises on HTTP and connection errors."""
+    response = get_session().post(PERPLEXITY_SEARCH_URL,
+        json={'query': query},
+        headers={'Authorization': f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    return [{
+        'source': 'perplexity',
+        'title': result.get('title'),
+        'snippet': result.get('snippet'),
+        'url': result.get('url')
+    } for result in response.json().get('results', [])]
+
+def fetch_you_dot_com(query: str, timeout: float) -> List[Dict]:
+    """Query the You.com search API. Raises on HTTP and connection errors."""
+    response = get_session().get(YOU_SEARCH_URL,
+        params={'q': query, 'key': os.getenv('YOU_API_KEY')},
+        headers={'Accept': 'application/json'},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    return [{
+        'source': 'you.com',
+        'title': item.get('title'),
+        'snippet': item.get('snippet'),
+        'url': item.get('url')
+    } for item in response.json().get('hits', [])]
+
+def fetch_serp(query: str, timeout: float) -> List[Dict]:
+    """Query SerpAPI's Google engine. Raises on HTTP and connection errors."""
+    response = get_session().get(SERP_SEARCH_URL,
+        params={'engine': 'google', 'q': query, 'api_key': os.getenv('SERP_API_KEY')},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    return [{
+        'source': 'serp',
+        'title': item.get('title'),
+        'snippet': item.get('snippet'),
+        'url': item.get('link')
+    } for item in response.json().get('organic_results', [])]
+
+def search_perplexity(query: str) -> List[Evidence]:
     """Search Perplexity API for evidence."""
-    client = Perplexity(api_key=os.getenv('PERPLEXITY_API_KEY'))
-    results = []
-    
     try:
-        response = client.search(query)
-        for result in response['results']:
-            results.append({
-                'source': 'perplexity',
-                'title': result.get('title'),
-                'snippet': result.get('snippet'),
-                'url': result.get('url')
-            })
+        return _cached_fetch('perplexity', fetch_perplexity)(query, SEARCH_TIMEOUT_SECONDS['perplexity'])
     except Exception as e:
         print(f"Perplexity search error: {str(e)}")
-        
-    return results
+        return []
 
-def search_you_dot_com(query: str) -> List[Dict]:
+def search_you_dot_com(query: str) -> List[Evidence]:
     """Search You.com API for evidence."""
-    api_key = os.getenv('YOU_API_KEY')
-    url = f"https://api.you.com/search"
-    
     try:
-        response = requests.get(url, 
-            params={'q': query, 'key': api_key},
-            headers={'Accept': 'application/json'}
-        )
-        results = []
-        for item in response.json().get('hits', []):
-            results.append({
-                'source': 'you.com',
-                'title': item.get('title'),
-                'snippet': item.get('snippet'),
-                'url': item.get('url')
-            })
-        return results
+        return _cached_fetch('you.com', fetch_you_dot_com)(query, SEARCH_TIMEOUT_SECONDS['you.com'])
     except Exception as e:
         print(f"You.com search error: {str(e)}")
         return []
 
-def search_serp(query: str) -> List[Dict]:
+def search_serp(query: str) -> List[Evidence]:
     """Search using SerpAPI."""
     try:
-        search = GoogleSearch({
-            "q": query,
-            "api_key": os.getenv('SERP_API_KEY')
-        })
-        results = []
-        for item in search.get_dict().get('organic_results', []):
-            results.append({
-                'source': 'serp',
-                'title': item.get('title'),
-                'snippet': item.get('snippet'),
-                'url': item.get('link')
-            })
-        return results
+        return _cached_fetch('serp', fetch_serp)(query, SEARCH_TIMEOUT_SECONDS['serp'])
     except Exception as e:
         print(f"SERP API error: {str(e)}")
         return []
@@ -275,37 +499,158 @@ def contains_academic_reference(text: str) -> bool:
     ]
     return any(indicator in text.lower() for indicator in academic_indicators)
 
+def extract_paper_references(text: str) -> List[PaperRef]:
+    """
+    Extract DOIs, arXiv IDs and quoted titles from a claim.
+    
+    Returns:
+        List of ('doi' | 'arxiv' | 'title', value) references, in that order
+    """
+    refs = [('doi', doi.rstrip('.,;:)]}')) for doi in DOI_PATTERN.findall(text)]
+    refs += [('arxiv', arxiv_id) for arxiv_id in ARXIV_PATTERN.findall(text)]
+    refs += [('title', title.strip()) for title in QUOTED_TITLE_PATTERN.findall(text) if len(title.split()) >= 4]
+    return refs
+
+_semantic_scholar_client = None
+
+def _semantic_scholar():
+    global _semantic_scholar_client
+    if _semantic_scholar_client is None:
+        _semantic_scholar_client = SemanticScholar(
+            api_key=os.getenv('SEMANTIC_SCHOLAR_API_KEY'),
+            api_url=os.getenv('SEMANTIC_SCHOLAR_API_URL'), # e.g. a local stub server
+            retry=False # 429s are paced by the rate limiter, see _semantic_scholar_call
+        )
+    return _semantic_scholar_client
+
+def _semantic_scholar_call(method, *args, **kwargs):
+    """
+    Call a Semantic Scholar client method inside a rate-limited block. The semanticscholar
+    package reports HTTP 429 as ConnectionRefusedError without the response, so the throttle
+    is recorded with the limiter's default pause instead of a Retry-After header.
+    """
+    try:
+        return method(*args, **kwargs)
+    except ConnectionRefusedError:
+        record_throttle()
+        raise
+
+def _semantic_scholar_request(method, *args, **kwargs):
+    """
+    Call a Semantic Scholar client method under the rate limiter. A request answered with 429
+    is tried again (up to SEMANTIC_SCHOLAR_ATTEMPTS times) once the pause it caused is over.
+    """
+    for attempt in range(1, SEMANTIC_SCHOLAR_ATTEMPTS + 1):
+        try:
+            with rate_limited('semantic_scholar'):
+                return _semantic_scholar_call(method, *args, **kwargs)
+        except ConnectionRefusedError:
+            if attempt == SEMANTIC_SCHOLAR_ATTEMPTS:
+                raise
+
+def _paper_metadata(paper) -> Dict:
+    external_ids = paper.externalIds or {}
+    return {
+        'paper_id': paper.paperId,
+        'doi': external_ids.get('DOI'),
+        'arxiv_id': external_ids.get('ArXiv'),
+        'title': paper.title,
+        'authors': [author.name for author in paper.authors or []],
+        'year': paper.year,
+        'citation_count': paper.citationCount,
+        'influential_citation_count': paper.influentialCitationCount,
+        'url': paper.url
+    }
+
+def resolve_paper_references(texts: List[str]) -> int:
+    """
+    Resolve the papers referenced in texts into the local paper index (see utils/paper_index.py).
+    DOIs and arXiv IDs not yet indexed are fetched with Semantic Scholar's batch endpoint, up to
+    PAPER_BATCH_SIZE per request; titles are matched one by one. Both go through the rate limiter.
+    
+    Args:
+        texts: Claim texts, e.g. all claims of a document
+        
+    Returns:
+        Number of references looked up remotely
+    """
+    index = get_paper_index()
+    pending = index.unresolved(ref for text in texts for ref in extract_paper_references(text))
+    if not pending:
+        return 0
+    sch = _semantic_scholar()
+
+    by_id = [ref for ref in pending if ref[0] in ('doi', 'arxiv')]
+    for start in range(0, len(by_id), PAPER_BATCH_SIZE):
+        chunk = by_id[start:start + PAPER_BATCH_SIZE]
+        ids = [f"{'DOI' if kind == 'doi' else 'ARXIV'}:{value}" for kind, value in chunk]
+        try:
+            papers = _semantic_scholar_request(sch.get_papers, ids, fields=PAPER_FIELDS)
+        except Exception as e:
+            print(f"Semantic Scholar API error: {str(e)}")
+            continue
+        # Unknown IDs are dropped from the response, so papers are matched back to references by their external IDs
+        metadata = [_paper_metadata(paper) for paper in papers]
+        paper_ids = {}
+        for paper in metadata:
+            for kind, value in (('doi', paper['doi']), ('arxiv', paper['arxiv_id'])):
+                if value:
+                    paper_ids[(kind, value.lower())] = paper['paper_id']
+        found = [(ref, paper_ids[(ref[0], ref[1].lower())]) for ref in chunk if (ref[0], ref[1].lower()) in paper_ids]
+        index.add_papers(metadata, aliases=found)
+        index.add_missing([ref for ref in chunk if (ref[0], ref[1].lower()) not in paper_ids])
+
+    for ref in (ref for ref in pending if ref[0] == 'title'):
+        try:
+            paper = _semantic_scholar_request(sch.search_paper, ref[1], fields=PAPER_FIELDS, match_title=True)
+        except Exception as e:
+            if type(e).__name__ == 'ObjectNotFoundException':
+                index.add_missing([ref])
+            else:
+                print(f"Semantic Scholar API error: {str(e)}")
+            continue
+        metadata = _paper_metadata(paper)
+        index.add_papers([metadata], aliases=[(ref, metadata['paper_id'])])
+
+    return len(pending)
+
 def validate_academic_claim(text: str) -> Dict:
-    """Validate academic claims using Semantic Scholar."""
-    sch = SemanticScholar()
+    """
+    Validate academic claims using Semantic Scholar.
+    Papers the claim references are read from the local paper index (resolved in bulk by
+    resolve_paper_references); otherwise the claim text is searched, with results cached.
+    """
     results = {}
     
     try:
-        # Extract paper title or DOI if present
-        # This is a simplified extraction - could be more sophisticated
-        search_results = sch.search_paper(text, limit=5)
-        
-        if search_results:
-            paper = search_results[0]
-            results = {
-                'title': paper.title,
-                'authors': [author.name for author in paper.authors],
-                'year': paper.year,
-                'citation_count': paper.citationCount,
-                'influential_citation_count': paper.influentialCitationCount,
-                'url': paper.url
-            }
+        refs = extract_paper_references(text)
+        if refs:
+            resolve_paper_references([text]) # No-op if gather_evidence_for_claims already resolved them
+            index = get_paper_index()
+            for ref in refs:
+                paper = index.lookup(ref)
+                if paper is not None:
+                    return paper
+        results = cached_search('semantic_scholar', text, lambda: _search_semantic_scholar(text))
     except Exception as e:
         print(f"Semantic Scholar API error: {str(e)}")
         
     return results
 
-def get_expert_validation(claim: str, evidence: List[Dict]) -> str:
+def _search_semantic_scholar(text: str) -> Dict:
+    """Return metadata of the best Semantic Scholar match for text, or {} if there is none. Raises on API errors."""
+    # Runs inside cached_search's rate-limited block
+    search_results = _semantic_scholar_call(_semantic_scholar().search_paper, text, fields=PAPER_FIELDS, limit=5)
+    if not search_results:
+        return {}
+    return _paper_metadata(search_results[0])
+
+def get_expert_validation(claim: str, evidence: List[Evidence]) -> str:
     """Use Claude to validate claim against gathered evidence."""
-    client = anthropic.Anthropic()
+    client = get_client()
     
     evidence_text = "\n".join([
-        f"Source: {e['source']}\n{e['snippet']}"
+        f"Source: {e.source}\n{e.snippet}"
         for e in evidence
     ])
     
@@ -323,14 +668,15 @@ def get_expert_validation(claim: str, evidence: List[Dict]) -> str:
     """
     
     try:
-        response = client.messages.create(
-            model="claude-3-opus-20240229",
+        response = cached_create(
+            client,
+            model=EXPERT_VALIDATION_MODEL,
             max_tokens=500,
             temperature=0,
             system="You are an expert validator analyzing claims and evidence.",
             messages=[{"role": "user", "content": prompt}]
         )
-        return response.content[0].text
+        return content_text(response.content)
     except Exception as e:
         print(f"Claude API error: {str(e)}")
         return None
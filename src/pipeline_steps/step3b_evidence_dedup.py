@@ -0,0 +1,181 @@
+"""
+Step 3b: Remove near-duplicate evidence before validation. (Search providers often return the same article under different URLs, or syndicated copies of it)
+"""
+
+import re
+import zlib
+from itertools import combinations
+from typing import List, Optional
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from collections import defaultdict
+
+import numpy as np
+
+from pipeline_steps.step4_evidence_validator import WebEvidenceScorer
+from utils.schema import Evidence
+
+# MinHash / LSH parameters: 64 hash functions in 8 bands of 8 rows. Pairs with Jaccard similarity
+# around (1/8)^(1/8) ~ 0.77 and above become candidates, which are then checked against the threshold
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 8
+SIMILARITY_THRESHOLD = 0.8
+SHINGLE_SIZE = 3 # Words per shingle
+MERSENNE_PRIME = (1 << 31) - 1
+
+TRACKING_PARAMS = {'fbclid', 'gclid', 'msclkid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 'cmpid', 'ocid', 'smid'}
+HOST_PREFIXES = ('www.', 'm.', 'amp.', 'mobile.')
+
+_rng = np.random.default_rng(seed=20250219) # Fixed seed: signatures must be comparable across runs
+_PERMUTATION_A = _rng.integers(1, MERSENNE_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _rng.integers(0, MERSENNE_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+_web_scorer = WebEvidenceScorer()
+
+def normalize_url(url: Optional[str]) -> Optional[str]:
+    """
+    Normalize a URL so that trivially different links to the same page compare equal:
+    scheme, mobile/AMP host prefixes, tracking parameters, fragments and trailing slashes are dropped.
+    
+    Args:
+        url: URL as returned by a search provider
+        
+    Returns:
+        Normalized URL, or None if there is no URL
+    """
+    if not url or not isinstance(url, str):
+        return None
+    parts = urlsplit(url.strip() if '://' in url else f"http://{url.strip()}")
+    host = parts.netloc.lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = re.sub(r'/(amp/?)?$', '', parts.path) or ''
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else '')
+
+def _shingles(text: str) -> List[str]:
+    words = re.findall(r'[a-z0-9]+', text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """
+    Compute the MinHash signature of a text's word shingles.
+    
+    Args:
+        text: Text to sign
+        
+    Returns:
+        Array of NUM_PERMUTATIONS minimum hash values, or None for text without words
+    """
+    shingles = set(_shingles(text))
+    if not shingles:
+        return None
+    hashes = np.array([zlib.crc32(s.encode('utf-8')) % MERSENNE_PRIME for s in shingles], dtype=np.uint64)
+    # (a * x + b) mod p for every permutation and shingle; all values stay below 2^63
+    permuted = (_PERMUTATION_A[:, None] * hashes[None, :] + _PERMUTATION_B[:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+def _evidence_text(evidence: Evidence) -> str:
+    return ' '.join(part for part in (evidence.title, evidence.snippet) if part)
+
+def find_duplicate_clusters(items: List[Evidence]) -> List[List[int]]:
+    """
+    Cluster evidence items that share a normalized URL or have near-identical text.
+    Candidate pairs come from LSH buckets over MinHash signatures, so the work grows with the
+    number of items and near-duplicates rather than with the number of pairs.
+    
+    Args:
+        items: Evidence items with a url, title and/or snippet
+        
+    Returns:
+        Clusters as lists of item indices, ordered by first occurrence
+    """
+    parent = list(range(len(items)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        i, j = find(i), find(j)
+        if i != j:
+            parent[max(i, j)] = min(i, j)
+
+    by_url = {}
+    signatures = {}
+    buckets = defaultdict(list)
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    for i, evidence in enumerate(items):
+        url = normalize_url(evidence.url)
+        if url is not None:
+            if url in by_url:
+                union(by_url[url], i)
+            else:
+                by_url[url] = i
+        signature = minhash_signature(_evidence_text(evidence))
+        if signature is not None:
+            signatures[i] = signature
+            for band in range(LSH_BANDS):
+                buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(i)
+
+    # Every pair of a bucket is checked (buckets are small): a candidate that is not similar
+    # to the bucket's first member may still be similar to the others
+    for bucket in buckets.values():
+        for i, j in combinations(bucket, 2):
+            if find(i) != find(j) and np.mean(signatures[i] == signatures[j]) >= SIMILARITY_THRESHOLD:
+                union(i, j)
+
+    clusters = defaultdict(list)
+    for i in range(len(items)):
+        clusters[find(i)].append(i)
+    return sorted(clusters.values(), key=lambda cluster: cluster[0])
+
+def dedup_evidence(items: List[Evidence]) -> List[Evidence]:
+    """
+    Keep one representative of each cluster of duplicate evidence: the one with the highest
+    step 4 web score, then the longest snippet, then the earliest.
+    Items without a URL (e.g. placeholders and analyses) are clustered by their text alone;
+    items with neither a URL nor text are always kept.
+    
+    Args:
+        items: Evidence items for one claim
+        
+    Returns:
+        Deduplicated evidence, in order of first occurrence
+    """
+    evidence_items = [item for item in items if isinstance(item, Evidence)]
+    if len(evidence_items) < 2 or len(evidence_items) != len(items):
+        return items
+
+    _, scores = _web_scorer.score(items)
+    def rank(i):
+        return (-int(scores[i]), -len(items[i].snippet), i)
+
+    return [items[min(cluster, key=rank)] for cluster in find_duplicate_clusters(items)]
+
+def dedup_evidence_collection(evidence_collection: List) -> List:
+    """
+    Remove near-duplicate evidence within each claim's evidence, between steps 3 and 4.
+    
+    Args:
+        evidence_collection: Step 3 output, one entry per claim: a list of evidence items,
+            or a dictionary with 'web_evidence' (see gather_evidence_for_claim)
+        
+    Returns:
+        Evidence collection of the same shape, with duplicates removed
+    """
+    deduplicated = []
+    for claim_evidence in evidence_collection:
+        if isinstance(claim_evidence, list):
+            claim_evidence = dedup_evidence(claim_evidence)
+        elif isinstance(claim_evidence, dict) and claim_evidence.get('web_evidence'):
+            claim_evidence = {**claim_evidence, 'web_evidence': dedup_evidence(claim_evidence['web_evidence'])}
+        deduplicated.append(claim_evidence)
+    return deduplicated
@@ -4,10 +4,18 @@ Step 4: Validate and rank evidence. (Precision-like, keep only the strongest evi
 
 from typing import List, Dict, Tuple
 import re
+import heapq
+from bisect import bisect_right
+from urllib.parse import urlsplit
 from collections import defaultdict
 
+import numpy as np
+
+from utils.schema import Evidence
+
 # Scoring thresholds and weights
 MINIMUM_EVIDENCE_SCORE = 3
+TOP_K_PER_CATEGORY = 5 # Evidence kept per claim and category
 CITATION_THRESHOLD = 50
 INFLUENTIAL_CITATION_THRESHOLD = 10
 RECENT_YEAR_THRESHOLD = 2020
@@ -45,50 +53,230 @@ SOURCE_PATTERNS = {
 RESEARCH_INDICATORS = ['study shows', 'research demonstrates', 'according to']
 RECOGNITION_INDICATORS = ['patent', 'award', 'recognition']
 
-def validate_and_rank_evidence(evidence_collection: List[Dict]) -> List[Dict]:
+# Feature columns of the web evidence scoring engine: (category, weight key)
+WEB_FEATURES = [(category, category) for category in SOURCE_PATTERNS] + [
+    ('research_based', 'research_indicators'),
+    ('recognition', 'recognition_indicators'),
+]
+
+class WebEvidenceScorer:
+    """
+    Scores web evidence items in batches with precompiled matchers.
+    Each item becomes a row of boolean features (one column per entry of WEB_FEATURES), and
+    scores are the feature matrix times the weight vector. Matches score_web_evidence's
+    per-item rules exactly: a category counts once per item if any of its patterns matches.
+    """
+
+    def __init__(self):
+        self.columns = [category for category, _ in WEB_FEATURES]
+        self.weights = np.array([SCORE_WEIGHTS['web_source'][key] for _, key in WEB_FEATURES], dtype=np.int64)
+        column_of = {category: i for i, category in enumerate(self.columns)}
+
+        self._source_matchers = [
+            (column_of[category], re.compile(pattern)) for category, pattern in SOURCE_PATTERNS.items()
+        ]
+        # Indicator terms are searched for across the whole batch at once, see features()
+        self._indicator_terms = [
+            (column_of[category], term)
+            for category, terms in (('research_based', RESEARCH_INDICATORS), ('recognition', RECOGNITION_INDICATORS))
+            for term in terms
+        ]
+        self._source_columns = {}
+
+    def _columns_for_source(self, source: str) -> List[int]:
+        # Search results come from a limited set of sites, so domain matches are memoized per source
+        columns = self._source_columns.get(source)
+        if columns is None:
+            columns = [column for column, pattern in self._source_matchers if pattern.search(source)]
+            if len(self._source_columns) < 100000:
+                self._source_columns[source] = columns
+        return columns
+
+    @staticmethod
+    def _domain(evidence: Evidence) -> str:
+        # Search results name the provider in 'source'; the site they point to is the URL's host
+        url = evidence.url
+        if url:
+            return urlsplit(url if '://' in url else f"http://{url}").netloc.lower()
+        return (evidence.source or '').lower()
+
+    def features(self, web_evidence: List[Evidence]) -> np.ndarray:
+        """Return the (items x features) boolean matrix for a list of web evidence items."""
+        features = np.zeros((len(web_evidence), len(self.columns)), dtype=bool)
+        if not web_evidence:
+            return features
+
+        rows, columns = [], []
+        for row, evidence in enumerate(web_evidence):
+            for column in self._columns_for_source(self._domain(evidence)):
+                rows.append(row)
+                columns.append(column)
+        features[rows, columns] = True
+
+        # Join all snippets with a separator no indicator contains and scan the joined text once per
+        # term. A hit only matters once per item, so each search resumes at the next item's start
+        snippets = [(evidence.snippet or '').lower() for evidence in web_evidence]
+        starts = np.cumsum([0] + [len(snippet) + 1 for snippet in snippets]).tolist()
+        text = "\x00".join(snippets)
+        rows, columns = [], []
+        for column, term in self._indicator_terms:
+            position = text.find(term)
+            while position != -1:
+                row = bisect_right(starts, position) - 1
+                rows.append(row)
+                columns.append(column)
+                position = text.find(term, starts[row + 1])
+        features[rows, columns] = True
+        return features
+
+    def score(self, web_evidence: List[Evidence]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score a batch of web evidence items.
+        
+        Returns:
+            Tuple of the (items x features) boolean matrix and the per-item score column
+        """
+        features = self.features(web_evidence)
+        return features, features.astype(np.int64) @ self.weights
+
+_web_scorer = WebEvidenceScorer()
+
+def _is_search_result(evidence) -> bool:
+    # Placeholders and priority analyses are written by the pipeline itself and are never ranked out
+    if isinstance(evidence, Evidence):
+        return bool(evidence.url)
+    return isinstance(evidence, dict) and any(evidence.get(key) for key in ('web_evidence', 'academic_evidence', 'expert_validation'))
+
+class ClaimEvidenceRanker:
+    """
+    Keeps the top k evidence items per claim and category as evidence arrives.
+    Each (claim, category) pair has a min-heap of at most k items, so memory is bounded by
+    k x categories x claims regardless of how many search hits are added.
+    Evidence that is not a search result (see _is_search_result) is kept as is.
+    """
+
+    def __init__(self, k: int = TOP_K_PER_CATEGORY):
+        self.k = k
+        self._heaps = defaultdict(list) # (claim index, category) -> [(score, -order, order, evidence)]
+        self._unranked = defaultdict(list) # claim index -> [(order, evidence)]
+        self._num_claims = 0
+        self._order = 0
+
+    def add(self, claim_index: int, evidence_items: List):
+        """Score a batch of evidence for one claim and keep it if it is among the claim's top k."""
+        self._num_claims = max(self._num_claims, claim_index + 1)
+        search_results = []
+        for evidence in evidence_items:
+            self._order += 1
+            if _is_search_result(evidence):
+                search_results.append((self._order, evidence))
+            else:
+                self._unranked[claim_index].append((self._order, evidence))
+
+        structured = [(order, ev) for order, ev in search_results if isinstance(ev, dict)]
+        flat = [(order, ev) for order, ev in search_results if isinstance(ev, Evidence)]
+        score_evidence_batch([ev for _, ev in structured])
+        features, scores = _web_scorer.score([ev for _, ev in flat])
+        for (_, evidence), row, score in zip(flat, features, scores):
+            evidence.strength_score = int(score)
+            evidence.categories = [c for c, present in zip(_web_scorer.columns, row) if present]
+
+        scored = [(order, ev, ev['strength_score'], ev['categories']) for order, ev in structured]
+        scored += [(order, ev, ev.strength_score, ev.categories) for order, ev in flat]
+        for order, evidence, strength_score, categories in scored:
+            if strength_score < MINIMUM_EVIDENCE_SCORE:
+                continue
+            entry = (strength_score, -order, order, evidence)
+            for category in categories or ['uncategorized']:
+                heap = self._heaps[(claim_index, category)]
+                if len(heap) < self.k:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]: # On equal scores the earlier evidence stays
+                    heapq.heapreplace(heap, entry)
+
+    def ranked(self) -> List[List]:
+        """
+        Return the kept evidence in claim order: for each claim, its unranked evidence in arrival
+        order followed by its top evidence by descending strength score.
+        """
+        kept = defaultdict(dict)
+        for (claim_index, _), heap in self._heaps.items():
+            for score, _, order, evidence in heap:
+                kept[claim_index][order] = (score, evidence) # Evidence in several categories is kept once
+        ranked = []
+        for claim_index in range(self._num_claims):
+            top = sorted(kept[claim_index].items(), key=lambda item: (-item[1][0], item[0]))
+            ranked.append([ev for _, ev in self._unranked[claim_index]] + [ev for _, (_, ev) in top])
+        return ranked
+
+def validate_and_rank_evidence(evidence_collection: List, k: int = TOP_K_PER_CATEGORY) -> List:
     """
-    Validate and rank evidence, keeping only the strongest supporting evidence.
+    Validate and rank evidence, keeping only the strongest supporting evidence for each claim.
     
     Args:
-        evidence_collection: List of evidence dictionaries from evidence gathering step
+        evidence_collection: Step 3 output, one entry per claim: a list of evidence items,
+            or a single evidence dictionary (see gather_evidence_for_claim)
+        k: Evidence kept per claim and category
         
     Returns:
-        List of validated and ranked evidence dictionaries
+        One list of validated and ranked evidence per claim, in claim order. Entries that are not
+        evidence (e.g. stringified evidence from old checkpoints) are returned unchanged
     """
-    validated_evidence = []
-    
-    for evidence in evidence_collection:
-        scored_evidence = score_evidence(evidence)
-        if scored_evidence['strength_score'] >= MINIMUM_EVIDENCE_SCORE:
-            validated_evidence.append(scored_evidence)
-            
-    # Sort by strength score
-    validated_evidence.sort(key=lambda x: x['strength_score'], reverse=True)
-    
-    return validated_evidence
+    ranker = ClaimEvidenceRanker(k)
+    passthrough = {}
+    for claim_index, claim_evidence in enumerate(evidence_collection):
+        if isinstance(claim_evidence, dict):
+            claim_evidence = [claim_evidence]
+        if isinstance(claim_evidence, list):
+            ranker.add(claim_index, claim_evidence)
+        else:
+            ranker.add(claim_index, [])
+            passthrough[claim_index] = claim_evidence
+
+    ranked = ranker.ranked()
+    return [passthrough.get(i, evidence) for i, evidence in enumerate(ranked)]
 
 def score_evidence(evidence: Dict) -> Dict:
     """Score a single piece of evidence based on all available data."""
-    evidence['strength_score'] = 0
-    evidence['categories'] = []
+    return score_evidence_batch([evidence])[0]
+
+def score_evidence_batch(evidence_collection: List[Dict]) -> List[Dict]:
+    """
+    Score many pieces of evidence, with the web evidence of all of them scored in one batch.
+    Gives the same scores and categories as calling score_evidence on each.
     
-    if evidence.get('academic_evidence'):
-        academic_score = score_academic_evidence(evidence['academic_evidence'])
-        evidence['strength_score'] += academic_score
-        evidence['categories'].append('academic')
-        
-    if evidence.get('web_evidence'):
-        web_scores = score_web_evidence(evidence['web_evidence'])
-        evidence['strength_score'] += web_scores['score']
-        evidence['categories'].extend(web_scores['categories'])
+    Args:
+        evidence_collection: List of evidence dictionaries from evidence gathering step
         
-    if evidence.get('expert_validation'):
-        expert_score = score_expert_validation(evidence['expert_validation'])
-        evidence['strength_score'] += expert_score
-        if expert_score > 0:
-            evidence['categories'].append('expert_validated')
-            
-    return evidence
+    Returns:
+        The same dictionaries, with 'strength_score' and 'categories' set
+    """
+    web_items = [evidence.get('web_evidence') or [] for evidence in evidence_collection]
+    offsets = np.cumsum([0] + [len(items) for items in web_items])
+    features, scores = _web_scorer.score([item for items in web_items for item in items])
+
+    for i, evidence in enumerate(evidence_collection):
+        start, end = offsets[i], offsets[i + 1]
+        evidence['strength_score'] = 0
+        evidence['categories'] = []
+
+        if evidence.get('academic_evidence'):
+            academic_score = score_academic_evidence(evidence['academic_evidence'])
+            evidence['strength_score'] += academic_score
+            evidence['categories'].append('academic')
+
+        if end > start:
+            evidence['strength_score'] += int(scores[start:end].sum())
+            present = features[start:end].any(axis=0)
+            evidence['categories'].extend(c for c, p in zip(_web_scorer.columns, present) if p)
+
+        if evidence.get('expert_validation'):
+            expert_score = score_expert_validation(evidence['expert_validation'])
+            evidence['strength_score'] += expert_score
+            if expert_score > 0:
+                evidence['categories'].append('expert_validated')
+
+    return evidence_collection
 
 def score_academic_evidence(academic_evidence: Dict) -> int:
     """Score academic evidence based on citations and influence."""
@@ -103,33 +291,13 @@ def score_academic_evidence(academic_evidence: Dict) -> int:
         score += weights['recent_publication']
     return score
 
-def score_web_evidence(web_evidence: List[Dict]) -> Dict:
+def score_web_evidence(web_evidence: List[Evidence]) -> Dict:
     """Score web evidence based on source reputation and content."""
-    score = 0
-    categories = []
-    weights = SCORE_WEIGHTS['web_source']
-    
-    for evidence in web_evidence:
-        source = evidence.get('source', '').lower()
-        snippet = evidence.get('snippet', '').lower()
-        
-        # Score based on domain
-        for category, pattern in SOURCE_PATTERNS.items():
-            if re.search(pattern, source):
-                score += weights[category]
-                categories.append(category)
-            
-        # Score based on content indicators
-        if any(term in snippet for term in RESEARCH_INDICATORS):
-            score += weights['research_indicators']
-            categories.append('research_based')
-        if any(term in snippet for term in RECOGNITION_INDICATORS):
-            score += weights['recognition_indicators']
-            categories.append('recognition')
-            
+    features, scores = _web_scorer.score(web_evidence)
+    present = features.any(axis=0)
     return {
-        'score': score,
-        'categories': list(set(categories))
+        'score': int(scores.sum()),
+        'categories': [category for category, p in zip(_web_scorer.columns, present) if p]
     }
 
 def score_expert_validation(validation: str) -> int:
@@ -170,7 +338,7 @@ def categorize_evidence(validated_evidence: List[Dict]) -> Dict[str, List[Dict]]
     categories = defaultdict(list)
     
     for evidence in validated_evidence:
-        for category in evidence['categories']:
+        for category in (evidence.categories or []) if isinstance(evidence, Evidence) else evidence['categories']:
             categories[category].append(evidence)
             
     return dict(categories)
@@ -2,10 +2,25 @@
 Step 5: Generate a well-formatted PDF document listing all supporting evidence and arguments for eligibility criterion #1.
 """
 
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
 from pipeline_steps.step1_pdf_processor import create_formatted_pdf
-import anthropic
-import os
+
+from utils.llm_cache import cached_create, cached_stream, is_cached
+from utils.llm_client import get_client
+from utils.metrics import propagate
+from utils.schema import Claim, Evidence, content_text
+from utils.tokens import estimate_tokens, pack_by_token_budget
+
+REPORT_MODEL = "claude-3-opus-20240229"
+SUMMARY_MODEL = "claude-3-haiku-20240307"
+REPORT_CLAIM_TOKEN_BUDGET = 1200 # Estimated tokens of one claim with its packed evidence
+REPORT_DIRECT_TOKEN_BUDGET = 8000 # Claims and evidence up to this size go into the report prompt directly
+REPORT_GROUP_TOKEN_BUDGET = 6000 # Estimated input tokens per summary (map) request
+REPORT_GROUP_MAX_CLAIMS = 8
+REPORT_SUMMARY_MAX_TOKENS = 600
+REPORT_MAP_MAX_WORKERS = 4
+EVIDENCE_ITEM_MAX_CHARS = 1500
 
 def generate_evidence_report(claims: List, validated_evidence: List):
     """
@@ -83,51 +98,212 @@ def _generate_report_template(applicant_info: Dict, validated_evidence: List[Dic
 
 
 # TODO update this to support the profile of the applicant (first name, last name, Dr. or Prof. if relevant, ...)
-def _generate_report_with_anthropic(claims: List[Tuple[str, str, str]], evidence_list: List[str]) -> str:
+def _generate_report_with_anthropic(claims: List[Claim], evidence_list: List) -> str:
     """
     Generate report content using Anthropic's API by synthesizing claims and evidence.
+    Small inputs are synthesized in one request; larger ones are summarized in groups of claims
+    concurrently first (map), then the report is written from the summaries (reduce).
     
     Args:
-        claims: List of (claim_type, claim_text, claim_explanation) tuples from step 2
-        evidence_list: List of evidence strings from step 3
-    """
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    
-    # Group claims by type
-    claims_by_type = {}
-    for claim_type, claim_text, explanation in claims:
-        if claim_type not in claims_by_type:
-            claims_by_type[claim_type] = []
-        claims_by_type[claim_type].append((claim_text, explanation))
-
-    # Match evidence to claims where possible
-    evidence_summary = []
-    for i, (claim_type, claim_group) in enumerate(claims_by_type.items()):
-        evidence_summary.append(f"\nClaim Type: {claim_type}")
-        for claim_text, explanation in claim_group:
-            evidence_summary.append(f"\nClaim: {claim_text}")
-            evidence_summary.append(f"Context: {explanation}")
-            if i < len(evidence_list):
-                evidence_summary.append(f"Supporting Evidence: {evidence_list[i]}")
+        claims: Claims from step 2
+        evidence_list: Evidence per claim from step 4, evidence_list[i] supporting claims[i]
+    """
+    response = cached_create(get_client(), **_plan_report(claims, evidence_list, _summarize_concurrently))
+    
+    return content_text(response.content)
+
+def _summarize_concurrently(requests: List[Dict]) -> List[str]:
+    with ThreadPoolExecutor(max_workers=REPORT_MAP_MAX_WORKERS) as executor:
+        return list(executor.map(propagate(lambda request: content_text(cached_create(get_client(), **request).content)), requests))
+
+class ParagraphSplitter:
+    """
+    Splits streamed text into paragraphs at blank lines ("\\n\\n"), calling
+    on_paragraph(paragraph, text_so_far) for each one as soon as its end has arrived.
+    text_so_far is the text up to the end of that paragraph.
+    """
+
+    def __init__(self, on_paragraph: Callable[[str, str], None]):
+        self.on_paragraph = on_paragraph
+        self.text = ""
+        self._emitted = 0 # Index in text up to which paragraphs were handed out
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        end = self.text.find('\n\n', self._emitted)
+        while end != -1:
+            paragraph = self.text[self._emitted:end]
+            self._emitted = end + 2
+            if paragraph.strip():
+                self.on_paragraph(paragraph, self.text[:end])
+            end = self.text.find('\n\n', self._emitted)
+
+    def close(self):
+        paragraph = self.text[self._emitted:]
+        self._emitted = len(self.text)
+        if paragraph.strip():
+            self.on_paragraph(paragraph, self.text)
+
+def stream_evidence_report(claims: List[Claim], evidence_list: List,
+                           on_paragraph: Callable[[str, str], None], resume_text: str = "") -> str:
+    """
+    Generate the report like generate_evidence_report, streaming the final response and handing
+    out each paragraph as soon as it is complete, e.g. to render it and save progress.
     
+    Args:
+        claims: Claims from step 2
+        evidence_list: Evidence per claim from step 4
+        on_paragraph: Called with (paragraph, report text up to the end of it) for every paragraph, in order
+        resume_text: Report text of an interrupted run. Its paragraphs are handed out first, and the
+            model continues from it (assistant prefill) instead of starting over
+        
+    Returns:
+        The full report text
+    """
+    request = _plan_report(claims, evidence_list, _summarize_concurrently)
+    prefix = resume_text.rstrip() # The API rejects prefills ending in whitespace
+    if prefix:
+        request = {**request, "messages": request["messages"] + [{"role": "assistant", "content": prefix}]}
+
+    splitter = ParagraphSplitter(on_paragraph)
+    splitter.feed(prefix)
+    cached_stream(get_client(), splitter.feed, **request)
+    splitter.close()
+    return splitter.text
+
+def pending_report_requests(claims: List[Claim], evidence_list: List) -> List[Dict]:
+    """
+    Return the requests generating the report would make next that are not in the LLM cache:
+    the uncached summary requests of the first unfinished map level, or once every summary is
+    cached, the final report request if it is not cached either. Used to submit them as batches.
+    """
+    pending = []
+
+    def summarize(requests):
+        pending.extend(request for request in requests if not is_cached(request))
+        if pending:
+            return None
+        return [content_text(cached_create(get_client(), bypass=False, **request).content) for request in requests]
+
+    final_request = _plan_report(claims, evidence_list, summarize)
+    if final_request is not None and not is_cached(final_request):
+        pending.append(final_request)
+    return pending
+
+def _format_evidence(evidence) -> str:
+    if isinstance(evidence, Evidence):
+        text = f"- [{evidence.source or evidence.title or 'Unknown source'}] {evidence.snippet}"
+        if evidence.url:
+            text += f" ({evidence.url})"
+    elif isinstance(evidence, dict):
+        snippet = evidence.get('snippet') or evidence.get('content') or ''
+        source = evidence.get('source') or evidence.get('title') or 'Unknown source'
+        text = f"- [{source}] {snippet}"
+        if evidence.get('url'):
+            text += f" ({evidence['url']})"
+    else:
+        text = f"- {evidence}"
+    return text[:EVIDENCE_ITEM_MAX_CHARS]
+
+def pack_claim_evidence(claim: Claim, evidence, token_budget: int = REPORT_CLAIM_TOKEN_BUDGET) -> str:
+    """
+    Format one claim with as much of its evidence as fits the token budget, strongest first
+    (step 4 ranks each claim's evidence).
+    
+    Args:
+        claim: The claim
+        evidence: The claim's evidence: a list of evidence items, or a string from old checkpoints
+        token_budget: Maximum estimated tokens of the formatted claim
+        
+    Returns:
+        Text block with the claim, its context and supporting evidence
+    """
+    claim_type, claim_text, explanation = claim.claim_type, claim.text, claim.initial_evidence
+    lines = [f"Claim Type: {claim_type}", f"Claim: {claim_text}", f"Context: {explanation}", "Supporting Evidence:"]
+    used = sum(estimate_tokens(line) for line in lines)
+    items = evidence if isinstance(evidence, list) else [evidence] if evidence else []
+    for item in items:
+        line = _format_evidence(item)
+        tokens = estimate_tokens(line)
+        if used + tokens > token_budget:
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(lines)
+
+def build_summary_request(claim_blocks: List[str]) -> Dict:
+    """
+    Build the messages.create arguments summarizing a group of claims and their evidence (map step).
+    
+    Args:
+        claim_blocks: Claims with their evidence, see pack_claim_evidence, or summaries of a previous level
+        
+    Returns:
+        Keyword arguments for client.messages.create
+    """
+    prompt = f"""Summarize the following claims and their supporting evidence for an immigration petition report.
+    For each claim, restate it in one sentence, then give the strongest supporting evidence in 2-4 sentences,
+    keeping source names, figures and URLs. Do not add anything that is not in the evidence.
+
+    {chr(10).join(chr(10) + block for block in claim_blocks)}""" # char 10 is newline
+
+    return {
+        "model": SUMMARY_MODEL,
+        "max_tokens": REPORT_SUMMARY_MAX_TOKENS,
+        "temperature": 0,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+
+def _plan_report(claims: List[Claim], evidence_list: List,
+                 summarize: Callable[[List[Dict]], Optional[List[str]]]) -> Optional[Dict]:
+    """
+    Pack claims with their evidence, then summarize groups of them level by level until they fit
+    the direct report budget, and return the final report request.
+    summarize runs a level's summary requests and returns their texts, or None to stop early
+    (in which case None is returned).
+    """
+    blocks = [
+        pack_claim_evidence(claim, evidence_list[i] if i < len(evidence_list) else None)
+        for i, claim in enumerate(claims)
+    ]
+    from_summaries = False
+    while len(blocks) > 1 and sum(estimate_tokens(block) for block in blocks) > REPORT_DIRECT_TOKEN_BUDGET:
+        groups = pack_by_token_budget(blocks, REPORT_GROUP_TOKEN_BUDGET, REPORT_GROUP_MAX_CLAIMS)
+        summaries = summarize([build_summary_request([blocks[i] for i in group]) for group in groups])
+        if summaries is None:
+            return None
+        blocks = summaries
+        from_summaries = True
+    return build_report_request(blocks, from_summaries)
+
+def build_report_request(sections: List[str], from_summaries: bool = False) -> Dict:
+    """
+    Build the messages.create arguments for writing the report (reduce step).
+    
+    Args:
+        sections: Claims with their evidence (see pack_claim_evidence), or summaries of groups of them
+        from_summaries: Whether sections are summaries
+        
+    Returns:
+        Keyword arguments for client.messages.create
+    """
+    material = "summaries of claims and their evidence" if from_summaries else "claims and evidence"
     prompt = f"""
-    Generate a formal 2-3 paragraph report synthesizing the following claims and evidence. 
+    Generate a formal 2-3 paragraph report synthesizing the following {material}. 
     Each paragraph should address a key claim and its supporting evidence.
     Maintain a formal, academic tone and focus on demonstrating substantial merit and national importance.
 
     Claims and Evidence:
-    {chr(10).join(evidence_summary)}
+    {chr(10).join(chr(10) + section for section in sections)}
 
     Focus on synthesizing the strongest evidence that validates the original claims made.
     Avoid speculating beyond what is directly supported by the evidence provided.
     """ # char 10 is newline
 
-    response = client.messages.create(
-        model="claude-3-opus-20240229",
-        max_tokens=1000,
-        temperature=0.3,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    return response.content[0].text
+    return {
+        "model": REPORT_MODEL,
+        "max_tokens": 1000,
+        "temperature": 0.3,
+        "messages": [{"role": "user", "content": prompt}],
+    }
 
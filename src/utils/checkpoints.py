@@ -0,0 +1,93 @@
+"""
+Fingerprinted checkpoints for the pipeline steps.
+
+Each step's saved state (see utils/state_store.py) records a fingerprint of what produced it: a hash of the step's
+inputs, a hash of the step's code (which includes its prompts), and the step's config
+(models, limits). A checkpoint is only reused when all three still match, so changing the
+input PDF, a prompt or a model reruns that step. Since each step's inputs are the previous
+step's outputs, anything downstream of a changed output is invalidated automatically.
+"""
+
+import json
+import hashlib
+from typing import Any, Dict, Optional
+
+from utils.disk_cache import make_key
+from utils.schema import to_jsonable
+from utils.state_store import get_state_store
+
+CHECKPOINT_KEY = "_checkpoint"
+
+
+def hash_file(path: str) -> str:
+    """Return the SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_value(value: Any) -> str:
+    """
+    Return a content hash of a JSON-serializable value, which may contain Claim and Evidence
+    records (see utils/schema.py). Records hash like their encoded form, so a state hashes the
+    same before it is saved and after it is loaded back.
+    """
+    return make_key(to_jsonable(value))
+
+
+def module_version(module) -> str:
+    """
+    Return a hash of a module's source code, used as the code/prompt version of a step.
+    Line endings are normalized so checkouts on different platforms agree.
+    """
+    with open(module.__file__, "rb") as f:
+        return hashlib.sha256(f.read().replace(b"\r\n", b"\n")).hexdigest()
+
+
+def step_fingerprint(inputs: Any, version: str, config: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Build the fingerprint recorded with a step's checkpoint.
+
+    Args:
+        inputs: Everything the step reads (typically hashes of the previous steps' states)
+        version: Code/prompt version of the step, see module_version
+        config: Settings that change the step's output, e.g. model names
+
+    Returns:
+        Dict: Fingerprint with the inputs hash, version and config
+    """
+    return {
+        "inputs": hash_value(inputs),
+        "version": version,
+        "config": config or {},
+    }
+
+
+def load_checkpoint(output_dir: str, step_name: str, fingerprint: Dict[str, Any]) -> Optional[Dict]:
+    """
+    Load a step's state if its checkpoint exists and was produced from the same fingerprint.
+
+    Args:
+        output_dir: Output directory of the statement
+        step_name: Name of the pipeline step
+        fingerprint: Fingerprint the step would be run with now
+
+    Returns:
+        Dict: The saved state (without the fingerprint), or None if missing or stale
+    """
+    try:
+        state = get_state_store().load(output_dir, step_name)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable checkpoint {step_name} of {output_dir}: {str(e)}")
+        return None
+    if state is None:
+        return None
+
+    saved = state.pop(CHECKPOINT_KEY, None)
+    if saved != json.loads(json.dumps(fingerprint)):
+        changed = [k for k in ("inputs", "version", "config") if (saved or {}).get(k) != fingerprint.get(k)]
+        print(f"Checkpoint {step_name} of {output_dir} is stale (changed: {', '.join(changed)})")
+        return None
+    return state
@@ -0,0 +1,164 @@
+"""
+Persistent SQLite-backed key/value cache shared by the pipeline steps.
+
+Values are stored as JSON, keyed by a content hash of whatever produced them,
+so identical work is only paid for once across reruns and worker processes.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_DIR = "../output/.cache"
+EVICTION_INTERVAL = 100 # Run eviction every N writes
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Build a content-addressed cache key from JSON-serializable parts.
+
+    Args:
+        *parts: Values that together identify the cached computation
+
+    Returns:
+        str: Hex SHA-256 digest of the canonical JSON encoding of parts
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SqliteConnections:
+    """
+    Connections to one SQLite file in WAL mode, one per thread. sqlite3 connections must not
+    be shared across threads, nor inherited across a fork, so a forked process opens its own.
+    """
+
+    def __init__(self, path: str, isolation_level: Optional[str] = ""):
+        """
+        Args:
+            path: Path of the SQLite file, created if missing
+            isolation_level: As for sqlite3.connect; None leaves transactions to the caller
+        """
+        self.path = path
+        self.isolation_level = isolation_level
+        self._local = threading.local()
+        self._pid = os.getpid()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def connect(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=self.isolation_level)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+class DiskCache:
+    """
+    Key/value cache in a single SQLite file with age- and size-based eviction.
+    Safe to share between threads (one connection per thread) and processes (WAL mode).
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 max_age_seconds: Optional[float] = None):
+        """
+        Args:
+            path: Path of the SQLite file, created if missing
+            max_entries: Evict least recently used entries beyond this count (None = unbounded)
+            max_bytes: Evict least recently used entries beyond this total value size (None = unbounded)
+            max_age_seconds: Entries older than this are treated as missing and evicted (None = never expire)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = SqliteConnections(path)
+        with self._db.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed_at ON entries (accessed_at)")
+        self.evict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired."""
+        conn = self._db.connect()
+        row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age_seconds is not None and now - row[1] > self.max_age_seconds):
+            with self._lock:
+                self.misses += 1
+            return None
+        with conn:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def contains(self, key: str) -> bool:
+        """Whether an unexpired value is cached for key, without counting a hit or miss."""
+        row = self._db.connect().execute("SELECT created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        return row is not None and (self.max_age_seconds is None or time.time() - row[0] <= self.max_age_seconds)
+
+    def set(self, key: str, value: Any) -> int:
+        """Store a JSON-serializable value under key. Returns its stored size in bytes."""
+        payload = json.dumps(value)
+        now = time.time()
+        conn = self._db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+        with self._lock:
+            self._writes += 1
+            run_eviction = self._writes % EVICTION_INTERVAL == 0
+        if run_eviction:
+            self.evict()
+        return len(payload)
+
+    def evict(self) -> None:
+        """Drop expired entries, then least recently used entries until within the size limits."""
+        conn = self._db.connect()
+        with conn:
+            if self.max_age_seconds is not None:
+                conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            if self.max_entries is not None:
+                conn.execute("""
+                    DELETE FROM entries WHERE key IN (
+                        SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            if self.max_bytes is not None:
+                conn.execute("""
+                    DELETE FROM entries WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS running_size FROM entries
+                        ) WHERE running_size > ?
+                    )
+                """, (self.max_bytes,))
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for this process."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
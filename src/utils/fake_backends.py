@@ -0,0 +1,308 @@
+"""
+Deterministic offline stand-ins for the Anthropic client and the web search providers, for
+benchmarks and runs without network access.
+
+FakeAnthropicClient answers the requests of steps 2, 3 and 5 in their expected formats (claims
+are picked from the statement text itself, so claim counts grow with the statement), with
+latency from a configurable time to first token and generation speed. Requests fail with a
+configurable probability, as 429 answers with a Retry-After header that are retried like the
+SDK does, so failure rates show up as retries, latency and rate limiter backoff. Responses,
+failures and latency jitter depend only on the request and the seed, so two runs of the same
+workload are identical.
+
+FakeSearchServer serves the Perplexity, You.com and SerpAPI response formats on a local port.
+
+    from utils.llm_client import set_client
+    set_client(FakeAnthropicClient(FakeBackendConfig(latency_seconds=0.5)))
+    server = FakeSearchServer(FakeBackendConfig(latency_seconds=0.2)).start()
+    server.configure_environment() # Before pipeline_steps.step3_evidence_gather is imported
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from utils.metrics import record_http_attempt
+from utils.rate_limiter import record_http_response
+
+CLAIM_WORDS_MIN = 8 # Sentences shorter than this are never extracted as claims
+IMPORTANCE_TERMS = ("national", "economic", "public", "health", "security", "energy", "industry", "impact")
+
+
+@dataclass
+class FakeBackendConfig:
+    """
+    Behaviour of a fake backend.
+
+    Attributes:
+        latency_seconds: Mean time to the first token (LLM) or to the response (search)
+        jitter: Relative spread of latency_seconds, e.g. 0.2 for +/-20%
+        tokens_per_second: LLM generation speed; 0 delivers the whole response at once
+        failure_rate: Probability that one attempt fails
+        max_retries: Retries after a failed attempt before the call raises
+        retry_backoff_seconds: Wait before the first retry, doubled for each further retry
+        seed: Seed of the deterministic latency and failure draws
+    """
+    latency_seconds: float = 0.5
+    jitter: float = 0.2
+    tokens_per_second: float = 80.0
+    failure_rate: float = 0.0
+    max_retries: int = 2
+    retry_backoff_seconds: float = 0.5
+    seed: int = 0
+
+    def rng(self, *key) -> random.Random:
+        """Return a random generator determined by the seed and key, e.g. a request and attempt number."""
+        digest = hashlib.sha256(json.dumps([self.seed, *key], sort_keys=True, default=str).encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def latency(self, rng: random.Random) -> float:
+        return max(0.0, self.latency_seconds * (1 + self.jitter * (2 * rng.random() - 1)))
+
+
+class FakeBackendError(Exception):
+    """A simulated failure that outlasted the retries."""
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+def _sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", re.sub(r"\s+", " ", text)) if sentence.strip()]
+
+
+def _is_claim(sentence: str) -> bool:
+    # Decided by the sentence alone, so a sentence in the overlap of two chunks is extracted from both or neither
+    if len(sentence.split()) < CLAIM_WORDS_MIN:
+        return False
+    return hashlib.sha256(sentence.encode("utf-8")).digest()[0] % 3 == 0
+
+
+def respond(request: Dict) -> str:
+    """Return the response text of a messages.create request, in the format its step expects."""
+    prompt = _text_of(request["messages"][0]["content"])
+    if "CLAIM TYPE:" in prompt and "Text to analyze:" in prompt:
+        text = prompt.rpartition("Text to analyze:")[2]
+        return "\n".join(
+            f"CLAIM TYPE: {'importance' if any(term in sentence.lower() for term in IMPORTANCE_TERMS) else 'background'}\n"
+            f"CLAIM TEXT: {sentence}\nEVIDENCE: {sentence}\n"
+            for sentence in _sentences(text) if _is_claim(sentence)
+        )
+    if "Answer every claim, in order" in prompt:
+        count = len(re.findall(r"^\s*CLAIM \d+:", prompt, re.MULTILINE))
+        return "\n".join(
+            f"CLAIM {i + 1}: The work aligns with the priority of strengthening U.S. economic competitiveness in emerging technologies."
+            for i in range(count)
+        )
+    if prompt.startswith("Analyze how this claim aligns"):
+        return "The claim aligns with the priority of strengthening U.S. economic competitiveness in emerging technologies."
+    if prompt.startswith("Summarize the following claims"):
+        count = max(1, len(re.findall(r"^\s*Claim Type:", prompt, re.MULTILINE)))
+        return "\n\n".join(
+            f"Claim {i + 1} restated in one sentence. Its strongest evidence is a policy analysis showing alignment with national priorities."
+            for i in range(count)
+        )
+    if "Generate a formal" in prompt:
+        return "\n\n".join(
+            f"Paragraph {i + 1} of the report synthesizes the applicant's claims and the strongest supporting evidence, "
+            "with a formal tone focused on substantial merit and national importance."
+            for i in range(3)
+        )
+    return "OK."
+
+
+class _FakeStream:
+    def __init__(self, message, chunks: List[str], seconds_per_chunk: float):
+        self._message = message
+        self._chunks = chunks
+        self._seconds_per_chunk = seconds_per_chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        for chunk in self._chunks:
+            time.sleep(self._seconds_per_chunk)
+            yield chunk
+
+    def get_final_message(self):
+        return self._message
+
+
+class _FakeMessages:
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _attempt(self, request: Dict) -> random.Random:
+        # Failed attempts are retried with exponential backoff, each one counted as an HTTP request
+        with self._lock:
+            self.calls += 1
+        for attempt in range(self.config.max_retries + 1):
+            record_http_attempt()
+            rng = self.config.rng(request, attempt)
+            if rng.random() >= self.config.failure_rate:
+                time.sleep(self.config.latency(rng))
+                return rng
+            time.sleep(self.config.latency(rng) / 2) # Errors come back faster than answers
+            backoff = self.config.retry_backoff_seconds * 2 ** attempt
+            record_http_response(SimpleNamespace(status_code=429, headers={"retry-after": str(backoff)}))
+            if attempt < self.config.max_retries:
+                time.sleep(backoff)
+        raise FakeBackendError(f"Simulated failure after {self.config.max_retries} retries")
+
+    def _message(self, request: Dict, text: str):
+        from anthropic.types import Message
+
+        prompt_tokens = _estimate_tokens(json.dumps([request.get("system"), request["messages"]], default=str))
+        return Message.model_validate({
+            "id": "msg_fake_" + hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:24],
+            "type": "message",
+            "role": "assistant",
+            "model": request["model"],
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": prompt_tokens, "output_tokens": _estimate_tokens(text)},
+        })
+
+    def _generation_seconds(self, text: str) -> float:
+        return _estimate_tokens(text) / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+
+    def create(self, **request):
+        self._attempt(request)
+        text = respond(request)
+        time.sleep(self._generation_seconds(text))
+        return self._message(request, text)
+
+    def stream(self, **request):
+        self._attempt(request)
+        text = respond(request)
+        if request["messages"][-1]["role"] == "assistant": # Prefilled answer: only the rest is generated
+            text = text[len(_text_of(request["messages"][-1]["content"])):]
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)] or [""]
+        return _FakeStream(self._message(request, text), chunks, self._generation_seconds(text) / len(chunks))
+
+
+class FakeAnthropicClient:
+    """Offline replacement for anthropic.Anthropic, see the module docstring. Install it with utils.llm_client.set_client."""
+
+    def __init__(self, config: Optional[FakeBackendConfig] = None):
+        self.config = config or FakeBackendConfig()
+        self.messages = _FakeMessages(self.config)
+
+    def close(self):
+        pass
+
+
+class FakeSearchServer:
+    """
+    Local HTTP server answering Perplexity (POST /perplexity), You.com (GET /you) and SerpAPI
+    (GET /serp) searches with deterministic results. Failed attempts answer HTTP 429 with
+    a Retry-After header; search providers are not retried.
+
+    Args:
+        config: Latency, failure rate and seed of the answers
+        results_per_query: Results in each answer
+        port: Port to listen on (0 picks a free one)
+    """
+
+    def __init__(self, config: Optional[FakeBackendConfig] = None, results_per_query: int = 5, port: int = 0):
+        self.config = config or FakeBackendConfig(latency_seconds=0.3)
+        self.results_per_query = results_per_query
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSearchServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def configure_environment(self) -> None:
+        """Point the step 3 search providers at this server. Must run before step 3 is imported."""
+        for provider, path in (("PERPLEXITY", "perplexity"), ("YOU", "you"), ("SERP", "serp")):
+            os.environ[f"{provider}_SEARCH_URL"] = f"{self.base_url}/{path}"
+            os.environ.setdefault(f"{provider}_API_KEY", "fake")
+
+    def results(self, provider: str, query: str) -> List[Dict]:
+        words = [word for word in re.findall(r"[a-z]+", query.lower()) if len(word) > 3][:6]
+        domains = ("energy.gov", "nsf.gov", "technologyreview.com", "nature.com", "hbr.org", "example.com")
+        return [{
+            "title": f"{' '.join(words[:3]).title()} report {i + 1}",
+            "snippet": f"Study of {' '.join(words)} shows economic growth and national impact.",
+            "url": f"https://www.{domains[(i + len(provider)) % len(domains)]}/{provider}/{'-'.join(words)}/{i}",
+        } for i in range(self.results_per_query)]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _answer(self, query: str):
+                path = urlparse(self.path).path.strip("/")
+                with server._lock:
+                    server.requests += 1
+                rng = server.config.rng(path, query)
+                time.sleep(server.config.latency(rng))
+                if rng.random() < server.config.failure_rate:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "1")
+                    self.end_headers()
+                    return
+                results = server.results(path, query)
+                if path == "perplexity":
+                    payload = {"results": results}
+                elif path == "you":
+                    payload = {"hits": results}
+                else:
+                    payload = {"organic_results": [{**result, "link": result["url"]} for result in results]}
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                params = parse_qs(urlparse(self.path).query)
+                self._answer(params.get("q", [""])[0])
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self._answer(json.loads(body or b"{}").get("query", ""))
+
+        return Handler
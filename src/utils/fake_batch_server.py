@@ -0,0 +1,167 @@
+"""
+Local stand-in for the Anthropic Message Batches API, for testing bulk mode without network.
+
+Implements just enough of the API for utils/message_batches.py: creating a batch, retrieving
+its status (it ends after a configurable delay), and streaming its results as JSONL. Plain
+(non-streaming) messages.create calls are answered too, for the few requests bulk mode
+still makes live.
+Point the pipeline at it with ANTHROPIC_BASE_URL, e.g.
+
+    python -m utils.fake_batch_server --port 8765
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake python main.py --bulk ../samples/
+"""
+
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+MESSAGES_PATH = "/v1/messages"
+BATCHES_PATH = "/v1/messages/batches"
+
+
+def echo_response(params: Dict) -> str:
+    """Default responder: a deterministic placeholder mentioning the start of the last user message."""
+    content = params["messages"][-1]["content"]
+    if not isinstance(content, str):
+        content = " ".join(block.get("text", "") for block in content)
+    return f"Fake response to: {content.strip()[:80]}"
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeBatchServer:
+    """
+    In-process fake of the Message Batches API.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        respond: Function from a request's params to the response text
+        processing_seconds: How long each batch stays "in_progress"
+    """
+
+    def __init__(self, port: int = 0, respond: Optional[Callable[[Dict], str]] = None,
+                 processing_seconds: float = 1.0):
+        self.respond = respond or echo_response
+        self.processing_seconds = processing_seconds
+        self.batches = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBatchServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _batch_json(self, batch_id: str) -> Dict:
+        batch = self.batches[batch_id]
+        ended = time.time() - batch["created_at"] >= self.processing_seconds
+        total = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended else 0,
+                "errored": 0, "canceled": 0, "expired": 0,
+            },
+            "created_at": _timestamp(batch["created_at"]),
+            "expires_at": _timestamp(batch["created_at"] + timedelta(days=1).total_seconds()),
+            "ended_at": _timestamp(batch["created_at"] + self.processing_seconds) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}{BATCHES_PATH}/{batch_id}/results" if ended else None,
+        }
+
+    def _message_json(self, params: Dict) -> Dict:
+        text = self.respond(params)
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": params["model"],
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": len(json.dumps(params["messages"])) // 4, "output_tokens": len(text) // 4},
+        }
+
+    def _result_line(self, request: Dict) -> str:
+        message = self._message_json(request["params"])
+        return json.dumps({"custom_id": request["custom_id"], "result": {"type": "succeeded", "message": message}})
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: str, content_type: str = "application/json"):
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                path = self.path.split("?")[0].rstrip("/")
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if path == MESSAGES_PATH:
+                    return self._send(200, json.dumps(server._message_json(body)))
+                if path != BATCHES_PATH:
+                    return self._send(404, json.dumps({"type": "error", "error": {"type": "not_found_error", "message": self.path}}))
+                batch_id = f"msgbatch_{uuid.uuid4().hex}"
+                with server._lock:
+                    server.batches[batch_id] = {"requests": body["requests"], "created_at": time.time()}
+                    self._send(200, json.dumps(server._batch_json(batch_id)))
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].rstrip("/")[len(BATCHES_PATH) + 1:].split("/")
+                with server._lock:
+                    batch_id = parts[0]
+                    if not self.path.startswith(BATCHES_PATH) or batch_id not in server.batches:
+                        return self._send(404, json.dumps({"type": "error", "error": {"type": "not_found_error", "message": self.path}}))
+                    if len(parts) == 1:
+                        return self._send(200, json.dumps(server._batch_json(batch_id)))
+                    requests = server.batches[batch_id]["requests"]
+                lines = "\n".join(server._result_line(request) for request in requests)
+                self._send(200, lines + "\n", content_type="application/binary")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake of the Message Batches API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processing-seconds", type=float, default=1.0, help="How long batches stay in progress")
+    args = parser.parse_args()
+
+    server = FakeBatchServer(port=args.port, processing_seconds=args.processing_seconds)
+    print(f"Fake Message Batches API listening on {server.base_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
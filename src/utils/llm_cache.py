@@ -0,0 +1,147 @@
+"""
+Content-addressed cache for Anthropic messages.create responses, shared by all pipeline steps.
+
+Rerunning a step with an identical request (model, system prompt, messages, temperature,
+max_tokens, ...) returns the stored response instead of paying for the call again.
+
+Configuration (environment variables):
+    LLM_CACHE_PATH          SQLite file (default ../output/.cache/llm_responses.sqlite)
+    LLM_CACHE_MAX_ENTRIES   Maximum number of cached responses (default 10000)
+    LLM_CACHE_MAX_MB        Maximum total size of cached responses (default 200)
+    LLM_CACHE_MAX_AGE_DAYS  Responses older than this are refetched (default 30)
+    LLM_CACHE_BYPASS        If "1", always call the API (fresh responses still refresh the cache)
+
+Every call is recorded as an 'llm' span (see utils/metrics.py) with its tokens, cache hit and retries.
+Cache misses go through the shared rate limiter of utils/rate_limiter.py.
+"""
+
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from anthropic.types import Message
+
+from utils.disk_cache import DEFAULT_CACHE_DIR, DiskCache, make_key
+from utils.metrics import span
+from utils.rate_limiter import estimate_input_tokens, rate_limited
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> DiskCache:
+    """Return the process-wide LLM response cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(
+                os.getenv("LLM_CACHE_PATH", os.path.join(DEFAULT_CACHE_DIR, "llm_responses.sqlite")),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024),
+                max_age_seconds=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+            )
+        return _cache
+
+
+def cache_bypassed() -> bool:
+    """Whether the LLM_CACHE_BYPASS flag is set."""
+    return os.getenv("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def request_cache_key(request: Dict) -> str:
+    """Return the cache key of a messages.create request."""
+    return make_key("messages.create", request)
+
+
+def is_cached(request: Dict) -> bool:
+    """Whether a response for this messages.create request is in the cache."""
+    return get_llm_cache().contains(request_cache_key(request))
+
+
+def store_response(request: Dict, response) -> None:
+    """
+    Store a response obtained outside cached_create (e.g. from a message batch), so that
+    the pipeline's own calls for the same request are served from the cache.
+
+    Args:
+        request: Keyword arguments of the messages.create request
+        response: The Message answering it
+    """
+    get_llm_cache().set(request_cache_key(request), response.model_dump(mode="json"))
+
+
+def cached_create(client, bypass: Optional[bool] = None, **request) -> Message:
+    """
+    Drop-in replacement for client.messages.create(**request) backed by the LLM response cache.
+
+    Args:
+        client: Anthropic client used on a cache miss
+        bypass: Skip the cache lookup (defaults to the LLM_CACHE_BYPASS flag). The fresh
+            response is still stored, so bypassing also refreshes stale entries.
+        **request: Keyword arguments for messages.create
+
+    Returns:
+        Message: The cached or freshly created response
+    """
+    cache = get_llm_cache()
+    key = request_cache_key(request)
+
+    with span("llm", model=request.get("model")) as call:
+        if not (cache_bypassed() if bypass is None else bypass):
+            cached = cache.get(key)
+            if cached is not None:
+                call.cache_hit = True
+                return Message.model_validate(cached)
+
+        call.cache_hit = False
+        with rate_limited("anthropic", request.get("model"), estimate_input_tokens(request)) as permit:
+            response = client.messages.create(**request)
+            permit.settle(response.usage.input_tokens)
+        call.record_usage(response)
+        call.bytes = cache.set(key, response.model_dump(mode="json"))
+        return response
+
+
+def cached_stream(client, on_text: Callable[[str], None], bypass: Optional[bool] = None, **request) -> Message:
+    """
+    Streaming counterpart of cached_create: text is handed to on_text as it is generated.
+    Shares cache entries with cached_create; on a hit, the cached text is delivered at once.
+
+    Args:
+        client: Anthropic client used on a cache miss
+        on_text: Called with each piece of generated text, in order
+        bypass: Skip the cache lookup (defaults to the LLM_CACHE_BYPASS flag)
+        **request: Keyword arguments for messages.stream
+
+    Returns:
+        Message: The complete cached or freshly streamed response
+    """
+    cache = get_llm_cache()
+    key = request_cache_key(request)
+
+    with span("llm", model=request.get("model")) as call:
+        if not (cache_bypassed() if bypass is None else bypass):
+            cached = cache.get(key)
+            if cached is not None:
+                call.cache_hit = True
+                response = Message.model_validate(cached)
+                for block in response.content:
+                    if block.type == "text":
+                        on_text(block.text)
+                return response
+
+        call.cache_hit = False
+        with rate_limited("anthropic", request.get("model"), estimate_input_tokens(request)) as permit:
+            with client.messages.stream(**request) as stream:
+                for text in stream.text_stream:
+                    on_text(text)
+                response = stream.get_final_message()
+            permit.settle(response.usage.input_tokens)
+        call.record_usage(response)
+        call.bytes = cache.set(key, response.model_dump(mode="json"))
+        return response
+
+
+def llm_cache_stats() -> Dict[str, int]:
+    """Return the hit/miss counters of the LLM response cache for this process."""
+    return get_llm_cache().stats()
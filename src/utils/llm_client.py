@@ -0,0 +1,90 @@
+"""
+Process-wide Anthropic client shared by all pipeline steps.
+
+A single client keeps one HTTP connection pool alive, so LLM calls reuse keep-alive
+connections instead of paying for a new TLS handshake on every request.
+
+Configuration (environment variables):
+    ANTHROPIC_API_KEY           API key
+    ANTHROPIC_MAX_CONNECTIONS   Maximum open connections in the pool (default 20)
+    ANTHROPIC_MAX_KEEPALIVE     Maximum idle keep-alive connections kept open (default 10)
+    ANTHROPIC_TIMEOUT           Read/write timeout in seconds (default 120)
+    ANTHROPIC_CONNECT_TIMEOUT   Connect timeout in seconds (default 10)
+    ANTHROPIC_MAX_RETRIES       Retries on connection errors, 429 and 5xx responses (default 2)
+"""
+
+import os
+import atexit
+import threading
+
+from utils.metrics import record_http_attempt
+from utils.rate_limiter import record_http_response
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _build_client():
+    import anthropic
+    import httpx
+
+    connect_timeout = float(os.getenv("ANTHROPIC_CONNECT_TIMEOUT", "10"))
+    timeout = float(os.getenv("ANTHROPIC_TIMEOUT", "120"))
+    http_client = anthropic.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("ANTHROPIC_MAX_KEEPALIVE", "10")),
+        ),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        # Count retries of each call (utils/metrics.py) and report 429s to the rate limiter (utils/rate_limiter.py)
+        event_hooks={"request": [record_http_attempt], "response": [record_http_response]},
+    )
+    return anthropic.Anthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        http_client=http_client,
+        max_retries=int(os.getenv("ANTHROPIC_MAX_RETRIES", "2")),
+    )
+
+
+def get_client():
+    """
+    Return the shared Anthropic client, creating it on first use.
+    Worker processes forked from a parent get their own client, since open
+    connections cannot be shared across a fork.
+
+    Returns:
+        anthropic.Anthropic: Client with a pooled keep-alive HTTP connection pool
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = _build_client()
+            _client_pid = os.getpid()
+        return _client
+
+
+def set_client(client) -> None:
+    """
+    Replace the shared client, e.g. with a fake backend for offline runs.
+
+    Args:
+        client: Object exposing the anthropic.Anthropic messages interface
+    """
+    global _client, _client_pid
+    with _client_lock:
+        _client = client
+        _client_pid = os.getpid()
+
+
+def close_client() -> None:
+    """Close the shared client's connection pool. Registered to run at interpreter exit."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid() and hasattr(_client, "close"):
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+atexit.register(close_client)
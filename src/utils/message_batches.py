@@ -0,0 +1,97 @@
+"""
+Submit many messages.create requests through the Message Batches API and collect the results.
+
+Batches trade latency (results can take up to 24 hours) for throughput and cost, which suits
+overnight bulk runs. Submitted batch ids are recorded in a manifest file, so an interrupted
+run resumes polling the same batches instead of paying for them twice.
+"""
+
+import os
+import json
+import time
+from typing import Any, Callable, Dict, Optional
+
+from utils.llm_cache import request_cache_key
+from utils.llm_client import get_client
+
+MAX_REQUESTS_PER_BATCH = 10000
+
+
+def _load_manifest(manifest_path: str, request_set: str):
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("request_set") != request_set:
+        print(f"Ignoring batch manifest {manifest_path}: it was written for a different set of requests")
+        return None
+    return manifest
+
+
+def run_message_batches(requests: Dict[str, Dict], manifest_path: str, poll_interval: float = 60,
+                        on_result: Optional[Callable[[str, Any], None]] = None) -> Dict:
+    """
+    Run requests as message batches: submit (or resume), poll until ended, and collect results.
+    The manifest is only deleted once every result has been handed to on_result, so results
+    that were not stored yet (e.g. after a crash) are collected again from the same batches.
+
+    Args:
+        requests: Mapping of custom_id to messages.create arguments. custom_ids must match
+            ^[a-zA-Z0-9_-]{1,64}$; request_cache_key values qualify.
+        manifest_path: File recording the submitted batch ids, used to resume
+        poll_interval: Seconds between status checks
+        on_result: Called with the custom_id and Message of each request that succeeded,
+            e.g. to store it in the LLM cache
+
+    Returns:
+        Dict: Mapping of custom_id to the resulting Message, for requests that succeeded
+    """
+    if not requests:
+        return {}
+
+    client = get_client()
+    custom_ids = sorted(requests)
+    request_set = request_cache_key({"custom_ids": custom_ids})
+
+    manifest = _load_manifest(manifest_path, request_set)
+    if manifest is None:
+        batch_ids = []
+        for start in range(0, len(custom_ids), MAX_REQUESTS_PER_BATCH):
+            batch = client.messages.batches.create(requests=[
+                {"custom_id": custom_id, "params": requests[custom_id]}
+                for custom_id in custom_ids[start:start + MAX_REQUESTS_PER_BATCH]
+            ])
+            batch_ids.append(batch.id)
+            print(f"Submitted message batch {batch.id}")
+        manifest = {"request_set": request_set, "batch_ids": batch_ids}
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+    else:
+        print(f"Resuming message batches {', '.join(manifest['batch_ids'])}")
+
+    pending = list(manifest["batch_ids"])
+    while pending:
+        for batch_id in list(pending):
+            batch = client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                pending.remove(batch_id)
+            else:
+                counts = batch.request_counts
+                print(f"Message batch {batch_id}: {counts.processing} processing, {counts.succeeded} succeeded")
+        if pending:
+            time.sleep(poll_interval)
+
+    results = {}
+    for batch_id in manifest["batch_ids"]:
+        for entry in client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = entry.result.message
+            else:
+                print(f"Batch request {entry.custom_id} did not succeed: {entry.result.type}")
+
+    if on_result is not None:
+        for custom_id, message in results.items():
+            on_result(custom_id, message)
+    os.remove(manifest_path)
+    return results
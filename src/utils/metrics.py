@@ -0,0 +1,357 @@
+"""
+Instrumentation of pipeline runs: wall time, LLM tokens and cost, cache hits, retries and bytes.
+
+Work is recorded as spans labelled with the document, step, claim and provider it belongs to:
+one span per step (see enter_step), per LLM call (utils/llm_cache.py) and per search
+(utils/search_cache.py). Labels are inherited by nested spans and, through propagate(), by work
+handed to thread pools. Spans are only recorded inside run_metrics(), which main.py opens for
+every statement; at the end of the run it writes the spans and their totals per step and
+provider to metrics_<timestamp>[_<suffix>].json in the statement's output directory, unless
+every step of the run was resumed from a checkpoint (see mark_resumed).
+
+Configuration (environment variables):
+    METRICS_PROMETHEUS_DIR  If set, each run also writes eb2niw_<document>.prom into this
+                            directory, for the node_exporter textfile collector
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# USD per million input and output tokens. Models not listed are counted with no cost
+MODEL_PRICES_PER_MTOK = {
+    "claude-3-opus-20240229": (15.0, 75.0),
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+}
+
+
+@dataclass(slots=True)
+class Span:
+    """
+    One timed unit of work.
+
+    Attributes:
+        name: Kind of work: 'step', 'llm' or 'search'
+        labels: document, step, claim, model/provider... inherited from enclosing spans
+        start: Wall clock time the span started at
+        seconds: Duration
+        input_tokens: LLM input tokens paid for (0 on cache hits)
+        output_tokens: LLM output tokens paid for (0 on cache hits)
+        cache_hit: Whether the result came from a cache, None if not applicable
+        attempts: HTTP requests made, retries included
+        bytes: Size of the response, as stored in the cache
+        error: Exception type, if the work failed
+        resumed: For step spans, whether the step was resumed from its checkpoint instead of run
+    """
+    name: str
+    labels: Dict[str, str]
+    start: float = field(default_factory=time.time)
+    seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_hit: Optional[bool] = None
+    attempts: int = 0
+    bytes: int = 0
+    error: Optional[str] = None
+    resumed: Optional[bool] = None
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.attempts - 1)
+
+    @property
+    def cost_usd(self) -> float:
+        input_price, output_price = MODEL_PRICES_PER_MTOK.get(self.labels.get("model"), (0.0, 0.0))
+        return (self.input_tokens * input_price + self.output_tokens * output_price) / 1e6
+
+    def record_usage(self, response) -> None:
+        """Count the tokens of a Message, as reported in its usage."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.input_tokens += usage.input_tokens or 0
+            self.output_tokens += usage.output_tokens or 0
+
+    def to_json(self) -> Dict:
+        record = {
+            "name": self.name, **self.labels, "start": round(self.start, 3), "seconds": round(self.seconds, 4),
+            "input_tokens": self.input_tokens, "output_tokens": self.output_tokens, "cache_hit": self.cache_hit,
+            "retries": self.retries, "bytes": self.bytes, "error": self.error, "resumed": self.resumed,
+        }
+        return {key: value for key, value in record.items() if value is not None}
+
+
+class RunMetrics:
+    """The spans of one statement's run. Thread-safe."""
+
+    def __init__(self, document: str):
+        self.document = document
+        self.start = time.time()
+        self.seconds = 0.0
+        self.spans: List[Span] = []
+        self._step_span = None
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def did_work(self) -> bool:
+        """Whether the run did anything beyond resuming steps from their checkpoints."""
+        with self._lock:
+            spans = list(self.spans)
+        return any(span.name != "step" or not span.resumed for span in spans)
+
+    def summary(self) -> Dict:
+        """Return the run's totals overall, per step and per model/provider, and its spans."""
+        with self._lock:
+            spans = list(self.spans)
+        calls = [span for span in spans if span.name != "step"]
+        steps = {}
+        for span in spans:
+            if span.name == "step":
+                steps.setdefault(span.labels["step"], _totals([]))["wall_seconds"] = round(span.seconds, 3)
+        for step in {span.labels.get("step") for span in calls}:
+            steps.setdefault(step, _totals([])).update(_totals([span for span in calls if span.labels.get("step") == step]))
+        providers = {}
+        for span in calls:
+            providers.setdefault(_provider(span), []).append(span)
+        return {
+            "document": self.document,
+            "started_at": datetime.fromtimestamp(self.start).isoformat(timespec="seconds"),
+            "wall_seconds": round(self.seconds, 3),
+            "totals": _totals(calls),
+            "steps": steps,
+            "providers": {provider: _totals(provider_spans) for provider, provider_spans in sorted(providers.items())},
+            "spans": [span.to_json() for span in spans],
+        }
+
+
+def _provider(span: Span) -> str:
+    return span.labels.get("model") or span.labels.get("provider") or span.name
+
+
+def _totals(spans: List[Span]) -> Dict:
+    # Call seconds are summed over concurrent calls, so they can exceed the wall time of a step
+    return {
+        "calls": len(spans),
+        "cache_hits": sum(1 for span in spans if span.cache_hit),
+        "call_seconds": round(sum(span.seconds for span in spans), 3),
+        "input_tokens": sum(span.input_tokens for span in spans),
+        "output_tokens": sum(span.output_tokens for span in spans),
+        "cost_usd": round(sum(span.cost_usd for span in spans), 6),
+        "retries": sum(span.retries for span in spans),
+        "bytes": sum(span.bytes for span in spans),
+        "errors": sum(1 for span in spans if span.error),
+    }
+
+
+class _Context(NamedTuple):
+    run: Optional[RunMetrics]
+    labels: Dict[str, str]
+    span: Optional[Span]
+
+
+_context = contextvars.ContextVar("metrics_context", default=_Context(None, {}, None))
+
+
+@contextmanager
+def run_metrics(document: str, output_dir: Optional[str] = None, suffix: str = ""):
+    """
+    Record the spans of one statement's run; yields the RunMetrics. Ends the last step span on exit.
+
+    Args:
+        document: Document name, added as a label to every span
+        output_dir: If set, the run's metrics are written there on exit, even if the run fails,
+            unless it did no work (see write_run_metrics)
+        suffix: Added to the name of the metrics file, e.g. the last step of a partial run
+    """
+    run = RunMetrics(document)
+    token = _context.set(_Context(run, {"document": document}, None))
+    try:
+        yield run
+    finally:
+        _end_step(run)
+        run.seconds = time.time() - run.start
+        _context.reset(token)
+        if output_dir is not None and run.did_work:
+            write_run_metrics(run, output_dir, suffix)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """
+    Time the enclosed work as a span; yields the Span so the caller can add tokens, cache hits etc.
+    Outside run_metrics() the span is not recorded.
+
+    Args:
+        name: Kind of work, e.g. 'llm' or 'search'
+        **labels: Labels added to those of the enclosing spans, e.g. model, provider or claim
+    """
+    context = _context.get()
+    current = Span(name, {**context.labels, **{key: str(value) for key, value in labels.items()}})
+    token = _context.set(_Context(context.run, current.labels, current))
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        _context.reset(token)
+        if context.run is not None:
+            context.run.add(current)
+
+
+@contextmanager
+def labelled(**labels):
+    """Add labels, e.g. the claim being processed, to the spans started in the enclosed work."""
+    context = _context.get()
+    token = _context.set(context._replace(labels={**context.labels, **{key: str(value) for key, value in labels.items()}}))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def enter_step(step: str) -> None:
+    """
+    Start the span of a pipeline step in the current run, ending the previous step's span.
+    Work started afterwards in this context is labelled with the step.
+    """
+    context = _context.get()
+    if context.run is None:
+        return
+    _end_step(context.run)
+    labels = {**context.labels, "step": step}
+    context.run._step_span = (Span("step", labels), time.perf_counter())
+    _context.set(_Context(context.run, labels, context.span))
+
+
+def mark_resumed() -> None:
+    """Mark the current step as resumed from its checkpoint rather than run."""
+    run = _context.get().run
+    if run is not None and run._step_span is not None:
+        run._step_span[0].resumed = True
+
+
+def _end_step(run: RunMetrics) -> None:
+    if run._step_span is not None:
+        step_span, start = run._step_span
+        step_span.seconds = time.perf_counter() - start
+        run.add(step_span)
+        run._step_span = None
+
+
+def propagate(fn: Callable, **labels) -> Callable:
+    """
+    Wrap fn so that it runs with the current run and labels (plus labels) in whatever thread
+    calls it, e.g. fn submitted to a thread pool.
+    """
+    context = _context.get()
+    if labels:
+        context = context._replace(labels={**context.labels, **labels})
+
+    def run_in_context(*args, **kwargs):
+        token = _context.set(context)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _context.reset(token)
+    return run_in_context
+
+
+def record_http_attempt(*args, **kwargs) -> None:
+    """HTTP client hook (httpx or requests): count a request, retries included, against the current span."""
+    current = _context.get().span
+    if current is not None:
+        current.attempts += 1
+
+
+def write_run_metrics(run: RunMetrics, output_dir: str, suffix: str = "") -> str:
+    """
+    Write a run's summary to metrics_<timestamp>[_<suffix>].json in output_dir, and its Prometheus
+    textfile if METRICS_PROMETHEUS_DIR is set. The timestamp has microseconds, so runs in quick
+    succession (e.g. the stages of bulk mode) get a file each.
+
+    Args:
+        run: The finished run
+        output_dir: Directory to write the JSON file to
+        suffix: Added to the file name, e.g. the last step of a partial run
+
+    Returns:
+        str: Path of the metrics JSON file
+    """
+    summary = run.summary()
+    name = "_".join(part for part in ("metrics", datetime.fromtimestamp(run.start).strftime("%Y%m%d_%H%M%S_%f"), suffix) if part)
+    path = os.path.join(output_dir, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    prometheus_dir = os.getenv("METRICS_PROMETHEUS_DIR")
+    if prometheus_dir:
+        os.makedirs(prometheus_dir, exist_ok=True)
+        _write_atomic(os.path.join(prometheus_dir, f"eb2niw_{run.document}.prom"), prometheus_text(run))
+    return path
+
+
+def prometheus_text(run: RunMetrics) -> str:
+    """Return the totals of a run per step and model/provider in the Prometheus text exposition format."""
+    groups = {}
+    step_seconds = {}
+    for span in list(run.spans):
+        step = span.labels.get("step", "")
+        if span.name == "step":
+            step_seconds[step] = span.seconds
+        else:
+            groups.setdefault((step, span.name, _provider(span)), []).append(span)
+
+    metrics = {
+        "eb2niw_run_step_seconds": ("Wall time of each step in the last run", []),
+        "eb2niw_run_calls": ("LLM calls and searches in the last run", []),
+        "eb2niw_run_cache_hits": ("Calls answered from a cache in the last run", []),
+        "eb2niw_run_tokens": ("LLM tokens paid for in the last run", []),
+        "eb2niw_run_cost_usd": ("Estimated LLM cost of the last run", []),
+        "eb2niw_run_retries": ("HTTP retries in the last run", []),
+        "eb2niw_run_response_bytes": ("Response bytes received in the last run", []),
+    }
+    document = _escape(run.document)
+    for step, seconds in sorted(step_seconds.items()):
+        metrics["eb2niw_run_step_seconds"][1].append((f'document="{document}",step="{_escape(step)}"', round(seconds, 6)))
+    for (step, kind, provider), spans in sorted(groups.items()):
+        labels = f'document="{document}",step="{_escape(step)}",kind="{kind}",provider="{_escape(provider)}"'
+        totals = _totals(spans)
+        metrics["eb2niw_run_calls"][1].append((labels, totals["calls"]))
+        metrics["eb2niw_run_cache_hits"][1].append((labels, totals["cache_hits"]))
+        metrics["eb2niw_run_cost_usd"][1].append((labels, totals["cost_usd"]))
+        metrics["eb2niw_run_retries"][1].append((labels, totals["retries"]))
+        metrics["eb2niw_run_response_bytes"][1].append((labels, totals["bytes"]))
+        if kind == "llm":
+            metrics["eb2niw_run_tokens"][1].append((labels + ',direction="input"', totals["input_tokens"]))
+            metrics["eb2niw_run_tokens"][1].append((labels + ',direction="output"', totals["output_tokens"]))
+
+    lines = []
+    for name, (help_text, samples) in metrics.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{{{labels}}} {value}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: str, text: str) -> None:
+    # The textfile collector may read at any time, so the file is replaced rather than rewritten
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,175 @@
+"""
+Local index of paper metadata (citation metrics) resolved from Semantic Scholar.
+
+Papers are stored in SQLite with DOI, arXiv ID and normalized title indexes, so a paper cited
+by several applicants is fetched once and later lookups are local reads. References that
+Semantic Scholar does not know are remembered too, so they are not retried on every run.
+
+Configuration (environment variables):
+    PAPER_INDEX_PATH            SQLite file (default ../output/.cache/papers.sqlite)
+    PAPER_INDEX_MAX_AGE_DAYS    Entries older than this are refetched, as citation counts change (default 30)
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.disk_cache import DEFAULT_CACHE_DIR, SqliteConnections
+
+# A reference to a paper: ('doi', '10.1000/xyz'), ('arxiv', '2106.01234') or ('title', 'Some paper title')
+PaperRef = Tuple[str, str]
+
+
+def normalize_title(title: str) -> str:
+    """Lowercase a title and drop punctuation, so titles quoted slightly differently match."""
+    return re.sub(r"[^a-z0-9]+", " ", title.lower()).strip()
+
+
+def normalize_ref(ref: PaperRef) -> PaperRef:
+    kind, value = ref
+    if kind == "title":
+        return kind, normalize_title(value)
+    return kind, value.strip().lower()
+
+
+class PaperIndex:
+    """
+    Paper metadata in a single SQLite file, looked up by DOI, arXiv ID or title.
+    Safe to share between threads (one connection per thread) and processes (WAL mode).
+    """
+
+    def __init__(self, path: str, max_age_seconds: Optional[float] = None):
+        """
+        Args:
+            path: Path of the SQLite file, created if missing
+            max_age_seconds: Entries older than this are treated as missing (None = never expire)
+        """
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._db = SqliteConnections(path)
+        with self._db.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS papers (
+                    paper_id TEXT PRIMARY KEY,
+                    doi TEXT,
+                    arxiv_id TEXT,
+                    title_norm TEXT,
+                    metadata TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_papers_doi ON papers (doi)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_papers_arxiv_id ON papers (arxiv_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_papers_title_norm ON papers (title_norm)")
+            # References that resolved to a paper without matching its indexed columns, e.g. a quoted title
+            # that differs slightly from the paper's own title
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS aliases (
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    paper_id TEXT NOT NULL,
+                    PRIMARY KEY (kind, value)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS missing (
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (kind, value)
+                )
+            """)
+
+    def _min_fetched_at(self) -> float:
+        return 0.0 if self.max_age_seconds is None else time.time() - self.max_age_seconds
+
+    def lookup(self, ref: PaperRef) -> Optional[Dict]:
+        """Return the indexed metadata of the referenced paper, or None if it is not indexed (or stale)."""
+        kind, value = normalize_ref(ref)
+        column = {"doi": "doi", "arxiv": "arxiv_id", "title": "title_norm"}[kind]
+        conn = self._db.connect()
+        row = conn.execute(
+            f"SELECT metadata FROM papers WHERE {column} = ? AND fetched_at >= ? ORDER BY fetched_at DESC LIMIT 1",
+            (value, self._min_fetched_at())
+        ).fetchone()
+        if row is None:
+            row = conn.execute(
+                "SELECT p.metadata FROM aliases a JOIN papers p ON p.paper_id = a.paper_id "
+                "WHERE a.kind = ? AND a.value = ? AND p.fetched_at >= ?",
+                (kind, value, self._min_fetched_at())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def is_missing(self, ref: PaperRef) -> bool:
+        """Whether the reference was recently looked up and not found."""
+        kind, value = normalize_ref(ref)
+        row = self._db.connect().execute(
+            "SELECT 1 FROM missing WHERE kind = ? AND value = ? AND fetched_at >= ?",
+            (kind, value, self._min_fetched_at())
+        ).fetchone()
+        return row is not None
+
+    def unresolved(self, refs: Iterable[PaperRef]) -> List[PaperRef]:
+        """Return the references that are neither indexed nor known to be missing, without duplicates."""
+        seen = set()
+        pending = []
+        for ref in refs:
+            key = normalize_ref(ref)
+            if key not in seen and self.lookup(ref) is None and not self.is_missing(ref):
+                seen.add(key)
+                pending.append(ref)
+        return pending
+
+    def add_papers(self, papers: List[Dict], aliases: Optional[List[Tuple[PaperRef, str]]] = None) -> None:
+        """
+        Insert or refresh papers.
+
+        Args:
+            papers: Metadata dicts with 'paper_id' and optionally 'doi', 'arxiv_id' and 'title'
+            aliases: (reference, paper_id) pairs of the references the papers were resolved from
+        """
+        now = time.time()
+        with self._db.connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO papers (paper_id, doi, arxiv_id, title_norm, metadata, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(
+                    paper["paper_id"],
+                    (paper.get("doi") or "").lower() or None,
+                    (paper.get("arxiv_id") or "").lower() or None,
+                    normalize_title(paper["title"]) if paper.get("title") else None,
+                    json.dumps(paper),
+                    now,
+                ) for paper in papers]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO aliases (kind, value, paper_id) VALUES (?, ?, ?)",
+                [(*normalize_ref(ref), paper_id) for ref, paper_id in aliases or []]
+            )
+
+    def add_missing(self, refs: List[PaperRef]) -> None:
+        """Remember references that could not be resolved."""
+        now = time.time()
+        with self._db.connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO missing (kind, value, fetched_at) VALUES (?, ?, ?)",
+                [(*normalize_ref(ref), now) for ref in refs]
+            )
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_paper_index() -> PaperIndex:
+    """Return the process-wide paper index, creating it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PaperIndex(
+                os.getenv("PAPER_INDEX_PATH", os.path.join(DEFAULT_CACHE_DIR, "papers.sqlite")),
+                max_age_seconds=float(os.getenv("PAPER_INDEX_MAX_AGE_DAYS", "30")) * 24 * 3600,
+            )
+        return _index
@@ -0,0 +1,203 @@
+"""
+BM25 retrieval over a local corpus of policy documents (administration priorities, executive
+orders, agency strategies, ...).
+
+Documents are split into passages and indexed once into compressed sparse arrays: for every
+term, the passages containing it and their precomputed BM25 weights. The arrays are saved as
+.npy files and loaded memory-mapped, so looking up the top passages for a claim only touches
+the postings of the claim's terms, however large the corpus grows. The index is rebuilt when
+files in the corpus directory are added, removed or changed.
+
+Configuration (environment variables):
+    POLICY_CORPUS_DIR   Directory of .txt/.md policy documents (default ../policy_corpus)
+    POLICY_INDEX_DIR    Directory of the built index (default ../output/.cache/policy_index)
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+
+from utils.disk_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_CORPUS_DIR = "../policy_corpus"
+CORPUS_EXTENSIONS = (".txt", ".md")
+PASSAGE_MAX_CHARS = 800 # Paragraphs are merged into passages up to this size
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEX_FORMAT_VERSION = 1
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have he her his how i if in into is it its
+may more most must no not of on or our over she so such than that the their them then there these they
+this those to under up us was we were what when where which while who will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of text, without stopwords."""
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS and len(word) > 1]
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_MAX_CHARS) -> List[str]:
+    """Split a document into passages of whole paragraphs, merging short paragraphs up to max_chars."""
+    passages, current = [], ""
+    for paragraph in (p.strip() for p in re.split(r"\n\s*\n", text)):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+def _corpus_files(corpus_dir: str) -> List[str]:
+    if not os.path.isdir(corpus_dir):
+        raise FileNotFoundError(f"Policy corpus directory not found: {corpus_dir}")
+    return sorted(
+        os.path.relpath(os.path.join(root, name), corpus_dir)
+        for root, _, names in os.walk(corpus_dir)
+        for name in names if name.endswith(CORPUS_EXTENSIONS)
+    )
+
+
+def corpus_fingerprint(corpus_dir: str) -> str:
+    """Hash of the corpus' file names, sizes and modification times; changes whenever a document does."""
+    digest = hashlib.sha256(str(INDEX_FORMAT_VERSION).encode())
+    for name in _corpus_files(corpus_dir):
+        stat = os.stat(os.path.join(corpus_dir, name))
+        digest.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def build_policy_index(corpus_dir: str, index_dir: str) -> None:
+    """
+    Build the BM25 index of a corpus directory and save it to index_dir.
+
+    Args:
+        corpus_dir: Directory of .txt/.md documents, searched recursively
+        index_dir: Output directory, created if missing
+    """
+    fingerprint = corpus_fingerprint(corpus_dir)
+    passages = []
+    for name in _corpus_files(corpus_dir):
+        with open(os.path.join(corpus_dir, name), encoding="utf-8") as f:
+            passages.extend({"document": name, "text": passage} for passage in split_passages(f.read()))
+
+    vocabulary = {}
+    term_counts = [Counter(tokenize(passage["text"])) for passage in passages]
+    lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float64)
+    average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+
+    # Postings as (term, passage, term frequency) triples, then sorted by term into CSR arrays
+    terms, passage_ids, frequencies = [], [], []
+    for passage_id, counts in enumerate(term_counts):
+        for term, count in counts.items():
+            terms.append(vocabulary.setdefault(term, len(vocabulary)))
+            passage_ids.append(passage_id)
+            frequencies.append(count)
+    terms = np.array(terms, dtype=np.int64)
+    passage_ids = np.array(passage_ids, dtype=np.int32)
+    frequencies = np.array(frequencies, dtype=np.float64)
+
+    order = np.argsort(terms, kind="stable")
+    terms, passage_ids, frequencies = terms[order], passage_ids[order], frequencies[order]
+    document_frequency = np.bincount(terms, minlength=len(vocabulary))
+    indptr = np.concatenate([[0], np.cumsum(document_frequency)]).astype(np.int64)
+
+    idf = np.log(1 + (len(passages) - document_frequency + 0.5) / (document_frequency + 0.5))
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[passage_ids] / average_length)
+    weights = (idf[terms] * frequencies * (BM25_K1 + 1) / (frequencies + length_norm)).astype(np.float32)
+
+    # Files are written to a private directory and moved into place, since batch workers may build concurrently
+    build_dir = f"{index_dir.rstrip(os.sep)}.build-{os.getpid()}"
+    os.makedirs(build_dir, exist_ok=True)
+    np.save(os.path.join(build_dir, "indptr.npy"), indptr)
+    np.save(os.path.join(build_dir, "passage_ids.npy"), passage_ids)
+    np.save(os.path.join(build_dir, "weights.npy"), weights)
+    with open(os.path.join(build_dir, "vocabulary.json"), "w") as f:
+        json.dump(vocabulary, f)
+    with open(os.path.join(build_dir, "passages.json"), "w") as f:
+        json.dump(passages, f)
+    with open(os.path.join(build_dir, "manifest.json"), "w") as f:
+        json.dump({"fingerprint": fingerprint, "passages": len(passages), "terms": len(vocabulary)}, f)
+
+    os.makedirs(index_dir, exist_ok=True)
+    # Manifest last: an index without a matching manifest is rebuilt
+    for name in ("indptr.npy", "passage_ids.npy", "weights.npy", "vocabulary.json", "passages.json", "manifest.json"):
+        os.replace(os.path.join(build_dir, name), os.path.join(index_dir, name))
+    os.rmdir(build_dir)
+
+
+class PolicyIndex:
+    """A built BM25 policy index, with its postings arrays memory-mapped."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "manifest.json")) as f:
+            self.fingerprint = json.load(f)["fingerprint"]
+        with open(os.path.join(index_dir, "vocabulary.json")) as f:
+            self.vocabulary = json.load(f)
+        with open(os.path.join(index_dir, "passages.json")) as f:
+            self.passages = json.load(f)
+        self.indptr = np.load(os.path.join(index_dir, "indptr.npy"), mmap_mode="r")
+        self.passage_ids = np.load(os.path.join(index_dir, "passage_ids.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(index_dir, "weights.npy"), mmap_mode="r")
+
+    def search(self, query: str, k: int = 4) -> List[Dict]:
+        """
+        Return the k passages scoring highest for query.
+
+        Args:
+            query: Query text, e.g. a claim
+            k: Number of passages
+
+        Returns:
+            List of {'document', 'text', 'id', 'score'} dicts by descending score; passages that share
+            no term with the query are never returned
+        """
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        if not term_ids:
+            return []
+        spans = [(self.indptr[t], self.indptr[t + 1]) for t in sorted(term_ids)]
+        ids = np.concatenate([self.passage_ids[start:end] for start, end in spans])
+        weights = np.concatenate([self.weights[start:end] for start, end in spans])
+        scores = np.bincount(ids, weights=weights, minlength=len(self.passages))
+
+        k = min(k, int(np.count_nonzero(scores)))
+        top = np.argpartition(-scores, k - 1)[:k] if k else []
+        top = sorted(top, key=lambda i: (-scores[i], i))
+        return [{**self.passages[i], "id": int(i), "score": float(scores[i])} for i in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_policy_index() -> PolicyIndex:
+    """
+    Return the process-wide policy index, building it first if the corpus changed since it was built.
+    """
+    global _index
+    corpus_dir = os.getenv("POLICY_CORPUS_DIR", DEFAULT_CORPUS_DIR)
+    index_dir = os.getenv("POLICY_INDEX_DIR", os.path.join(DEFAULT_CACHE_DIR, "policy_index"))
+    with _index_lock:
+        fingerprint = corpus_fingerprint(corpus_dir)
+        if _index is None or _index.fingerprint != fingerprint:
+            try:
+                with open(os.path.join(index_dir, "manifest.json")) as f:
+                    current = json.load(f)["fingerprint"] == fingerprint
+            except (OSError, ValueError, KeyError):
+                current = False
+            if not current:
+                print(f"Building policy index from {corpus_dir}")
+                build_policy_index(corpus_dir, index_dir)
+            _index = PolicyIndex(index_dir)
+        return _index
@@ -0,0 +1,358 @@
+"""
+Rate limiting of outbound API calls (Anthropic and search providers), shared by all threads and
+worker processes.
+
+Every provider (and, for Anthropic, every model) has token buckets in one SQLite file: requests
+per minute, and for Anthropic also input tokens per minute. Concurrent claims, steps and batch
+workers draw from the same budget, so they queue locally instead of sending bursts that come
+back as 429 storms. A 429/529 answer pauses its bucket for every process until the time given
+by its Retry-After header.
+On top of the buckets, the number of calls in flight per provider and model adapts AIMD-style:
+it grows by one per window of successful calls, and halves after a 429 (seen by any process) or
+a latency spike.
+
+Configuration (environment variables):
+    RATE_LIMIT_PATH             SQLite file (default ../output/.cache/rate_limits.sqlite)
+    RATE_LIMIT_DISABLED         If "1", calls are not limited
+    RATE_LIMIT_MAX_CONCURRENCY  Upper bound of the calls in flight per provider and model, per process (default 16)
+    ANTHROPIC_RPM               Requests per minute per model (default 50)
+    ANTHROPIC_INPUT_TPM         Input tokens per minute per model (default 40000)
+    SEARCH_RPM                  Requests per minute per search provider (default 60)
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from utils.disk_cache import DEFAULT_CACHE_DIR, SqliteConnections
+
+THROTTLE_STATUSES = (429, 529) # Rate limited, overloaded
+DEFAULT_RETRY_AFTER_SECONDS = 1.0 # Pause after a throttled answer without a Retry-After header
+MAX_WAIT_SECONDS = 5.0 # Longest single sleep before a bucket is checked again
+LATENCY_SPIKE_FACTOR = 4.0 # A call this many times slower than the recent average counts as congestion
+LATENCY_EWMA_WEIGHT = 0.2
+LATENCY_MIN_SAMPLES = 5 # Calls observed before latency spikes are acted on
+LATENCY_SPIKE_MIN_SECONDS = 1.0 # Calls faster than this never count as spikes
+
+
+def estimate_input_tokens(request: Dict) -> int:
+    """Estimate the input tokens of a messages.create request, at ~4 characters per token."""
+    return len(json.dumps([request.get("system"), request.get("messages")], default=str)) // 4 + 1
+
+
+def retry_after_seconds(headers) -> float:
+    """Return the pause requested by a throttled response's retry-after-ms or Retry-After header."""
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return DEFAULT_RETRY_AFTER_SECONDS
+
+
+class TokenBucketStore:
+    """
+    Token buckets in a SQLite file, so that every process using the file shares them.
+    Safe to share between threads (one connection per thread) and processes (WAL mode).
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Path of the SQLite file, created if missing
+        """
+        self.path = path
+        self._db = SqliteConnections(path, isolation_level=None) # Transactions are explicit
+        conn = self._db.connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0,
+                throttled_at REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._db.connect()
+        conn.execute("BEGIN IMMEDIATE") # Read-modify-write of a bucket must not interleave with other processes
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take(self, name: str, amount: float, per_second: float, capacity: float) -> Tuple[float, float]:
+        """
+        Take amount tokens from a bucket if it has them.
+
+        Args:
+            name: Bucket name
+            amount: Tokens to take (at most capacity)
+            per_second: Refill rate
+            capacity: Bucket size, i.e. the largest burst
+
+        Returns:
+            tuple: (seconds to wait before trying again, 0 if the tokens were taken;
+                    time the bucket was last throttled)
+        """
+        amount = min(amount, capacity)
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT tokens, updated_at, blocked_until, throttled_at FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            tokens, updated_at, blocked_until, throttled_at = row if row is not None else (capacity, now, 0.0, 0.0)
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * per_second)
+            wait = max(0.0, blocked_until - now)
+            if not wait:
+                if tokens >= amount:
+                    tokens -= amount
+                else:
+                    wait = (amount - tokens) / per_second
+            conn.execute("""
+                INSERT INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            """, (name, tokens, now))
+        return wait, throttled_at
+
+    def adjust(self, name: str, amount: float) -> None:
+        """Give back (positive) or take (negative) tokens, e.g. once a request's actual size is known."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE buckets SET tokens = tokens + ? WHERE name = ?", (amount, name))
+
+    def block(self, name: str, seconds: float) -> None:
+        """Pause a bucket for every process for the given number of seconds, and mark it throttled."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("""
+                INSERT INTO buckets (name, tokens, updated_at, blocked_until, throttled_at) VALUES (?, 0, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    blocked_until = MAX(blocked_until, excluded.blocked_until), throttled_at = excluded.throttled_at
+            """, (name, now, now + seconds, now))
+
+
+class AdaptiveConcurrency:
+    """
+    Bounds the calls in flight, with a limit that adapts AIMD-style: +1 per limit successful calls,
+    halved on congestion (at most once per recent average latency, so one burst of 429s counts once).
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.latency = None # Moving average of call seconds
+        self.samples = 0
+        self.throttle_seen = time.time() # Last shared throttle time acted on; earlier runs' throttles are ignored
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, seconds: Optional[float], congested: bool = False) -> None:
+        """End a call that took seconds (None if it failed), and adapt the limit."""
+        with self._condition:
+            self.in_flight -= 1
+            if seconds is not None:
+                spike = (self.samples >= LATENCY_MIN_SAMPLES and seconds > LATENCY_SPIKE_MIN_SECONDS
+                         and seconds > LATENCY_SPIKE_FACTOR * self.latency)
+                self.latency = seconds if self.latency is None else (1 - LATENCY_EWMA_WEIGHT) * self.latency + LATENCY_EWMA_WEIGHT * seconds
+                self.samples += 1
+                congested = congested or spike
+            if congested:
+                self._decrease()
+            elif seconds is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def congestion(self) -> None:
+        """Halve the limit after congestion seen elsewhere, e.g. a 429 in another process."""
+        with self._condition:
+            self._decrease()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._decreased_at >= (self.latency or DEFAULT_RETRY_AFTER_SECONDS):
+            self.limit = max(self.minimum, self.limit / 2)
+            self._decreased_at = now
+
+
+class Permit:
+    """A rate-limited call in progress, see RateLimiter.limit."""
+
+    def __init__(self, limiter: "RateLimiter", key: str, token_bucket: Optional[Tuple[str, float]] = None):
+        self.limiter = limiter
+        self.key = key
+        self.token_bucket = token_bucket # (bucket name, tokens taken) of the call's token budget
+        self.throttled = False
+
+    def throttle(self, retry_after: float) -> None:
+        """Record a 429/529 answer: pause the provider for every process for retry_after seconds."""
+        self.throttled = True
+        self.limiter.store.block(f"{self.key}:requests", retry_after)
+
+    def settle(self, actual_tokens: int) -> None:
+        """Correct the token bucket by the difference between the estimated and actual input tokens."""
+        if self.token_bucket is not None and actual_tokens:
+            name, taken = self.token_bucket
+            self.limiter.store.adjust(name, taken - actual_tokens)
+
+
+class _NoPermit:
+    def throttle(self, retry_after: float) -> None:
+        pass
+
+    def settle(self, actual_tokens: int) -> None:
+        pass
+
+
+_current_permit = contextvars.ContextVar("rate_limit_permit", default=None)
+
+
+class RateLimiter:
+    """
+    Token buckets shared across processes plus per-process adaptive concurrency, per provider and model.
+
+    Args:
+        store: Shared token buckets
+        limits: Per provider, (requests per minute, input tokens per minute or None)
+        max_concurrency: Upper bound of the calls in flight per provider and model
+    """
+
+    def __init__(self, store: TokenBucketStore, limits: Dict[str, Tuple[float, Optional[float]]], max_concurrency: int = 16):
+        self.store = store
+        self.limits = limits
+        self.max_concurrency = max_concurrency
+        self._concurrency = {}
+        self._lock = threading.Lock()
+
+    def _get_concurrency(self, key: str) -> AdaptiveConcurrency:
+        with self._lock:
+            if key not in self._concurrency:
+                self._concurrency[key] = AdaptiveConcurrency(self.max_concurrency)
+            return self._concurrency[key]
+
+    def _wait_for(self, name: str, amount: float, per_minute: float, concurrency: AdaptiveConcurrency) -> None:
+        while True:
+            wait, throttled_at = self.store.take(name, amount, per_minute / 60, per_minute)
+            if throttled_at > concurrency.throttle_seen:
+                concurrency.throttle_seen = throttled_at
+                concurrency.congestion()
+            if not wait:
+                return
+            time.sleep(min(wait, MAX_WAIT_SECONDS))
+
+    @contextmanager
+    def limit(self, provider: str, model: Optional[str] = None, tokens: int = 0):
+        """
+        Wait until a call to provider (and model) is allowed, and hold its concurrency slot for the
+        enclosed block; yields a Permit. 429/529 answers are recorded from the HTTP client hook
+        (record_http_response) or, failing that, from the exception the block raises.
+
+        Args:
+            provider: Provider name, e.g. 'anthropic' or 'serp'
+            model: Model of the call, for providers limited per model
+            tokens: Estimated input tokens of the call, for providers with a token limit
+        """
+        requests_per_minute, tokens_per_minute = self.limits.get(provider, self.limits["search"])
+        key = f"{provider}:{model}" if model else provider
+        concurrency = self._get_concurrency(key)
+        concurrency.acquire()
+        permit, seconds = None, None
+        try:
+            self._wait_for(f"{key}:requests", 1, requests_per_minute, concurrency)
+            token_bucket = None
+            if tokens_per_minute and tokens:
+                token_bucket = (f"{key}:input_tokens", min(tokens, tokens_per_minute))
+                self._wait_for(token_bucket[0], token_bucket[1], tokens_per_minute, concurrency)
+            permit = Permit(self, key, token_bucket)
+            context_token = _current_permit.set(permit)
+            start = time.monotonic()
+            try:
+                yield permit
+                seconds = time.monotonic() - start
+            except Exception as e:
+                response = getattr(e, "response", None)
+                status = getattr(e, "status_code", None) or getattr(response, "status_code", None)
+                if status in THROTTLE_STATUSES and not permit.throttled:
+                    permit.throttle(retry_after_seconds(getattr(response, "headers", None) or {}))
+                raise
+            finally:
+                _current_permit.reset(context_token)
+        finally:
+            concurrency.release(seconds, congested=permit is not None and permit.throttled)
+
+
+def record_http_response(response, *args, **kwargs) -> None:
+    """HTTP client hook (httpx or requests): on a 429/529 answer, pause the current call's provider, honouring Retry-After."""
+    permit = _current_permit.get()
+    if permit is not None and response.status_code in THROTTLE_STATUSES:
+        permit.throttle(retry_after_seconds(response.headers))
+
+
+def record_throttle(retry_after: float = DEFAULT_RETRY_AFTER_SECONDS) -> None:
+    """
+    For clients that hide the HTTP response (e.g. the semanticscholar package): record a 429
+    answer to the current call, pausing its provider for retry_after seconds.
+    """
+    permit = _current_permit.get()
+    if permit is not None and not permit.throttled:
+        permit.throttle(retry_after)
+
+
+def rate_limits_disabled() -> bool:
+    """Whether the RATE_LIMIT_DISABLED flag is set."""
+    return os.getenv("RATE_LIMIT_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter, creating it on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                TokenBucketStore(os.getenv("RATE_LIMIT_PATH", os.path.join(DEFAULT_CACHE_DIR, "rate_limits.sqlite"))),
+                limits={
+                    "anthropic": (float(os.getenv("ANTHROPIC_RPM", "50")), float(os.getenv("ANTHROPIC_INPUT_TPM", "40000"))),
+                    "search": (float(os.getenv("SEARCH_RPM", "60")), None),
+                },
+                max_concurrency=int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "16")),
+            )
+        return _limiter
+
+
+@contextmanager
+def rate_limited(provider: str, model: Optional[str] = None, tokens: int = 0):
+    """
+    Run the enclosed call under the process-wide rate limiter (see RateLimiter.limit); yields a Permit.
+    Does nothing if RATE_LIMIT_DISABLED is set.
+    """
+    if rate_limits_disabled():
+        yield _NoPermit()
+        return
+    with get_rate_limiter().limit(provider, model, tokens) as permit:
+        yield permit
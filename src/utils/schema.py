@@ -0,0 +1,148 @@
+"""
+Typed records passed between the pipeline steps, and the JSON encoding of step states.
+
+Claims (step 2) and evidence items (steps 3-5) are slotted dataclasses, so the many evidence
+items of a batch run stay small in memory and are read by attribute. State files are written
+and read with one encoder (dumps/loads), which encodes these records and SDK objects such as
+Anthropic content blocks natively, and uses orjson when it is installed.
+
+Encoded forms:
+    Claim       [claim_type, text, initial_evidence], the layout of the claim tuples it replaces
+    Evidence    Dict of its fields, without the ones that are unset (None)
+"""
+
+import json
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@dataclass(slots=True)
+class Claim:
+    """
+    A claim extracted from a personal statement.
+
+    Attributes:
+        claim_type: 'background' or 'importance'
+        text: The claim, as stated by the applicant
+        initial_evidence: Supporting text the statement gives for the claim
+    """
+    claim_type: str
+    text: str
+    initial_evidence: str = ""
+
+    def to_json(self) -> List[str]:
+        return [self.claim_type, self.text, self.initial_evidence]
+
+    @classmethod
+    def from_json(cls, value) -> "Claim":
+        return value if isinstance(value, cls) else cls(*value)
+
+
+@dataclass(slots=True)
+class Evidence:
+    """
+    One piece of evidence for a claim: a search result, a priority analysis or a placeholder.
+
+    Attributes:
+        source: Where the evidence comes from (search provider, analysis or 'PLACEHOLDER')
+        snippet: The evidence text
+        title: Title of the page or document
+        url: Link to the page or document
+        relevance: Why the evidence matters, for evidence written by the pipeline itself
+        strength_score: Step 4 score, set when the evidence is ranked
+        categories: Step 4 categories (e.g. 'government'), set when the evidence is ranked
+    """
+    source: str
+    snippet: str = ""
+    title: Optional[str] = None
+    url: Optional[str] = None
+    relevance: Optional[str] = None
+    strength_score: Optional[int] = None
+    categories: Optional[List[str]] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in _EVIDENCE_FIELDS if getattr(self, name) is not None}
+
+    @classmethod
+    def from_json(cls, value: Dict) -> "Evidence":
+        if isinstance(value, cls):
+            return value
+        evidence = cls(**{"source": "", **{name: value[name] for name in _EVIDENCE_FIELDS if value.get(name) is not None}})
+        if not isinstance(evidence.snippet, str): # Content blocks stringified by old checkpoints
+            evidence.snippet = str(evidence.snippet)
+        return evidence
+
+
+_EVIDENCE_FIELDS = [field.name for field in fields(Evidence)]
+
+
+def content_text(content) -> str:
+    """Return the text of an Anthropic message content (a list of content blocks), or content itself if it is text."""
+    if isinstance(content, str):
+        return content
+    return "".join(block.text for block in content if getattr(block, "type", None) == "text")
+
+
+def _encode(obj):
+    if isinstance(obj, (Claim, Evidence)):
+        return obj.to_json()
+    if hasattr(obj, "model_dump"): # SDK objects are pydantic models
+        return obj.model_dump(mode="json", exclude_none=True)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(value: Any, indent: bool = False) -> str:
+    """
+    Encode a value (which may contain Claim, Evidence and SDK objects) as JSON.
+
+    Args:
+        value: Value to encode
+        indent: Pretty-print with two-space indentation, as in the state files
+
+    Returns:
+        str: JSON text
+    """
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATACLASS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(value, default=_encode, option=option).decode("utf-8")
+    return json.dumps(value, default=_encode, indent=2 if indent else None)
+
+
+def loads(text) -> Any:
+    """Decode JSON text (str or bytes). Records come back in their encoded form, see decode_claims and decode_evidence."""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def to_jsonable(value: Any) -> Any:
+    """Return value with records and SDK objects replaced by their encoded form, e.g. for hashing."""
+    return loads(dumps(value))
+
+
+def decode_claims(values: List) -> List[Claim]:
+    """Decode the claims of a step 2 state."""
+    return [Claim.from_json(value) for value in values]
+
+
+def _decode_item(item):
+    if not isinstance(item, dict):
+        return item
+    if "web_evidence" in item or "claim_text" in item: # Evidence bundle of gather_evidence_for_claim
+        return {**item, "web_evidence": [Evidence.from_json(result) for result in item.get("web_evidence") or []]}
+    return Evidence.from_json(item)
+
+
+def decode_evidence(evidence_collection: List) -> List:
+    """
+    Decode the per-claim evidence of a step 3 or step 4 state: lists of evidence items, or
+    dictionaries bundling them under 'web_evidence' (see gather_evidence_for_claim).
+    Other entries (e.g. stringified evidence from old checkpoints) are returned unchanged.
+    """
+    return [
+        [_decode_item(item) for item in claim_evidence] if isinstance(claim_evidence, list) else _decode_item(claim_evidence)
+        for claim_evidence in evidence_collection
+    ]
@@ -0,0 +1,142 @@
+"""
+Persistent cache for web search and scholarly metadata lookups made in step 3.
+
+Results are keyed by provider and normalized query, so reruns and other applicants' claims
+with the same query reuse them. Each provider has its own time to live; for a while after it
+expires, the stale result is still returned at once while a fresh one is fetched in the
+background (stale-while-revalidate). The cache file is capped in size, evicting least
+recently used entries.
+
+Configuration (environment variables):
+    SEARCH_CACHE_PATH       SQLite file (default ../output/.cache/search_results.sqlite)
+    SEARCH_CACHE_MAX_MB     Maximum total size of cached results (default 100)
+    SEARCH_CACHE_BYPASS     If "1", always query the provider (fresh results still refresh the cache)
+
+Every lookup is recorded as a 'search' span (see utils/metrics.py) labelled with its provider.
+Provider calls go through the shared rate limiter of utils/rate_limiter.py.
+"""
+
+import os
+import re
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from utils.disk_cache import DEFAULT_CACHE_DIR, DiskCache, make_key
+from utils.metrics import span
+from utils.rate_limiter import rate_limited
+
+DAY = 24 * 3600
+DEFAULT_TTL_SECONDS = 3 * DAY
+# Seconds a result stays fresh, per provider. Paper metadata changes far less often than web results
+PROVIDER_TTL_SECONDS = {
+    "perplexity": 3 * DAY,
+    "you.com": 3 * DAY,
+    "serp": 3 * DAY,
+    "semantic_scholar": 30 * DAY,
+}
+STALE_WHILE_REVALIDATE_SECONDS = 7 * DAY # How long past its TTL a result may still be served while refreshing
+
+_cache = None
+_cache_lock = threading.Lock()
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def get_search_cache() -> DiskCache:
+    """Return the process-wide search result cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(
+                os.getenv("SEARCH_CACHE_PATH", os.path.join(DEFAULT_CACHE_DIR, "search_results.sqlite")),
+                max_bytes=int(float(os.getenv("SEARCH_CACHE_MAX_MB", "100")) * 1024 * 1024),
+                max_age_seconds=max(PROVIDER_TTL_SECONDS.values()) + STALE_WHILE_REVALIDATE_SECONDS,
+            )
+        return _cache
+
+
+def search_cache_bypassed() -> bool:
+    """Whether the SEARCH_CACHE_BYPASS flag is set."""
+    return os.getenv("SEARCH_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and collapse whitespace and surrounding punctuation, so trivially different queries share an entry."""
+    return re.sub(r"\s+", " ", query.lower()).strip(" .,;:!?\"'")
+
+
+def search_cache_key(provider: str, query: str) -> str:
+    """Return the cache key of a provider's results for a query."""
+    return make_key("search", provider, normalize_query(query))
+
+
+def _store(key: str, value: Any) -> int:
+    return get_search_cache().set(key, {"fetched_at": time.time(), "value": value})
+
+
+def _refresh_in_background(key: str, fetch: Callable[[], Any]) -> None:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            _store(key, fetch())
+        except Exception as e:
+            print(f"Search cache refresh failed: {str(e)}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def cached_search(provider: str, query: str, fetch: Callable[[], Any], bypass: Optional[bool] = None) -> Any:
+    """
+    Return a provider's results for a query from the cache, calling fetch on a miss.
+
+    Args:
+        provider: Provider name, selects the TTL in PROVIDER_TTL_SECONDS
+        query: Query the results answer
+        fetch: Function returning fresh JSON-serializable results. Exceptions propagate and
+            nothing is cached
+        bypass: Skip the cache lookup (defaults to the SEARCH_CACHE_BYPASS flag). The fresh
+            results are still stored
+
+    Returns:
+        The cached or freshly fetched results
+    """
+    key = search_cache_key(provider, query)
+
+    def fetch_limited():
+        with rate_limited(provider):
+            return fetch()
+
+    if bypass is None:
+        bypass = search_cache_bypassed()
+
+    with span("search", provider=provider) as lookup:
+        if not bypass:
+            entry = get_search_cache().get(key)
+            if entry is not None:
+                age = time.time() - entry["fetched_at"]
+                ttl = PROVIDER_TTL_SECONDS.get(provider, DEFAULT_TTL_SECONDS)
+                if age <= ttl:
+                    lookup.cache_hit = True
+                    return entry["value"]
+                if age <= ttl + STALE_WHILE_REVALIDATE_SECONDS:
+                    _refresh_in_background(key, fetch_limited)
+                    lookup.cache_hit = True
+                    return entry["value"]
+
+        lookup.cache_hit = False
+        value = fetch_limited()
+        lookup.bytes = _store(key, value)
+        return value
+
+
+def search_cache_stats() -> Dict[str, int]:
+    """Return hit/miss counters of the search cache for this process."""
+    return get_search_cache().stats()
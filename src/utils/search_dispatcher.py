@@ -0,0 +1,180 @@
+"""
+Concurrent web search across several providers.
+
+Every configured provider is queried in parallel, each with its own deadline. A provider
+that keeps failing is skipped for a while (circuit breaker), and a search can return as soon
+as enough distinct, high-scoring results have arrived, so per-claim search latency is that of
+the fastest sufficient provider rather than the sum of all of them.
+
+Configuration (environment variables):
+    SEARCH_MAX_WORKERS              Threads shared by all searches (default 16)
+    SEARCH_BREAKER_FAILURES         Consecutive failures before a provider is skipped (default 3)
+    SEARCH_BREAKER_RESET_SECONDS    Seconds a failing provider is skipped before a retry (default 60)
+"""
+
+import os
+import time
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from utils.metrics import propagate, record_http_attempt
+from utils.rate_limiter import record_http_response
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_MAX_WORKERS", "16")))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def get_session() -> requests.Session:
+    """Return this thread's HTTP session, so provider calls reuse keep-alive connections."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+        session.hooks["response"].extend([record_http_attempt, record_http_response])
+    return session
+
+
+class CircuitBreaker:
+    """
+    Skips a provider after failure_threshold consecutive failures. Once reset_seconds have
+    passed, one trial call is let through: success closes the breaker, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: Optional[int] = None, reset_seconds: Optional[float] = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("SEARCH_BREAKER_FAILURES", "3"))
+        self.reset_seconds = reset_seconds if reset_seconds is not None else float(os.getenv("SEARCH_BREAKER_RESET_SECONDS", "60"))
+        self._failures = 0
+        self._open_until = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._failures < self.failure_threshold:
+                return True
+            if time.monotonic() < self._open_until or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self._trial_running = False
+            if success:
+                self._failures = 0
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open_until = time.monotonic() + self.reset_seconds
+
+
+@dataclass
+class SearchProvider:
+    """
+    A web search backend.
+
+    Attributes:
+        name: Provider name, used in log messages
+        search: Function from (query, timeout in seconds) to a list of result dicts with
+            'source', 'title', 'snippet' and 'url'. Raises on failure
+        timeout: Deadline in seconds for one search
+    """
+    name: str
+    search: Callable[[str, float], List[Dict]]
+    timeout: float = 10.0
+
+    def __post_init__(self):
+        self.breaker = CircuitBreaker()
+
+
+class SearchDispatcher:
+    """
+    Queries all providers in parallel and merges their results.
+
+    Args:
+        providers: Providers to query
+        score: Function from a list of results to their scores, used for early termination
+        key: Function from a result to the key that makes it distinct (e.g. normalized URL)
+        target_results: Stop once this many distinct results scoring at least min_score have
+            arrived. None waits for every provider
+        min_score: Score a result needs to count towards target_results
+    """
+
+    def __init__(self, providers: List[SearchProvider],
+                 score: Optional[Callable[[List[Dict]], List[int]]] = None,
+                 key: Optional[Callable[[Dict], Optional[str]]] = None,
+                 target_results: Optional[int] = None, min_score: int = 0):
+        self.providers = providers
+        self.score = score
+        self.key = key or (lambda result: result.get("url"))
+        self.target_results = target_results
+        self.min_score = min_score
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        Search all available providers for a query.
+
+        Args:
+            query: Search query
+
+        Returns:
+            Distinct results in provider order, from the providers that answered in time
+        """
+        executor = _get_executor()
+        start = time.monotonic()
+        pending = {}
+        for provider in self.providers:
+            if not provider.breaker.allow():
+                print(f"Search provider {provider.name} skipped: too many recent failures")
+                continue
+            future = executor.submit(propagate(provider.search), query, provider.timeout)
+            future.add_done_callback(lambda f, p=provider: p.breaker.record(f.exception() is None))
+            pending[future] = (provider, start + provider.timeout)
+
+        results_by_provider = {}
+        seen = set()
+        strong = 0
+        while pending:
+            now = time.monotonic()
+            for future, (provider, deadline) in list(pending.items()):
+                if not future.done() and now >= deadline:
+                    print(f"Search provider {provider.name} timed out after {provider.timeout}s")
+                    del pending[future]
+            if not pending:
+                break
+            next_deadline = min(deadline for _, deadline in pending.values())
+            done, _ = wait(pending, timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                provider, _ = pending.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"Search provider {provider.name} error: {str(e)}")
+                    continue
+                distinct = []
+                for result in results:
+                    key = self.key(result)
+                    if key is None or key not in seen:
+                        seen.add(key)
+                        distinct.append(result)
+                results_by_provider[provider.name] = distinct
+                if self.score is not None and distinct:
+                    strong += sum(1 for score in self.score(distinct) if score >= self.min_score)
+            if self.target_results is not None and strong >= self.target_results:
+                break # Providers still running finish in the background; their results are dropped
+
+        return [result for provider in self.providers for result in results_by_provider.get(provider.name, [])]
@@ -0,0 +1,290 @@
+"""
+Storage of the pipeline step states of every processed statement.
+
+States are kept in one SQLite database by default: each step's state is written in a single
+transaction (WAL mode, so concurrent batch workers never see or leave half-written states),
+and the claims and evidence in them are indexed by document, step, claim type and source, so
+questions across applicants ("which claims have no evidence left after step 4", "which
+claims cite DOI X") are indexed queries instead of opening every state file.
+The per-step JSON files of earlier versions are still read (and imported) when a state is
+not in the database, and can be exported again for debugging.
+
+Configuration (environment variables):
+    STATE_BACKEND       "sqlite" (default) or "json" for one stepN_*_state.json file per step
+    STATE_DB_PATH       SQLite file (default ../output/states.sqlite)
+    STATE_EXPORT_JSON   If "1", the SQLite backend also writes every state as a JSON file
+
+Usage (from src/):
+    python -m utils.state_store missing-evidence [--step step4_validate]
+    python -m utils.state_store citing 10.1000/xyz
+    python -m utils.state_store export ../output/<name>
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from utils.disk_cache import SqliteConnections
+from utils.schema import dumps, loads
+
+DEFAULT_DB_PATH = "../output/states.sqlite"
+EVIDENCE_KEYS = ("evidence", "validated_evidence") # State keys holding per-claim evidence
+
+
+def document_name(output_dir: str) -> str:
+    """Return the document a statement's output directory belongs to, e.g. ../output/name -> name."""
+    return os.path.basename(os.path.normpath(output_dir))
+
+
+def state_file_path(output_dir: str, step_name: str) -> str:
+    """Return the path of a step's JSON state file."""
+    return os.path.join(output_dir, f"{step_name}_state.json")
+
+
+def _read_state_file(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def _write_state_file(path: str, state: Dict) -> None:
+    # Written next to the target and renamed, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(dumps(state, indent=True))
+    os.replace(tmp_path, path)
+
+
+class StateStore(ABC):
+    """Interface of the state backends. States are dicts as passed to save_state (checkpoint included)."""
+
+    @abstractmethod
+    def save(self, output_dir: str, step_name: str, state: Dict) -> None:
+        """Save a step's state, replacing any earlier one."""
+
+    @abstractmethod
+    def load(self, output_dir: str, step_name: str) -> Optional[Dict]:
+        """Return a step's saved state, or None if there is none. Raises ValueError on unreadable states."""
+
+    @abstractmethod
+    def export_json(self, output_dir: str) -> List[str]:
+        """Write every state of a document as stepN_*_state.json into output_dir; return the paths written."""
+
+
+class JsonFileStateStore(StateStore):
+    """One JSON file per document and step, in the document's output directory."""
+
+    def save(self, output_dir: str, step_name: str, state: Dict) -> None:
+        _write_state_file(state_file_path(output_dir, step_name), state)
+
+    def load(self, output_dir: str, step_name: str) -> Optional[Dict]:
+        return _read_state_file(state_file_path(output_dir, step_name))
+
+    def export_json(self, output_dir: str) -> List[str]:
+        return sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir) if name.endswith("_state.json"))
+
+
+class SqliteStateStore(StateStore):
+    """
+    All states in a single SQLite file, with claims and evidence indexed for queries across documents.
+    Safe to share between threads (one connection per thread) and processes (WAL mode).
+    """
+
+    def __init__(self, path: str, export_json: bool = False):
+        """
+        Args:
+            path: Path of the SQLite file, created if missing
+            export_json: Also write every saved state as a JSON file, for debugging
+        """
+        self.path = path
+        self.mirror_json = export_json
+        self._db = SqliteConnections(path)
+        with self._db.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS states (
+                    document TEXT NOT NULL,
+                    step TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (document, step)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_states_step ON states (step)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS claims (
+                    document TEXT NOT NULL,
+                    step TEXT NOT NULL,
+                    claim_index INTEGER NOT NULL,
+                    claim_type TEXT,
+                    text TEXT,
+                    PRIMARY KEY (document, step, claim_index)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_claims_claim_type ON claims (claim_type)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS evidence (
+                    document TEXT NOT NULL,
+                    step TEXT NOT NULL,
+                    claim_index INTEGER NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    source TEXT,
+                    title TEXT,
+                    url TEXT,
+                    snippet TEXT,
+                    strength_score INTEGER,
+                    PRIMARY KEY (document, step, claim_index, item_index)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_evidence_source ON evidence (source)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_evidence_step ON evidence (step)")
+
+    def save(self, output_dir: str, step_name: str, state: Dict) -> None:
+        document = document_name(output_dir)
+        payload = dumps(state)
+        plain = loads(payload) # Records in their encoded form, for the index rows
+        claim_rows = [
+            (document, step_name, i, claim[0], claim[1])
+            for i, claim in enumerate(plain.get("claims") or []) if isinstance(claim, list) and len(claim) >= 2
+        ]
+        evidence_rows = [
+            (document, step_name, i, j, item.get("source"), item.get("title"), item.get("url"),
+             item.get("snippet") if isinstance(item.get("snippet"), str) else None, item.get("strength_score"))
+            for key in EVIDENCE_KEYS
+            for i, claim_evidence in enumerate(plain.get(key) or [])
+            for j, item in enumerate(claim_evidence if isinstance(claim_evidence, list) else [claim_evidence])
+            if isinstance(item, dict)
+        ]
+
+        # One transaction per step: the state and its index rows change together or not at all
+        with self._db.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO states (document, step, state, updated_at) VALUES (?, ?, ?, ?)",
+                (document, step_name, payload, time.time())
+            )
+            conn.execute("DELETE FROM claims WHERE document = ? AND step = ?", (document, step_name))
+            conn.execute("DELETE FROM evidence WHERE document = ? AND step = ?", (document, step_name))
+            conn.executemany("INSERT INTO claims VALUES (?, ?, ?, ?, ?)", claim_rows)
+            conn.executemany("INSERT INTO evidence VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", evidence_rows)
+
+        if self.mirror_json:
+            _write_state_file(state_file_path(output_dir, step_name), plain)
+
+    def load(self, output_dir: str, step_name: str) -> Optional[Dict]:
+        row = self._db.connect().execute(
+            "SELECT state FROM states WHERE document = ? AND step = ?", (document_name(output_dir), step_name)
+        ).fetchone()
+        if row is not None:
+            return loads(row[0])
+        # States saved as JSON files by earlier versions are imported on first use
+        state = _read_state_file(state_file_path(output_dir, step_name))
+        if state is not None:
+            self.save(output_dir, step_name, state)
+        return state
+
+    def export_json(self, output_dir: str) -> List[str]:
+        rows = self._db.connect().execute(
+            "SELECT step, state FROM states WHERE document = ? ORDER BY step", (document_name(output_dir),)
+        ).fetchall()
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for step_name, payload in rows:
+            paths.append(state_file_path(output_dir, step_name))
+            _write_state_file(paths[-1], loads(payload))
+        return paths
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Run a read-only SQL query over the states, claims and evidence tables."""
+        return self._db.connect().execute(sql, params).fetchall()
+
+    def claims_without_evidence(self, step_name: str = "step4_validate") -> List[Dict]:
+        """
+        Return the claims that have no evidence in a step's state, across all documents.
+
+        Args:
+            step_name: Step whose evidence counts, e.g. "step3_evidence" or "step4_validate"
+
+        Returns:
+            List of {'document', 'claim_index', 'claim_type', 'text'} dicts
+        """
+        rows = self.query("""
+            SELECT c.document, c.claim_index, c.claim_type, c.text
+            FROM claims c JOIN states s ON s.document = c.document AND s.step = ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM evidence e WHERE e.step = ? AND e.document = c.document AND e.claim_index = c.claim_index
+            )
+            ORDER BY c.document, c.claim_index
+        """, (step_name, step_name))
+        return [dict(zip(("document", "claim_index", "claim_type", "text"), row)) for row in rows]
+
+    def claims_citing(self, reference: str) -> List[Dict]:
+        """
+        Return the claims that mention a reference (e.g. a DOI) in their text or evidence, across all documents.
+
+        Returns:
+            List of {'document', 'claim_index', 'claim_type', 'text'} dicts
+        """
+        # instr() rather than LIKE, where '_' and '%' (common in DOIs and URLs) would be wildcards
+        reference = reference.lower()
+        rows = self.query("""
+            SELECT DISTINCT c.document, c.claim_index, c.claim_type, c.text FROM claims c
+            WHERE instr(lower(c.text), ?) > 0 OR EXISTS (
+                SELECT 1 FROM evidence e WHERE e.document = c.document AND e.claim_index = c.claim_index
+                AND (instr(lower(e.url), ?) > 0 OR instr(lower(e.snippet), ?) > 0)
+            )
+            ORDER BY c.document, c.claim_index
+        """, (reference, reference, reference))
+        return [dict(zip(("document", "claim_index", "claim_type", "text"), row)) for row in rows]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Return the process-wide state store selected by STATE_BACKEND, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.getenv("STATE_BACKEND", "sqlite").lower()
+            if backend == "json":
+                _store = JsonFileStateStore()
+            elif backend == "sqlite":
+                _store = SqliteStateStore(
+                    os.getenv("STATE_DB_PATH", DEFAULT_DB_PATH),
+                    export_json=os.getenv("STATE_EXPORT_JSON", "").lower() in ("1", "true", "yes"),
+                )
+            else:
+                raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the SQLite state store across all processed statements.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    missing = commands.add_parser("missing-evidence", help="List claims without evidence after a step")
+    missing.add_argument("--step", default="step4_validate", help="Step whose evidence counts")
+    citing = commands.add_parser("citing", help="List claims whose text or evidence mentions a reference, e.g. a DOI")
+    citing.add_argument("reference")
+    export = commands.add_parser("export", help="Write a statement's states as stepN_*_state.json files")
+    export.add_argument("output_dir", help="Output directory of the statement, e.g. ../output/anonymized-2")
+    args = parser.parse_args()
+
+    store = get_state_store()
+    if not isinstance(store, SqliteStateStore):
+        sys.exit("The state store CLI needs STATE_BACKEND=sqlite")
+    if args.command == "export":
+        for path in store.export_json(args.output_dir):
+            print(path)
+        return
+    claims = store.claims_without_evidence(args.step) if args.command == "missing-evidence" else store.claims_citing(args.reference)
+    for claim in claims:
+        print(f"{claim['document']}\t#{claim['claim_index']}\t{claim['claim_type']}\t{claim['text']}")
+
+
+if __name__ == "__main__":
+    main()
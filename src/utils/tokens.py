@@ -0,0 +1,40 @@
+"""
+Token estimates and token-budget packing, for sizing LLM requests before they are sent
+(batched priority analyses in step 3, report groups in step 5).
+"""
+
+from typing import List
+
+CHARS_PER_TOKEN = 4 # Rough English average
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens of a text, at ~4 characters per token. Only meant for sizing requests."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_by_token_budget(texts: List[str], token_budget: int, max_items: int) -> List[List[int]]:
+    """
+    Group texts, in order, into batches whose combined estimated tokens fit a budget.
+    A text larger than the budget gets a batch of its own.
+
+    Args:
+        texts: Texts to pack, e.g. claim texts
+        token_budget: Maximum estimated tokens per batch
+        max_items: Maximum number of texts per batch, e.g. bounding the response length
+
+    Returns:
+        List of batches, each a list of indices into texts
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches